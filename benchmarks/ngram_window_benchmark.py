@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 12 11:05:47 2026
+
+@author: Manuel Camargo
+
+Micro-benchmark of the n-gram sliding used by the predictors, the
+np.append/np.delete approach against the preallocated NgramWindow.
+Run it from the repository root:
+    python -m benchmarks.ngram_window_benchmark -s 10000 -r 1 -n 15
+"""
+import sys
+import time
+import getopt
+import tracemalloc
+
+import numpy as np
+
+from model_prediction import ngram_window as nw
+
+
+class AppendDeleteSlider():
+    """Sliding as done before by the predictors"""
+
+    def __init__(self, rows, n_size, num_feat):
+        self.x_ac_ngram = np.zeros((rows, n_size), dtype=np.float32)
+        self.x_t_ngram = np.zeros((rows, n_size, num_feat), dtype=np.float32)
+        self.pos = np.ones((rows, 1), dtype=np.float32)
+        self.times = np.ones((rows, 1, num_feat), dtype=np.float32)
+
+    def step(self):
+        self.x_ac_ngram = np.append(self.x_ac_ngram, self.pos, axis=1)
+        self.x_ac_ngram = np.delete(self.x_ac_ngram, 0, 1)
+        self.x_t_ngram = np.append(self.x_t_ngram, self.times, axis=1)
+        self.x_t_ngram = np.delete(self.x_t_ngram, 0, 1)
+        return [self.x_ac_ngram, self.x_t_ngram]
+
+
+class WindowSlider():
+    """Sliding with the preallocated NgramWindow"""
+
+    def __init__(self, rows, n_size, num_feat):
+        self.x_ac_ngram = nw.NgramWindow(rows, n_size)
+        self.x_t_ngram = nw.NgramWindow(rows, n_size, num_feat)
+        self.pos = np.ones(rows, dtype=np.float32)
+        self.times = np.ones((rows, num_feat), dtype=np.float32)
+
+    def step(self):
+        self.x_ac_ngram.push(self.pos)
+        self.x_t_ngram.push(self.times)
+        return [self.x_ac_ngram.window(), self.x_t_ngram.window()]
+
+
+def measure(slider, steps):
+    """Measures a slider on a trace of the given length.
+    Returns:
+        tuple: microseconds per step and bytes allocated per step.
+    """
+    start = time.perf_counter()
+    for _ in range(steps):
+        slider.step()
+    elapsed = (time.perf_counter() - start) / steps
+    # Transient allocations of a step, averaged over some steps
+    samples = min(steps, 100)
+    allocated = 0
+    tracemalloc.start()
+    for _ in range(samples):
+        tracemalloc.reset_peak()
+        current, _ = tracemalloc.get_traced_memory()
+        slider.step()
+        _, peak = tracemalloc.get_traced_memory()
+        allocated += peak - current
+    tracemalloc.stop()
+    return elapsed * 1e6, allocated / samples
+
+
+def main(argv):
+    steps, rows, n_size, num_feat = 10000, 1, 15, 2
+    try:
+        opts, _ = getopt.getopt(argv, "s:r:n:",
+                                ['steps=', 'rows=', 'n_size='])
+        for opt, arg in opts:
+            if opt in ('-s', '--steps'):
+                steps = int(arg)
+            elif opt in ('-r', '--rows'):
+                rows = int(arg)
+            elif opt in ('-n', '--n_size'):
+                n_size = int(arg)
+    except getopt.GetoptError:
+        print('Invalid option')
+        sys.exit(2)
+    print('steps:', steps, 'rows:', rows, 'n_size:', n_size)
+    for name, slider in [('np.append/np.delete', AppendDeleteSlider),
+                         ('NgramWindow', WindowSlider)]:
+        per_step, allocated = measure(
+            slider(rows, n_size, num_feat), steps)
+        print('{:<20} {:>8.2f} us/step {:>10.0f} bytes allocated/step'
+              .format(name, per_step, allocated))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -33,6 +33,23 @@ def main(argv):
         'column_names': column_names,
         'one_timestamp': parameters['one_timestamp'],
         'filter_d_attrib': False}
+    # Arrival chains per chunk in the inter-case log generation, more than
+    # one advances more cases together but changes their timestamps
+    parameters['gen_lanes'] = 1
+    # Batch size of the next event predictions
+    parameters['pred_batch_size'] = 1024
+    # Suffix decoding with the beam_search, top_k and top_p variants
+    parameters['beam_width'] = 5
+    # Beams ranked by score / length**length_penalty, 0 for the raw score
+    parameters['length_penalty'] = 1.0
+    parameters['top_k'] = 5
+    parameters['top_p'] = 0.9
+    # Suffixes returned per prefix, ranked by log-probability
+    parameters['n_best'] = 1
+    # Models kept loaded by every prediction worker
+    parameters['max_models'] = 2
+    # Single step generation with the recurrent states: None, exact, approx
+    parameters['step_mode'] = None
     # Parameters settled manually or catched by console for batch operations
     if not argv:
         # predict_next, pred_sfx
@@ -41,6 +58,7 @@ def main(argv):
         parameters['model_file'] = 'PurchasingExample.h5'
         parameters['is_single_exec'] = False  # single or batch execution
         # variants and repetitions to be tested Random Choice, Arg Max
+        # suffixes: arg_max, random_choice, beam_search, top_k, top_p
         parameters['variant'] = 'Random Choice'
         parameters['rep'] = 5
     else:
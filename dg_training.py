@@ -17,7 +17,7 @@ from model_training import model_trainer as tr
 def catch_parameter(opt):
     """Change the captured parameters names"""
     switch = {'-h': 'help', '-f': 'file_name', '-m': 'model_family',
-              '-e': 'max_eval', '-o': 'opt_method'}
+              '-e': 'max_eval', '-o': 'opt_method', '-r': 'resume'}
     return switch.get(opt)
 
 def main(argv):
@@ -38,12 +38,15 @@ def main(argv):
         parameters['model_family'] = 'gru_cx'
         parameters['opt_method'] = 'rand_hpc' # 'rand_hpc', 'bayesian'
         parameters['max_eval'] = 1
+        # Folder of an interrupted run to resume, trained with the same
+        # options, e.g. os.path.join('output_files', '<folder_id>')
+        parameters['resume'] = None
     else:
         # Catch parms by console
         try:
-            opts, _ = getopt.getopt(argv, "h:f:m:e:o:", 
+            opts, _ = getopt.getopt(argv, "h:f:m:e:o:r:", 
                                     ['file_name=', 'model_family=',
-                                     'max_eval=', 'opt_method='])
+                                     'max_eval=', 'opt_method=', 'resume='])
             for opt, arg in opts:
                 key = catch_parameter(opt)
                 if key in ['max_eval']:
@@ -60,6 +63,38 @@ def main(argv):
     parameters['imp'] = 1
     parameters['batch_size'] = 32 # Usually 32/64/128/256
     parameters['epochs'] = 200
+    # Embeddings of activities and roles, trained 'dot_product' network or
+    # closed form factorization of the co-occurrences 'svd', 'ppmi'
+    parameters['emb_method'] = 'dot_product'
+    # Export also the matrices as ac_*.emb / rl_*.emb CSV files
+    parameters['emb_csv'] = False
+    # Train from memory-mapped files instead of in memory tensors (large logs)
+    parameters['tensor_store'] = False
+    # Integer targets and sparse categorical loss instead of one-hot targets
+    parameters['sparse_labels'] = False
+    # Create the n-grams lazily in a tf.data pipeline (bounded memory)
+    parameters['tf_data'] = False
+    parameters['shuffle_buffer'] = 10000
+    # Preprocessing cache shared by trials, runs and slurm workers, e.g.
+    # os.path.join(os.getcwd(), 'output_files', 'preprocessing_cache'),
+    # None to disable it
+    parameters['cache_folder'] = None
+    parameters['cache_size'] = 20 * 1024**3 # bytes
+    # Backend of the random search, 'slurm' cluster or 'local' processes
+    parameters['hpc_backend'] = 'slurm'
+    parameters['local_workers'] = 4 # Trials run concurrently in local
+    # Trials run concurrently by the bayesian optimizer, 1 is sequential
+    parameters['opt_workers'] = 1
+    # Successive halving of the trials, rungs at min_epochs * eta**k epochs
+    parameters['halving'] = False
+    parameters['halving_min_epochs'] = 5
+    parameters['halving_eta'] = 3
+    # Checkpoint (.h5) of a previous model of the log that initializes the
+    # trials, e.g. the model of the last retrain on an older snapshot
+    parameters['warm_start'] = None
+    # Initialize the trials from the best finished trial of the run with
+    # the same model type and n-gram size
+    parameters['warm_start_trials'] = False
     parameters['n_size'] = [5, 10, 15]
     parameters['l_size'] = [50, 100] 
     parameters['lstm_act'] = ['selu', 'tanh']
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 17:02:31 2026
+
+@author: Manuel Camargo
+"""
+import os
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
+import sys
+import getopt
+
+from model_training import model_updater as up
+
+# =============================================================================
+# Main function
+# =============================================================================
+def catch_parameter(opt):
+    """Change the captured parameters names"""
+    switch = {'-h': 'help', '-f': 'file_name', '-c': 'folder',
+              '-b': 'model_file', '-s': 'update_steps'}
+    return switch.get(opt)
+
+
+def main(argv):
+    parameters = dict()
+    column_names = {'Case ID': 'caseid',
+                    'Activity': 'task',
+                    'lifecycle:transition': 'event_type',
+                    'Resource': 'user'}
+    parameters['one_timestamp'] = False  # Only one timestamp in the log
+    parameters['read_options'] = {
+        'timeformat': '%Y-%m-%dT%H:%M:%S.%f',
+        'column_names': column_names,
+        'one_timestamp': parameters['one_timestamp']}
+    parameters['batch_size'] = 32 # Usually 32/64/128/256
+    # Parameters settled manually or catched by console for batch operations
+    if not argv:
+        # Event-log with the new completed cases
+        parameters['file_name'] = 'PurchasingExample_new.xes'
+        parameters['folder'] = '20210208_B4CE2405_3D73_45DB_8FED_4DE075C17D51'
+        parameters['model_file'] = 'PurchasingExample.h5'
+        # Maximum number of training steps of the update
+        parameters['update_steps'] = 500
+    else:
+        # Catch parms by console
+        try:
+            opts, _ = getopt.getopt(argv, "h:f:c:b:s:",
+                                    ['file_name=', 'folder=',
+                                     'model_file=', 'update_steps='])
+            for opt, arg in opts:
+                key = catch_parameter(opt)
+                if key in ['update_steps']:
+                    parameters[key] = int(arg)
+                else:
+                    parameters[key] = arg
+        except getopt.GetoptError:
+            print('Invalid option')
+            sys.exit(2)
+        parameters.setdefault('update_steps', 500)
+    # Update model
+    up.ModelUpdater(parameters)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -12,10 +12,11 @@ import traceback
 import itertools
 
 import multiprocessing
-from multiprocessing import Pool
-from tensorflow.keras.models import load_model
 import keras.utils as ku
 
+from model_prediction import ngram_window as nw
+from model_prediction import model_registry as mr
+
 from datetime import timedelta
 
 class EventLogPredictor():
@@ -62,103 +63,166 @@ class EventLogPredictor():
                  for num in range(0, parms['num_cases'])]
         b_size = math.ceil(len(cases)/(cpu_count*2))
         chunks = [cases[x:x+b_size] for x in range(0, len(cases), b_size)]
-        reps = len(chunks)
-        pool = Pool(processes=cpu_count)
+        # Every chunk is a chain of cases, each one starting at the last
+        # start timestamp of the previous one. The chains can be split in
+        # gen_lanes independent chains, which changes the timestamps
+        lanes = list()
+        for chunk in chunks:
+            l_size = math.ceil(len(chunk)/parms.get('gen_lanes', 1))
+            lanes.extend([chunk[x:x+l_size]
+                          for x in range(0, len(chunk), l_size)])
+        # The chains of a worker are generated together
+        g_size = math.ceil(len(lanes)/cpu_count)
+        groups = [lanes[x:x+g_size] for x in range(0, len(lanes), g_size)]
+        reps = len(groups)
+        # The workers and their loaded model are reused by the repetitions
+        pool = mr.worker_pool(cpu_count, self.model_path,
+                              parms.get('max_models', 2),
+                              parms.get('step_mode'))
         # Generate
-        args = [(cases, self.params, self.model_path, self.vectorizer)
-                for cases in chunks]
+        args = [(lanes, self.params, self.model_path, self.vectorizer)
+                for lanes in groups]
         p = pool.map_async(self._generate_inter_batch, args)
         pbar_async(p, 'generating traces:')
-        pool.close()
         # Save results
         event_log = list(itertools.chain(*p.get()))
         return event_log
 
     @staticmethod
     def _generate_inter_batch(args):
-        def gen(cases, parms, model_path, vectorizer):
+        def gen(lanes, parms, model_path, vectorizer):
+            """Generates the traces of a group of lanes in lockstep.
+            Every lane is a chain of cases where each case starts at the
+            last start timestamp of the previous one. All the active lanes
+            are advanced together as one batch, a lane is refilled with its
+            next case when the current one emits the end activity or
+            reaches the max_trace_size.
+            Args:
+                lanes (list): cases ids of every lane.
+                parms (dict): generation parameters.
+                model_path (str): path to the keras model.
+                vectorizer (str): model vectorizer.
+            Returns:
+                list: generated events of the lanes.
+            """
+            def start_case(row):
+                """Resets the lane state and starts its next case.
+                Returns False if the lane has no cases left."""
+                while lane_pos[row] < len(lanes[row]):
+                    x_ac_ngram.reset(row)
+                    x_rl_ngram.reset(row)
+                    x_t_ngram.reset(row)
+                    x_inter_ngram.reset(row)
+                    if step_mode:
+                        model.reset(row)
+                    pos[row], pos1[row] = 0, 0
+                    pre_times[row] = 0
+                    steps[row] = 1
+                    cid = lanes[row][lane_pos[row]]
+                    lane_pos[row] += 1
+                    traces[cid] = [dict(caseid=cid,
+                                        task=parms['index_ac'][0],
+                                        role=parms['index_rl'][0],
+                                        start_timestamp=s_timestamps[row],
+                                        end_timestamp=s_timestamps[row])]
+                    current[row] = cid
+                    if steps[row] < parms['max_trace_size']:
+                        return True
+                return False
+
             try:
-                s_timestamp = parms['start_time']
-                model = load_model(model_path)
-                new_batch = list()
-                for cid in cases:
-                    x_trace = list()
-                    x_ac_ngram = np.zeros((1, parms['n_size']), 
-                                          dtype=np.float32)
-                    x_rl_ngram = np.zeros((1, parms['n_size']), 
-                                          dtype=np.float32)
-                    x_t_ngram = np.zeros((1, parms['n_size'], 2), 
-                                         dtype=np.float32)
-                    num_feat = len(parms['additional_columns']) 
-                    num_feat += (6 if 'weekday' in 
-                                 parms['additional_columns'] else 0)
-                    x_inter_ngram = np.zeros((1, parms['n_size'], num_feat), 
-                                             dtype=np.float32)
-                    pos, pos1 = 0, 0
-                    pre_times = [[0.0, 0.0]]
-                    x_trace = [dict(caseid=cid,
-                                    task=parms['index_ac'][pos],
-                                    role=parms['index_rl'][pos1],
-                                    start_timestamp=s_timestamp,
-                                    end_timestamp=s_timestamp)]
-                    i = 1
-                    while i < parms['max_trace_size']:
-                        daytime = s_timestamp.time()
-                        daytime = (
-                            daytime.second + daytime.minute*60 + daytime.hour*3600)
-                        daytime = daytime / 86400
-                        day_dummies = ku.to_categorical(s_timestamp.weekday(), 
-                                                        num_classes=7)
-                        record =  [daytime] + list(day_dummies)
-                        x_inter_ngram = np.append(x_inter_ngram, [[record]], 
-                                                  axis=1)
-                        x_inter_ngram = np.delete(x_inter_ngram, 0, 1)
-                        x_ac_ngram = np.append(x_ac_ngram, [[pos]], axis=1)
-                        x_ac_ngram = np.delete(x_ac_ngram, 0, 1)
-                        x_rl_ngram = np.append(x_rl_ngram, [[pos1]], axis=1)
-                        x_rl_ngram = np.delete(x_rl_ngram, 0, 1)
-                        x_t_ngram = np.append(x_t_ngram, [pre_times], axis=1)
-                        x_t_ngram = np.delete(x_t_ngram, 0, 1)
-                        inputs = [x_ac_ngram, x_rl_ngram, x_t_ngram, x_inter_ngram]
-                        preds = model.predict(inputs)
-                        if parms['variant'] == 'Random Choice':
-                            # Use this to get a random choice following as PDF
-                            pos = np.random.choice(
-                                np.arange(0, len(preds[0][0])), p=preds[0][0])
-                            pos1 = np.random.choice(
-                                np.arange(0, len(preds[1][0])), p=preds[1][0])
-                        elif parms['variant'] == 'Arg Max':
-                            # Use this to get the max prediction
-                            pos = np.argmax(preds[0][0])
-                            pos1 = np.argmax(preds[1][0])
-                        # Check that the first prediction wont be the end of the trace
-                        if (not x_trace) and (parms['index_ac'][pos] == 'end'):
-                            continue
-                        pred_dur = preds[2][0][0] if preds[2][0][0]>=0 else 0
-                        pred_wait = preds[2][0][1] if preds[2][0][1]>=0 else 0
-                        pre_times = np.array([[pred_dur, pred_wait]])
-                        # rescale durations
-                        dur = EventLogPredictor.rescale(
-                            pred_dur, 
-                            parms['scale_args']['dur'],
-                            parms['norm_method'])
-                        wait = EventLogPredictor.rescale(
-                            pred_wait,
-                            parms['scale_args']['wait'],
-                            parms['norm_method'])
-                        s_timestamp = (x_trace[i-1]['end_timestamp'] +
-                                       timedelta(seconds=wait))
-                        end_time = (s_timestamp + timedelta(seconds=dur))
+                # The step model advances the traces one event at a time
+                step_mode = parms.get('step_mode')
+                model = mr.get_model(model_path, step_mode)
+                n_size = parms['n_size']
+                num_feat = len(parms['additional_columns'])
+                num_feat += (6 if 'weekday' in
+                             parms['additional_columns'] else 0)
+                num_lanes = len(lanes)
+                # Lanes state
+                x_ac_ngram = nw.NgramWindow(num_lanes, n_size)
+                x_rl_ngram = nw.NgramWindow(num_lanes, n_size)
+                x_t_ngram = nw.NgramWindow(num_lanes, n_size, 2)
+                x_inter_ngram = nw.NgramWindow(num_lanes, n_size, num_feat)
+                pos = np.zeros(num_lanes, dtype=int)
+                pos1 = np.zeros(num_lanes, dtype=int)
+                pre_times = np.zeros((num_lanes, 2), dtype=np.float32)
+                steps = np.ones(num_lanes, dtype=int)
+                s_timestamps = [parms['start_time']] * num_lanes
+                lane_pos = [0] * num_lanes
+                current = [None] * num_lanes
+                traces = dict()
+                if step_mode:
+                    model.start(num_lanes)
+                active = [row for row in range(num_lanes) if start_case(row)]
+                while active:
+                    rows = np.array(active)
+                    daytime = np.array(
+                        [(s_timestamps[r].time().second +
+                          s_timestamps[r].time().minute*60 +
+                          s_timestamps[r].time().hour*3600) / 86400
+                         for r in active])
+                    day_dummies = ku.to_categorical(
+                        [s_timestamps[r].weekday() for r in active],
+                        num_classes=7)
+                    records = np.concatenate(
+                        [daytime.reshape(-1, 1), day_dummies], axis=1)
+                    # Slide the n-grams, the exhausted lanes are not read
+                    x_inter_ngram.push(records, rows)
+                    x_ac_ngram.push(pos)
+                    x_rl_ngram.push(pos1)
+                    x_t_ngram.push(pre_times)
+                    sel = None if len(active) == num_lanes else rows
+                    if step_mode:
+                        model.push([pos[rows], pos1[rows], pre_times[rows],
+                                    records], rows)
+                        preds = model.predict(sel)
+                    else:
+                        inputs = [x_ac_ngram.window(sel),
+                                  x_rl_ngram.window(sel),
+                                  x_t_ngram.window(sel),
+                                  x_inter_ngram.window(sel)]
+                        preds = model.predict_on_batch(inputs)
+                    pos[rows] = nw.select_events(
+                        preds[0], parms['variant'])
+                    pos1[rows] = nw.select_events(
+                        preds[1], parms['variant'])
+                    pre_times[rows] = np.maximum(preds[2], 0)
+                    # rescale durations
+                    dur = EventLogPredictor.rescale(
+                        pre_times[rows, 0],
+                        parms['scale_args']['dur'],
+                        parms['norm_method'])
+                    wait = EventLogPredictor.rescale(
+                        pre_times[rows, 1],
+                        parms['scale_args']['wait'],
+                        parms['norm_method'])
+                    next_active = list()
+                    for i, row in enumerate(active):
+                        x_trace = traces[current[row]]
+                        s_timestamps[row] = (
+                            x_trace[-1]['end_timestamp'] +
+                            timedelta(seconds=float(wait[i])))
+                        end_time = (s_timestamps[row] +
+                                    timedelta(seconds=float(dur[i])))
                         x_trace.append(dict(
-                            caseid=cid,
-                            task=parms['index_ac'][pos],
-                            role=parms['index_rl'][pos1],
-                            start_timestamp=s_timestamp,
+                            caseid=current[row],
+                            task=parms['index_ac'][pos[row]],
+                            role=parms['index_rl'][pos1[row]],
+                            start_timestamp=s_timestamps[row],
                             end_timestamp=end_time))
-                        if parms['index_ac'][pos] == 'end':
-                            break
-                        i += 1
-                    new_batch.extend(x_trace)
+                        steps[row] += 1
+                        # Stop if the next prediction is the end of the trace
+                        # otherwise until the defined max_size
+                        if (parms['index_ac'][pos[row]] == 'end' or
+                                steps[row] >= parms['max_trace_size']):
+                            if not start_case(row):
+                                continue
+                        next_active.append(row)
+                    active = next_active
+                new_batch = list()
+                for cid in itertools.chain(*lanes):
+                    new_batch.extend(traces[cid])
                 return new_batch
             except Exception:
                 traceback.print_exc()
@@ -186,13 +250,15 @@ class EventLogPredictor():
         b_size = math.ceil(len(cases)/(cpu_count*2))
         chunks = [cases[x:x+b_size] for x in range(0, len(cases), b_size)]
         reps = len(chunks)
-        pool = Pool(processes=cpu_count)
+        # The workers and their loaded model are reused by the repetitions
+        pool = mr.worker_pool(cpu_count, self.model_path,
+                              parms.get('max_models', 2),
+                              parms.get('step_mode'))
         # Generate
         args = [(cases, parms, 
                  self.model_path, self.vectorizer) for cases in chunks]
         p = pool.map_async(self.generate_trace, args)
         pbar_async(p, 'generating traces:')
-        pool.close()
         # Save results
         event_log = list(itertools.chain(*p.get()))
         return event_log
@@ -255,89 +321,98 @@ class EventLogPredictor():
             return log_trace
         
         def gen(cases, parms, model_path, vectorizer):
-            """Reads the simulation results stats
+            """Generates the traces of a chunk of cases in lockstep.
+            All the active cases are advanced together as one batch, cases
+            leave the batch when they emit the end activity or reach
+            the max_trace_size.
             Args:
-                settings (dict): Path to jar and file names
-                rep (int): repetition number
+                cases (list): cases ids of the chunk.
+                parms (dict): generation parameters.
+                model_path (str): path to the keras model.
+                vectorizer (str): model vectorizer.
+            Returns:
+                list: generated events of the chunk.
             """
             try:
-                model = load_model(model_path)
-                generated_event_log = list()
-                for case in cases:
-                    x_trace = list()
-                    x_ac_ngram = np.zeros(
-                        (1, parms['n_size']), dtype=np.float32)
-                    x_rl_ngram = np.zeros(
-                        (1, parms['n_size']), dtype=np.float32)
+                # The step model advances the traces one event at a time
+                step_mode = parms.get('step_mode')
+                model = mr.get_model(model_path, step_mode)
+                num_cases = len(cases)
+                x_ac_ngram = nw.NgramWindow(num_cases, parms['n_size'])
+                x_rl_ngram = nw.NgramWindow(num_cases, parms['n_size'])
+                if parms['one_timestamp']:
+                    x_t_ngram = nw.NgramWindow(num_cases, parms['n_size'], 1)
+                else:
+                    x_t_ngram = nw.NgramWindow(num_cases, parms['n_size'], 2)
+                if vectorizer in ['inter']:
+                    x_inter_ngram = nw.NgramWindow(
+                        num_cases, parms['n_size'],
+                        len(parms['additional_columns']))
+                x_traces = [list() for _ in cases]
+                if step_mode:
+                    model.start(num_cases)
+                steps = np.ones(num_cases, dtype=int)
+                active = (np.arange(num_cases)
+                          if parms['max_trace_size'] > 1
+                          else np.arange(0))
+                while active.size > 0:
+                    sel = None if active.size == num_cases else active
+                    if step_mode:
+                        predictions = model.predict(sel)
+                    else:
+                        if vectorizer in ['basic']:
+                            inputs = [x_ac_ngram.window(sel),
+                                      x_rl_ngram.window(sel),
+                                      x_t_ngram.window(sel)]
+                        elif vectorizer in ['inter']:
+                            inputs = [x_ac_ngram.window(sel),
+                                      x_rl_ngram.window(sel),
+                                      x_t_ngram.window(sel),
+                                      x_inter_ngram.window(sel)]
+                        predictions = model.predict_on_batch(inputs)
+                    pos = nw.select_events(
+                        predictions[0], parms['variant'])
+                    pos1 = nw.select_events(
+                        predictions[1], parms['variant'])
+                    is_end = np.array(
+                        [parms['index_ac'][x] == 'end' for x in pos],
+                        dtype=bool)
+                    # Check that the first prediction wont be the end of
+                    # the trace, those cases are predicted again
+                    is_empty = np.array([not x_traces[x] for x in active],
+                                        dtype=bool)
+                    keep = ~(is_empty & is_end)
+                    rows = active[keep]
                     if parms['one_timestamp']:
-                        x_t_ngram = np.zeros(
-                            (1, parms['n_size'], 1), dtype=np.float32)
+                        pre_times = predictions[2][keep]
                     else:
-                        x_t_ngram = np.zeros(
-                            (1, parms['n_size'], 2), dtype=np.float32)
-                    if vectorizer in ['basic']:
-                        inputs = [x_ac_ngram, x_rl_ngram, x_t_ngram]
-                    elif vectorizer in ['inter']:
-                        x_inter_ngram = np.zeros(
-                            (1, parms['n_size'], 
-                             len(parms['additional_columns'])),
-                            dtype=np.float32)
-                        inputs = [x_ac_ngram, x_rl_ngram, 
-                                  x_t_ngram, x_inter_ngram]
-                    i = 1
-                    while i < parms['max_trace_size']:
-                        predictions = model.predict(inputs)
-                        if parms['variant'] == 'Random Choice':
-                            # Use this to get a random choice following as PDF
-                            pos = np.random.choice(
-                                np.arange(0, len(predictions[0][0])),
-                                p=predictions[0][0])
-                            pos1 = np.random.choice(
-                                np.arange(0, len(predictions[1][0])),
-                                p=predictions[1][0])
-                        elif parms['variant'] == 'Arg Max':
-                            # Use this to get the max prediction
-                            pos = np.argmax(predictions[0][0])
-                            pos1 = np.argmax(predictions[1][0])
-                        # Check that the first prediction wont be the end of the trace
-                        if (not x_trace) and (parms['index_ac'][pos] == 'end'):
-                            continue
-                        else:
-                            if parms['one_timestamp']:
-                                x_trace.append([pos, pos1, predictions[2][0][0]])
-                            else:
-                                pred_dur = (predictions[2][0][0] 
-                                            if predictions[2][0][0]>=0 else 0) 
-                                pred_wait = (predictions[2][0][1] 
-                                            if predictions[2][0][1]>=0 else 0)
-                                x_trace.append([pos, pos1,
-                                                pred_dur,
-                                                pred_wait])
-                                pre_times = np.array([[pred_dur, pred_wait]])
-                            # Add prediction to n_gram
-                            x_ac_ngram = np.append(x_ac_ngram, [[pos]], axis=1)
-                            x_ac_ngram = np.delete(x_ac_ngram, 0, 1)
-                            x_rl_ngram = np.append(x_rl_ngram, [[pos1]], axis=1)
-                            x_rl_ngram = np.delete(x_rl_ngram, 0, 1)
-                            # x_t_ngram = np.append(x_t_ngram, [predictions[2]], 
-                            #                       axis=1)
-                            x_t_ngram = np.append(x_t_ngram, [pre_times], axis=1)
-                            x_t_ngram = np.delete(x_t_ngram, 0, 1)
-                            if vectorizer in ['basic']:
-                                inputs = [x_ac_ngram, x_rl_ngram, x_t_ngram]
-                            elif vectorizer in ['inter']:
-                                x_inter_ngram = np.append(x_inter_ngram, 
-                                                          [predictions[3]], 
-                                                          axis=1)
-                                x_inter_ngram = np.delete(x_inter_ngram, 0, 1)
-                                inputs = [x_ac_ngram, x_rl_ngram, 
-                                          x_t_ngram, x_inter_ngram]
-                            # Stop if the next prediction is the end of the trace
-                            # otherwise until the defined max_size
-                            if parms['index_ac'][pos] == 'end':
-                                break
-                            i += 1
-                    generated_event_log.extend(decode_trace(parms, x_trace, case))
+                        pre_times = np.maximum(predictions[2][keep], 0)
+                    for row, ac, rl, times in zip(
+                            rows, pos[keep], pos1[keep], pre_times):
+                        x_traces[row].append([ac, rl, *times])
+                    # Add prediction to n_gram, the cases predicted again
+                    # keep their empty n-grams
+                    x_ac_ngram.push(pos[keep], rows)
+                    x_rl_ngram.push(pos1[keep], rows)
+                    x_t_ngram.push(pre_times, rows)
+                    if vectorizer in ['inter']:
+                        x_inter_ngram.push(predictions[3][keep], rows)
+                    if step_mode:
+                        model.push([pos[keep], pos1[keep], pre_times]
+                                   + ([predictions[3][keep]]
+                                      if vectorizer in ['inter'] else []),
+                                   rows)
+                    # Stop if the next prediction is the end of the trace
+                    # otherwise until the defined max_size
+                    steps[rows] += 1
+                    done = np.zeros(len(active), dtype=bool)
+                    done[keep] = (is_end[keep] |
+                                  (steps[rows] >= parms['max_trace_size']))
+                    active = active[~done]
+                generated_event_log = list()
+                for case, x_trace in zip(cases, x_traces):
+                    generated_event_log.extend(
+                        decode_trace(parms, x_trace, case))
                 return generated_event_log
             except Exception:
                 traceback.print_exc()
@@ -12,11 +12,13 @@ import pandas as pd
 import numpy as np
 import configparser as cp
 
-import readers.log_reader as lr
 import utils.support as sup
 
 from model_training import features_manager as feat
+from model_training import log_cache as lc
+from model_training import model_updater as up
 from model_prediction import interfaces as it
+from model_prediction import model_registry as mr
 import analyzers.sim_evaluator as ev
 
 
@@ -28,9 +30,11 @@ class ModelPredictor():
     def __init__(self, parms):
         self.output_route = os.path.join('output_files', parms['folder'])
         self.parms = parms
+        # The last update of the model, if any
+        self.model_folder = up.model_folder(self.output_route)
         # load parameters
         self.load_parameters()
-        self.model_name = os.path.join(self.output_route, parms['model_file'])
+        self.model_name = os.path.join(self.model_folder, parms['model_file'])
         self.log = self.load_log_test(self.output_route, self.parms)
 
         self.samples = dict()
@@ -71,6 +75,8 @@ class ModelPredictor():
                                     run_num))
             else:
                 evaluator.evaluate(self.predictions, self.parms)
+        # The workers are kept only between the repetitions
+        mr.close_pool()
         self._export_results(self.output_route)
 
     def predict_values(self, run_num):
@@ -80,16 +86,15 @@ class ModelPredictor():
 
     @staticmethod
     def load_log_test(output_route, parms):
-        df_test = lr.LogReader(
+        df_test = lc.LogCache().read(
             os.path.join(output_route, 'parameters', 'test_log.csv'),
             parms['read_options'])
-        df_test = pd.DataFrame(df_test.data)
         df_test = df_test[~df_test.task.isin(['Start', 'End'])]
         return df_test
 
     def load_parameters(self):
         # Loading of parameters from training
-        path = os.path.join(self.output_route,
+        path = os.path.join(self.model_folder,
                             'parameters',
                             'model_parameters.json')
         with open(path) as file:
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 09:34:50 2026
+
+@author: Manuel Camargo
+"""
+import os
+import atexit
+from collections import OrderedDict
+from multiprocessing import Pool
+
+from tensorflow.keras.models import load_model
+
+from model_prediction import step_model as sm
+
+
+class ModelRegistry():
+    """
+    Models loaded by a process. Every model is deserialized once and
+    reused by the next predictions, when more than max_models are served
+    the least recently used one is evicted. The models are identified by
+    path and modification time, so a model updated in place is loaded
+    again. The step versions of the models are kept as separate entries.
+    """
+
+    def __init__(self, max_models=2):
+        """constructor"""
+        self.max_models = max_models
+        self.models = OrderedDict()
+
+    def get(self, model_path, step_mode=None):
+        """Returns a model, loading it if it is not in the registry.
+        Args:
+            model_path (str): path to the keras model.
+            step_mode (str, optional): 'exact' or 'approx' to get the
+                single step version of the model.
+        Returns:
+            Model: keras model, or StepModel when step_mode is given.
+        """
+        key = (os.path.abspath(model_path), os.path.getmtime(model_path),
+               step_mode)
+        model = self.models.pop(key, None)
+        if model is None:
+            model = load_model(model_path)
+            if step_mode:
+                model = sm.StepModel(model, step_mode)
+            while self.models and len(self.models) >= self.max_models:
+                self.models.popitem(last=False)
+        self.models[key] = model
+        return model
+
+
+# Registry of the process, replaced in the pool workers by their initializer
+_registry = ModelRegistry()
+# Pool of prediction workers shared by the repetitions, and the number
+# of workers, model and step mode it was created for
+_pool = None
+_pool_key = None
+
+
+def get_model(model_path, step_mode=None):
+    return _registry.get(model_path, step_mode)
+
+
+def _init_worker(model_path, max_models, step_mode):
+    global _registry
+    _registry = ModelRegistry(max_models)
+    # The model is loaded once per worker instead of once per chunk
+    _registry.get(model_path, step_mode)
+
+
+def worker_pool(processes, model_path, max_models=2, step_mode=None):
+    """Returns the pool of prediction workers. The pool is kept alive
+    between repetitions, in that way its workers keep their loaded models,
+    and it is rebuilt when it is asked for other model or step mode.
+    Args:
+        processes (int): number of workers.
+        model_path (str): model preloaded by the workers.
+        max_models (int): models kept by every worker.
+        step_mode (str, optional): preload the step version of the model.
+    Returns:
+        Pool: workers pool.
+    """
+    global _pool, _pool_key
+    key = (processes, os.path.abspath(model_path), step_mode)
+    if _pool is None or _pool_key != key:
+        close_pool()
+        _pool = Pool(processes=processes,
+                     initializer=_init_worker,
+                     initargs=(model_path, max_models, step_mode))
+        _pool_key = key
+    return _pool
+
+
+def close_pool():
+    """Closes the pool of prediction workers, if any."""
+    global _pool, _pool_key
+    if _pool is not None:
+        _pool.close()
+        _pool.join()
+        _pool = None
+        _pool_key = None
+
+
+atexit.register(close_pool)
@@ -8,6 +8,9 @@ import numpy as np
 
 import utils.support as sup
 
+from model_prediction import ngram_window as nw
+from model_prediction import model_registry as mr
+
 
 class NextEventPredictor():
 
@@ -17,8 +20,8 @@ class NextEventPredictor():
         self.spl = dict()
         self.imp = 'arg_max'
 
-    def predict(self, params, model, spl, imp, vectorizer):
-        self.model = model
+    def predict(self, params, model_path, spl, imp, vectorizer):
+        self.model = mr.get_model(model_path)
         self.spl = spl
         self.imp = imp
         predictor = self._get_predictor(params['model_type'])
@@ -32,6 +35,8 @@ class NextEventPredictor():
 
     def _predict_next_event_shared_cat(self, parameters, vectorizer):
         """Generate business process suffixes using a keras trained model.
+        All the prefixes are padded and stacked up front, predicted in
+        batches and the next events are selected over the whole output.
         Args:
             model (keras model): keras trained model.
             prefixes (list): list of prefixes.
@@ -39,65 +44,34 @@ class NextEventPredictor():
             rl_index (dict): index of roles.
             imp (str): method of next event selection.
         """
-        # Generation of predictions
+        time_dim = parameters['dim']['time_dim']
+        # Activities and roles input shape(prefixes, time_dim)
+        x_ac_ngram = nw.NgramWindow.pad_prefixes(
+            self.spl['prefixes']['activities'], time_dim)
+        x_rl_ngram = nw.NgramWindow.pad_prefixes(
+            self.spl['prefixes']['roles'], time_dim)
+        # times input shape(prefixes, time_dim, # attributes)
+        x_t_ngram = nw.NgramWindow.pad_prefixes(
+            self.spl['prefixes']['times'], time_dim)
+        # add intercase features if necessary
+        if vectorizer in ['basic']:
+            inputs = [x_ac_ngram, x_rl_ngram, x_t_ngram]
+        elif vectorizer in ['inter']:
+            # intercase input shape(prefixes, time_dim, # attributes)
+            x_inter_ngram = nw.NgramWindow.pad_prefixes(
+                self.spl['prefixes']['inter_attr'], time_dim)
+            inputs = [x_ac_ngram, x_rl_ngram, x_t_ngram, x_inter_ngram]
+        # predict
+        preds = self.model.predict(
+            inputs, batch_size=parameters.get('pred_batch_size', 1024))
+        pos = nw.select_events(preds[0], self.imp)
+        pos1 = nw.select_events(preds[1], self.imp)
+        # save results
         results = list()
-        for i, _ in enumerate(self.spl['prefixes']['activities']):
-            # Activities and roles input shape(1,5)
-            x_ac_ngram = (np.append(
-                    np.zeros(parameters['dim']['time_dim']),
-                    np.array(self.spl['prefixes']['activities'][i]),
-                    axis=0)[-parameters['dim']['time_dim']:]
-                .reshape((1, parameters['dim']['time_dim'])))
-
-            x_rl_ngram = (np.append(
-                    np.zeros(parameters['dim']['time_dim']),
-                    np.array(self.spl['prefixes']['roles'][i]),
-                    axis=0)[-parameters['dim']['time_dim']:]
-                .reshape((1, parameters['dim']['time_dim'])))
-
-            # times input shape(1,5,1)
-            times_attr_num = (self.spl['prefixes']['times'][i].shape[1])
-            x_t_ngram = np.array(
-                [np.append(np.zeros(
-                    (parameters['dim']['time_dim'], times_attr_num)),
-                    self.spl['prefixes']['times'][i], axis=0)
-                    [-parameters['dim']['time_dim']:]
-                    .reshape((parameters['dim']['time_dim'], times_attr_num))]
-                )
-
-            # add intercase features if necessary
-            if vectorizer in ['basic']:
-                inputs = [x_ac_ngram, x_rl_ngram, x_t_ngram]
-            elif vectorizer in ['inter']:
-                # times input shape(1,5,1)
-                inter_attr_num = (self.spl['prefixes']['inter_attr'][i]
-                                  .shape[1])
-                x_inter_ngram = np.array(
-                    [np.append(np.zeros((
-                        parameters['dim']['time_dim'], inter_attr_num)),
-                        self.spl['prefixes']['inter_attr'][i], axis=0)
-                        [-parameters['dim']['time_dim']:]
-                        .reshape(
-                            (parameters['dim']['time_dim'], inter_attr_num))]
-                    )
-                inputs = [x_ac_ngram, x_rl_ngram, x_t_ngram, x_inter_ngram]
-            # predict
-            preds = self.model.predict(inputs)
-            if self.imp == 'random_choice':
-                # Use this to get a random choice following as PDF
-                pos = np.random.choice(np.arange(0, len(preds[0][0])),
-                                       p=preds[0][0])
-                pos1 = np.random.choice(np.arange(0, len(preds[1][0])),
-                                        p=preds[1][0])
-            elif self.imp == 'arg_max':
-                # Use this to get the max prediction
-                pos = np.argmax(preds[0][0])
-                pos1 = np.argmax(preds[1][0])
-
-            # save results
-            predictions = [pos, pos1, preds[2][0][0]]
+        for i in range(len(x_ac_ngram)):
+            predictions = [pos[i], pos1[i], preds[2][i][0]]
             if not parameters['one_timestamp']:
-                predictions.extend([preds[2][0][1]])
+                predictions.extend([preds[2][i][1]])
             results.append(
                 self.create_result_record(i, self.spl, predictions, parameters))
         sup.print_done_task()
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 12 09:41:02 2026
+
+@author: Manuel Camargo
+"""
+import numpy as np
+
+
+class NgramWindow():
+    """
+    Preallocated sliding window of the last n_size events of a batch of
+    traces. The events are stored twice in a buffer of size 2*n_size, in
+    that way the window is always a slice of the buffer and sliding it is
+    an in place write instead of an np.append followed by an np.delete.
+    """
+
+    def __init__(self, rows, n_size, num_feat=None, dtype=np.float32):
+        """constructor"""
+        self.rows = rows
+        self.n_size = n_size
+        feat_shape = (num_feat,) if num_feat is not None else tuple()
+        self.buffer = np.zeros((rows, 2 * n_size, *feat_shape), dtype=dtype)
+        self.cursor = 0
+
+    @classmethod
+    def from_prefixes(cls, prefixes, n_size, dtype=np.float32):
+        """Creates a window initialized with the last n_size elements
+        of every prefix left padded with zeros.
+        Args:
+            prefixes (list): list of prefixes, lists or 2D arrays.
+            n_size (int): n-gram size.
+        Returns:
+            NgramWindow: window of one row per prefix.
+        """
+        ngrams = cls.pad_prefixes(prefixes, n_size, dtype=dtype)
+        window = cls(len(prefixes), n_size,
+                     ngrams.shape[2] if ngrams.ndim > 2 else None,
+                     dtype=dtype)
+        window.buffer[:, :n_size] = ngrams
+        window.buffer[:, n_size:] = ngrams
+        return window
+
+    @staticmethod
+    def pad_prefixes(prefixes, n_size, dtype=np.float32):
+        """Stacks the last n_size elements of every prefix
+        left padded with zeros.
+        Args:
+            prefixes (list): list of prefixes, lists or 2D arrays.
+            n_size (int): n-gram size.
+        Returns:
+            ndarray: array of shape (prefixes, n_size, ...).
+        """
+        feat_shape = np.shape(prefixes[0])[1:]
+        ngrams = np.zeros((len(prefixes), n_size, *feat_shape), dtype=dtype)
+        for i, prefix in enumerate(prefixes):
+            prefix = np.asarray(prefix)[-n_size:]
+            if len(prefix) > 0:
+                ngrams[i, -len(prefix):] = prefix
+        return ngrams
+
+    def window(self, rows=None):
+        """Returns the current n-grams.
+        Args:
+            rows (ndarray, optional): rows to take, all of them by default.
+        Returns:
+            ndarray: view of shape (rows, n_size, ...) over the buffer when
+            all the rows are requested, a copy of the selected rows otherwise.
+        """
+        ngrams = self.buffer[:, self.cursor:self.cursor + self.n_size]
+        return ngrams if rows is None else ngrams[rows]
+
+    def push(self, values, rows=None, fill=0):
+        """Slides the window one event for every row.
+        Args:
+            values (ndarray): new events, one per row or one per element
+                of rows.
+            rows (ndarray, optional): rows receiving values, the rest of the
+                rows receive fill.
+            fill (optional): event pushed to the rows not in rows.
+        """
+        # The oldest event and its copy are overwritten with the new one
+        for pos in (self.cursor, self.cursor + self.n_size):
+            if rows is None:
+                self.buffer[:, pos] = values
+            else:
+                self.buffer[:, pos] = fill
+                self.buffer[rows, pos] = values
+        self.cursor = (self.cursor + 1) % self.n_size
+
+    def reset(self, rows):
+        """Empties the window of the given rows.
+        Args:
+            rows: row or rows to be reset.
+        """
+        self.buffer[rows] = 0
+
+    def take(self, rows):
+        """Replaces the windows by the ones of the given rows, a row can be
+        taken several times, e.g. when the beams of a prefix are expanded.
+        Args:
+            rows (ndarray): source row of every new row.
+        """
+        self.buffer = self.buffer[rows]
+        self.rows = len(rows)
+
+
+def select_events(preds, imp):
+    """Selects the next event of every row of a batch of predictions.
+    Args:
+        preds (ndarray): probabilities of shape (rows, classes).
+        imp (str): selection method, random_choice or arg_max, also
+            named Random Choice and Arg Max by the log generation.
+    Returns:
+        ndarray: selected index per row.
+    """
+    if imp in ['random_choice', 'Random Choice']:
+        # Use this to get a random choice following as PDF the predictions,
+        # inverse transform sampling over the cumulative probabilities
+        cum_probs = np.cumsum(preds, axis=1)
+        draws = (np.random.random_sample((len(preds), 1)) *
+                 cum_probs[:, -1:])
+        selected = np.sum(cum_probs <= draws, axis=1)
+        return np.minimum(selected, preds.shape[1] - 1)
+    elif imp in ['arg_max', 'Arg Max']:
+        # Use this to get the max prediction
+        return np.argmax(preds, axis=1)
+    else:
+        raise ValueError(imp)
@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 11:07:26 2026
+
+@author: Manuel Camargo
+"""
+import numpy as np
+import pandas as pd
+
+from tensorflow.keras.models import Model
+from tensorflow.keras.layers import Input, InputLayer, Embedding, LSTM, GRU
+
+from model_prediction import ngram_window as nw
+
+
+class StepModel():
+    """
+    Single step version of a trained n-gram model. The recurrent layers
+    are rebuilt with the same weights to receive one event and the states
+    of the previous one, so the traces are advanced one event at a time
+    instead of running the whole window through the model every step.
+
+    The windowed model sees the traces left padded with zero events. In
+    'exact' mode every trace keeps one state per number of padding events
+    still possible, and the predictions are the same of the windowed model
+    while the trace fits in the window (up to n_size events). Longer traces
+    go on with the state of the unpadded trace, that is, with the whole
+    trace as context instead of the last n_size events, which is an
+    approximation. In 'approx' mode every trace keeps only one state that
+    starts after n_size - 1 padding events, the cost per event does not
+    depend on n_size and only the first prediction with events is exact.
+    The gap of both modes can be measured with check_exactness.
+    """
+
+    def __init__(self, model, mode='exact'):
+        """constructor
+        Args:
+            model (Model): trained windowed model.
+            mode (str): 'exact' or 'approx'.
+        """
+        if mode not in ['exact', 'approx']:
+            raise ValueError(mode)
+        self.mode = mode
+        self.n_size = model.inputs[0].shape[1]
+        self.model, self.num_outputs = self.build_step_model(model)
+        self.state_shapes = [tuple(x.shape[1:])
+                             for x in self.model.inputs[len(model.inputs):]]
+        self.input_shapes = [tuple(x.shape[2:]) for x in model.inputs]
+        # States after 0..n_size padding events, and the prediction of the
+        # window of only padding events
+        self.pad_states = [[np.zeros((1, *x), dtype=np.float32)
+                            for x in self.state_shapes]]
+        pad = [np.zeros((1, 1, *x), dtype=np.float32)
+               for x in self.input_shapes]
+        for _ in range(self.n_size):
+            preds = self.model.predict_on_batch(pad + self.pad_states[-1])
+            self.pad_outputs = [np.asarray(x) for x in
+                                preds[:self.num_outputs]]
+            self.pad_states.append([np.asarray(x) for x in
+                                    preds[self.num_outputs:]])
+        self.lanes = self.n_size if mode == 'exact' else 1
+        self.start(0)
+
+    @staticmethod
+    def build_step_model(model):
+        """Rebuilds a windowed model to process one event.
+        Args:
+            model (Model): trained windowed model.
+        Returns:
+            tuple: step model, with inputs the events of the model inputs
+            followed by the states of the recurrent layers, and outputs the
+            model outputs followed by the new states; and number of model
+            outputs.
+        """
+        config = model.get_config()
+        tensors = dict()
+        state_inputs, state_outputs = list(), list()
+        for layer_config in config['layers']:
+            layer = model.get_layer(layer_config['name'])
+            inbound = [tensors[x[0]]
+                       for x in (layer_config['inbound_nodes'] or [[]])[0]]
+            inbound = inbound[0] if len(inbound) == 1 else inbound
+            if isinstance(layer, InputLayer):
+                shape = layer_config['config']['batch_input_shape'][2:]
+                tensors[layer.name] = Input(
+                    shape=(1, *shape), name=layer.name,
+                    dtype=layer_config['config']['dtype'])
+            elif isinstance(layer, (LSTM, GRU)):
+                layer_cfg = layer.get_config()
+                layer_cfg['return_state'] = True
+                step_layer = layer.__class__.from_config(layer_cfg)
+                states = [Input(shape=(layer.units,))
+                          for _ in range(2 if isinstance(layer, LSTM) else 1)]
+                output = step_layer(inbound, initial_state=states)
+                step_layer.set_weights(layer.get_weights())
+                tensors[layer.name] = output[0]
+                state_inputs.extend(states)
+                state_outputs.extend(output[1:])
+            elif isinstance(layer, Embedding):
+                layer_cfg = layer.get_config()
+                layer_cfg['input_length'] = 1
+                step_layer = Embedding.from_config(layer_cfg)
+                tensors[layer.name] = step_layer(inbound)
+                step_layer.set_weights(layer.get_weights())
+            else:
+                # Layers without time dimension are shared as they are
+                tensors[layer.name] = layer(inbound)
+        inputs = [tensors[x[0]] for x in config['input_layers']]
+        outputs = [tensors[x[0]] for x in config['output_layers']]
+        step_model = Model(inputs=inputs + state_inputs,
+                           outputs=outputs + state_outputs)
+        return step_model, len(outputs)
+
+    def start(self, rows):
+        """Starts rows traces with only padding events.
+        Args:
+            rows (int): number of traces.
+        """
+        self.steps = np.zeros(rows, dtype=int)
+        self.states = [np.zeros((rows, self.lanes, *x), dtype=np.float32)
+                       for x in self.state_shapes]
+        self.outputs = [np.repeat(x, rows, axis=0) for x in self.pad_outputs]
+        for row in range(rows):
+            self.reset(row)
+
+    def reset(self, row):
+        """Restarts the trace of a row."""
+        self.steps[row] = 0
+        for i, state in enumerate(self.states):
+            if self.mode == 'exact':
+                # Lane k holds the trace after k padding events
+                state[row] = np.concatenate(
+                    [x[i] for x in self.pad_states[:self.lanes]])
+            else:
+                state[row, 0] = self.pad_states[self.n_size - 1][i][0]
+        for output, pad_output in zip(self.outputs, self.pad_outputs):
+            output[row] = pad_output[0]
+
+    def push(self, values, rows=None):
+        """Advances the traces one event.
+        Args:
+            values (list): new events, one array per model input with one
+                event per row or per element of rows.
+            rows (ndarray, optional): rows receiving values, the rest of the
+                rows are not advanced.
+        """
+        rows = np.arange(len(self.steps)) if rows is None else np.asarray(rows)
+        if rows.size == 0:
+            return
+        steps = self.steps[rows] + 1
+        if self.mode == 'exact':
+            # The event is fed to the lanes that can still be used, the
+            # prediction is the one of the lane with n_size - steps pads
+            out_lane = np.maximum(self.n_size - steps, 0)
+            num_lanes = out_lane + 1
+            row_idx = np.repeat(np.arange(rows.size), num_lanes)
+            lane_idx = np.concatenate([np.arange(x) for x in num_lanes])
+            out_pos = np.cumsum(num_lanes) - 1
+        else:
+            row_idx = np.arange(rows.size)
+            lane_idx = np.zeros(rows.size, dtype=int)
+            out_pos = row_idx
+        inputs = [np.asarray(x, dtype=np.float32).reshape(
+                      rows.size, 1, *shape)[row_idx]
+                  for x, shape in zip(values, self.input_shapes)]
+        states = [x[rows[row_idx], lane_idx] for x in self.states]
+        preds = self.model.predict_on_batch(inputs + states)
+        for state, new_state in zip(self.states, preds[self.num_outputs:]):
+            state[rows[row_idx], lane_idx] = np.asarray(new_state)
+        for output, pred in zip(self.outputs, preds[:self.num_outputs]):
+            output[rows] = np.asarray(pred)[out_pos]
+        self.steps[rows] = steps
+
+    def predict(self, rows=None):
+        """Returns the predictions of the current traces.
+        Args:
+            rows (ndarray, optional): rows to take, all of them by default.
+        Returns:
+            list: one array per model output.
+        """
+        if rows is None:
+            return [x.copy() for x in self.outputs]
+        return [x[rows] for x in self.outputs]
+
+
+def check_exactness(model, num_traces=16, trace_size=None, seed=0):
+    """Compares the predictions of the step models with the ones of the
+    windowed model on random traces.
+    Args:
+        model (Model): trained windowed model.
+        num_traces (int): number of random traces.
+        trace_size (int, optional): events per trace, 2 * n_size by default.
+        seed (int): random seed.
+    Returns:
+        DataFrame: maximum absolute difference of the predictions by mode
+        and number of events of the traces, the traces fit in the window
+        while events <= n_size.
+    """
+    rng = np.random.default_rng(seed)
+    n_size = model.inputs[0].shape[1]
+    trace_size = trace_size or 2 * n_size
+    # Random events, the categorical inputs take values of the vocabularies
+    events = list()
+    for i, x in enumerate(model.inputs):
+        if len(x.shape) == 2:
+            events.append(rng.integers(1, model.outputs[i].shape[-1],
+                                       (num_traces, trace_size)))
+        else:
+            events.append(rng.random((num_traces, trace_size, x.shape[2]),
+                                     dtype=np.float32))
+    windows = [nw.NgramWindow(num_traces, n_size,
+                              x.shape[2] if len(x.shape) > 2 else None)
+               for x in model.inputs]
+    steps = {mode: StepModel(model, mode) for mode in ['exact', 'approx']}
+    for step_model in steps.values():
+        step_model.start(num_traces)
+    records = list()
+    for t in range(1, trace_size + 1):
+        values = [x[:, t - 1] for x in events]
+        for window, value in zip(windows, values):
+            window.push(value)
+        expected = model.predict_on_batch([x.window() for x in windows])
+        for mode, step_model in steps.items():
+            step_model.push(values)
+            diff = max(np.max(np.abs(np.asarray(x) - y)) for x, y
+                       in zip(expected, step_model.predict()))
+            records.append({'mode': mode, 'events': t,
+                            'in_window': t <= n_size,
+                            'max_abs_diff': float(diff)})
+    return pd.DataFrame(records)
@@ -8,6 +8,9 @@ import numpy as np
 
 import utils.support as sup
 
+from model_prediction import ngram_window as nw
+from model_prediction import model_registry as mr
+
 
 class SuffixPredictor():
 
@@ -18,8 +21,8 @@ class SuffixPredictor():
         self.imp = 'arg_max'
         self.max_trace_size = 0
 
-    def predict(self, params, model, spl, imp, vectorizer):
-        self.model = model
+    def predict(self, params, model_path, spl, imp, vectorizer):
+        self.model = mr.get_model(model_path)
         self.spl = spl
         self.max_trace_size = params['max_trace_size']
         self.imp = imp
@@ -30,10 +33,16 @@ class SuffixPredictor():
     def _get_predictor(self, model_type):
         # OJO: This is an extension point just incase 
         # a different predictor being neccesary
+        if self.imp == 'beam_search':
+            return self._predict_suffix_beam
+        elif self.imp in ['top_k', 'top_p']:
+            return self._predict_suffix_sampling
         return self._predict_suffix_shared_cat
 
     def _predict_suffix_shared_cat(self, parms, vectorizer):
         """Generate business process suffixes using a keras trained model.
+        All the prefixes are rolled out together, one batched prediction
+        per suffix step, rows leave the batch when they predict the end.
         Args:
             model (keras model): keras trained model.
             prefixes (list): list of prefixes.
@@ -41,86 +50,309 @@ class SuffixPredictor():
             rl_index (dict): index of roles.
             imp (str): method of next event selection.
         """
+        time_dim = parms['dim']['time_dim']
+        # Activities and roles input shape(prefixes, time_dim)
+        x_ac_ngram = nw.NgramWindow.from_prefixes(
+            self.spl['prefixes']['activities'], time_dim)
+        x_rl_ngram = nw.NgramWindow.from_prefixes(
+            self.spl['prefixes']['roles'], time_dim)
+        # times input shape(prefixes, time_dim, # attributes)
+        x_t_ngram = nw.NgramWindow.from_prefixes(
+            self.spl['prefixes']['times'], time_dim)
+        if vectorizer in ['inter']:
+            x_inter_ngram = nw.NgramWindow.from_prefixes(
+                self.spl['prefixes']['inter_attr'], time_dim)
+        num_prefixes = x_ac_ngram.rows
+        ac_suf = [list() for _ in range(num_prefixes)]
+        rl_suf = [list() for _ in range(num_prefixes)]
+        acum_dur = [list() for _ in range(num_prefixes)]
+        acum_wait = [list() for _ in range(num_prefixes)]
         # Generation of predictions
-        results = list()
-        for i, _ in enumerate(self.spl['prefixes']['activities']):
-            # Activities and roles input shape(1,5)
-            x_ac_ngram = (np.append(
-                    np.zeros(parms['dim']['time_dim']),
-                    np.array(self.spl['prefixes']['activities'][i]),
-                    axis=0)[-parms['dim']['time_dim']:]
-                .reshape((1, parms['dim']['time_dim'])))
-
-            x_rl_ngram = (np.append(
-                    np.zeros(parms['dim']['time_dim']),
-                    np.array(self.spl['prefixes']['roles'][i]),
-                    axis=0)[-parms['dim']['time_dim']:]
-                .reshape((1, parms['dim']['time_dim'])))
-           
-            times_attr_num = (self.spl['prefixes']['times'][i].shape[1])
-            x_t_ngram = np.array(
-                [np.append(np.zeros(
-                    (parms['dim']['time_dim'], times_attr_num)),
-                    self.spl['prefixes']['times'][i], axis=0)
-                    [-parms['dim']['time_dim']:]
-                    .reshape((parms['dim']['time_dim'], times_attr_num))]
-                )
+        finished = np.zeros(num_prefixes, dtype=bool)
+        for _  in range(1, self.max_trace_size):
+            active = np.flatnonzero(~finished)
+            if active.size == 0:
+                break
+            sel = None if active.size == num_prefixes else active
             if vectorizer in ['basic']:
-                inputs = [x_ac_ngram, x_rl_ngram, x_t_ngram]
+                inputs = [x_ac_ngram.window(sel), x_rl_ngram.window(sel),
+                          x_t_ngram.window(sel)]
             elif vectorizer in ['inter']:
-                inter_attr_num = self.spl['prefixes']['inter_attr'][i].shape[1]
-                x_inter_ngram = np.array([np.append(
-                        np.zeros((parms['dim']['time_dim'], inter_attr_num)),
-                        self.spl['prefixes']['inter_attr'][i],
-                        axis=0)[-parms['dim']['time_dim']:].reshape((parms['dim']['time_dim'], inter_attr_num))])
-                inputs = [x_ac_ngram, x_rl_ngram, x_t_ngram, x_inter_ngram]
-
-            pref_size = len(self.spl['prefixes']['activities'][i])
-            acum_dur, acum_wait = list(), list()
-            ac_suf, rl_suf = list(), list()
-            for _  in range(1, self.max_trace_size):
-                preds = self.model.predict(inputs)
-                if self.imp == 'random_choice':
-                    # Use this to get a random choice following as PDF the predictions
-                    pos = np.random.choice(
-                        np.arange(0,len(preds[0][0])), p=preds[0][0])
-                    pos1 = np.random.choice(
-                        np.arange(0, len(preds[1][0])), p=preds[1][0])
-                elif self.imp == 'arg_max':
-                    # Use this to get the max prediction
-                    pos = np.argmax(preds[0][0])
-                    pos1 = np.argmax(preds[1][0])
-                # Activities accuracy evaluation
-                x_ac_ngram = np.append(x_ac_ngram, [[pos]], axis=1)
-                x_ac_ngram = np.delete(x_ac_ngram, 0, 1)
-                x_rl_ngram = np.append(x_rl_ngram, [[pos1]], axis=1)
-                x_rl_ngram = np.delete(x_rl_ngram, 0, 1)
-                x_t_ngram = np.append(x_t_ngram, [preds[2]], axis=1)
-                x_t_ngram = np.delete(x_t_ngram, 0, 1)
-                if vectorizer in ['basic']:
-                    inputs = [x_ac_ngram, x_rl_ngram, x_t_ngram]
-                elif vectorizer in ['inter']:
-                    x_inter_ngram = np.append(x_inter_ngram, [preds[3]], axis=1)
-                    x_inter_ngram = np.delete(x_inter_ngram, 0, 1)
-                    inputs = [x_ac_ngram, x_rl_ngram, x_t_ngram, x_inter_ngram]
-                # Stop if the next prediction is the end of the trace
-                # otherwise until the defined max_size
-                ac_suf.append(pos)
-                rl_suf.append(pos1)
-                acum_dur.append(preds[2][0][0])
+                inputs = [x_ac_ngram.window(sel), x_rl_ngram.window(sel),
+                          x_t_ngram.window(sel), x_inter_ngram.window(sel)]
+            preds = self.model.predict_on_batch(inputs)
+            pos = nw.select_events(preds[0], self.imp)
+            pos1 = nw.select_events(preds[1], self.imp)
+            # Activities accuracy evaluation, finished rows are not read
+            x_ac_ngram.push(pos, active)
+            x_rl_ngram.push(pos1, active)
+            x_t_ngram.push(preds[2], active)
+            if vectorizer in ['inter']:
+                x_inter_ngram.push(preds[3], active)
+            for i, row in enumerate(active):
+                ac_suf[row].append(pos[i])
+                rl_suf[row].append(pos1[i])
+                acum_dur[row].append(preds[2][i][0])
                 if not parms['one_timestamp']:
-                    acum_wait.append(preds[2][0][1])
-                if parms['index_ac'][pos] == 'end':
-                    break
-            # save results
-            predictions = [ac_suf, rl_suf, acum_dur]
+                    acum_wait[row].append(preds[2][i][1])
+            # Stop if the next prediction is the end of the trace
+            # otherwise until the defined max_size
+            finished[active] = [parms['index_ac'][x] == 'end' for x in pos]
+        # save results
+        results = list()
+        for i in range(num_prefixes):
+            pref_size = len(self.spl['prefixes']['activities'][i])
+            predictions = [ac_suf[i], rl_suf[i], acum_dur[i]]
             if not parms['one_timestamp']:
-                predictions.extend([acum_wait])
+                predictions.extend([acum_wait[i]])
             results.append(
                 self.create_result_record(i, self.spl, predictions, parms, pref_size))
         sup.print_done_task()
         return results
 
+    def _predict_suffix_beam(self, parms, vectorizer):
+        """Generate business process suffixes by beam search. Every prefix
+        keeps beam_width beams scored by the joint log-probability of
+        their activities and roles, the beams of all the prefixes are
+        expanded together with one batched prediction per suffix step.
+        The beams are ranked by their score divided by their length to
+        the power of length_penalty, in that way the beams that end early
+        do not win only because they add fewer log-probabilities. The
+        finished beams compete with the expanded ones with their final
+        score.
+        Args:
+            parms (dict): prediction parameters, beam_width, n_best and
+                length_penalty.
+            vectorizer (str): model vectorizer.
+        Returns:
+            list: result record per prefix with the n_best suffixes.
+        """
+        width = parms.get('beam_width', 5)
+        n_best = min(parms.get('n_best', 1), width)
+        alpha = parms.get('length_penalty', 1.0)
+        windows = self._create_windows(vectorizer,
+                                       parms['dim']['time_dim'], width)
+        num_prefixes = len(self.spl['prefixes']['activities'])
+        num_rows = num_prefixes * width
+        end_idx = [k for k, v in parms['index_ac'].items() if v == 'end']
+        # Only the first beam of every prefix is alive at the start
+        scores = np.full(num_rows, -np.inf)
+        scores[::width] = 0
+        lengths = np.zeros(num_rows)
+        finished = np.zeros(num_rows, dtype=bool)
+        history = list()
+        for _ in range(1, self.max_trace_size):
+            active = np.flatnonzero(~finished & np.isfinite(scores))
+            if active.size == 0:
+                break
+            sel = None if active.size == num_rows else active
+            preds = self.model.predict_on_batch(
+                [x.window(sel) for x in windows])
+            joint = self.joint_log_probs(preds[0], preds[1])
+            # The best width pairs of every beam are enough to fill
+            # the beams of its prefix
+            num_cand = min(width, joint.shape[1])
+            cand = np.argpartition(-joint, num_cand - 1,
+                                   axis=1)[:, :num_cand]
+            cand_scores = np.full((num_rows, num_cand + 1), -np.inf)
+            cand_scores[active, :num_cand] = (
+                scores[active, None] + np.take_along_axis(joint, cand, axis=1))
+            cand_scores[finished, num_cand] = scores[finished]
+            cand_scores = cand_scores.reshape(num_prefixes, -1)
+            cand_lengths = np.repeat(lengths[:, None] + 1, num_cand + 1, axis=1)
+            cand_lengths[:, num_cand] = lengths
+            cand_lengths = cand_lengths.reshape(num_prefixes, -1)
+            ranking = cand_scores / np.maximum(cand_lengths, 1)**alpha
+            best = np.argsort(-ranking, axis=1, kind='stable')[:, :width]
+            scores = np.take_along_axis(cand_scores, best, axis=1).ravel()
+            lengths = np.take_along_axis(cand_lengths, best, axis=1).ravel()
+            # Source beam and candidate of every new beam
+            src = (np.arange(num_prefixes)[:, None] * width +
+                   best // (num_cand + 1)).ravel()
+            slot = (best % (num_cand + 1)).ravel()
+            expanded = (slot < num_cand) & np.isfinite(scores)
+            pred_row = np.zeros(num_rows, dtype=int)
+            pred_row[active] = np.arange(active.size)
+            pred_row = pred_row[src[expanded]]
+            idx = cand[pred_row, slot[expanded]]
+            ac = np.zeros(num_rows, dtype=int)
+            rl = np.zeros(num_rows, dtype=int)
+            ac[expanded] = idx // preds[1].shape[1]
+            rl[expanded] = idx % preds[1].shape[1]
+            values = [ac, rl]
+            for pred in preds[2:len(windows)]:
+                value = np.zeros((num_rows, pred.shape[1]), dtype=np.float32)
+                value[expanded] = pred[pred_row]
+                values.append(value)
+            # The beams inherit the n-grams of their source,
+            # finished beams are not read again
+            for window, value in zip(windows, values):
+                window.take(src)
+                window.push(value)
+            history.append((src, expanded, ac, rl, values[2]))
+            finished = finished[src] | (expanded & np.isin(ac, end_idx))
+        # Backtracking of the beams
+        rows = (np.arange(num_prefixes)[:, None] * width +
+                np.arange(n_best)).ravel()
+        suffixes = [[list(), list(), list()] for _ in rows]
+        current = rows
+        for src, expanded, ac, rl, times in reversed(history):
+            for i, row in enumerate(current):
+                if expanded[row]:
+                    suffixes[i][0].insert(0, ac[row])
+                    suffixes[i][1].insert(0, rl[row])
+                    suffixes[i][2].insert(0, times[row])
+            current = src[current]
+        results = list()
+        for i in range(num_prefixes):
+            beams = [(suffixes[i * n_best + j], scores[i * width + j])
+                     for j in range(n_best)
+                     if np.isfinite(scores[i * width + j])]
+            results.append(self._create_nbest_record(i, beams, parms))
+        sup.print_done_task()
+        return results
+
+    def _predict_suffix_sampling(self, parms, vectorizer):
+        """Generate business process suffixes sampling the pairs of
+        activity and role from the top_k most probable ones or from
+        the nucleus of top_p probability. n_best rollouts of every
+        prefix are advanced together in one batch, the distinct ones are
+        ranked by their log-probability.
+        Args:
+            parms (dict): prediction parameters, top_k, top_p and n_best.
+            vectorizer (str): model vectorizer.
+        Returns:
+            list: result record per prefix with the n_best suffixes.
+        """
+        samples = max(parms.get('n_best', 1), 1)
+        windows = self._create_windows(vectorizer,
+                                       parms['dim']['time_dim'], samples)
+        num_rows = windows[0].rows
+        end_idx = [k for k, v in parms['index_ac'].items() if v == 'end']
+        scores = np.zeros(num_rows)
+        suffixes = [[list(), list(), list()] for _ in range(num_rows)]
+        finished = np.zeros(num_rows, dtype=bool)
+        for _ in range(1, self.max_trace_size):
+            active = np.flatnonzero(~finished)
+            if active.size == 0:
+                break
+            sel = None if active.size == num_rows else active
+            preds = self.model.predict_on_batch(
+                [x.window(sel) for x in windows])
+            joint = self.joint_log_probs(preds[0], preds[1])
+            idx = self.sample_events(joint, self.imp, parms)
+            scores[active] += joint[np.arange(active.size), idx]
+            ac = idx // preds[1].shape[1]
+            rl = idx % preds[1].shape[1]
+            for window, value in zip(windows, [ac, rl, *preds[2:]]):
+                window.push(value, active)
+            for i, row in enumerate(active):
+                suffixes[row][0].append(ac[i])
+                suffixes[row][1].append(rl[i])
+                suffixes[row][2].append(preds[2][i])
+            finished[active] = np.isin(ac, end_idx)
+        results = list()
+        for i in range(num_rows // samples):
+            rows = range(i * samples, (i + 1) * samples)
+            rollouts = sorted([(suffixes[x], scores[x]) for x in rows],
+                              key=lambda x: x[1], reverse=True)
+            # Repeated rollouts are returned once
+            unique = dict()
+            for rollout in rollouts:
+                unique.setdefault(
+                    (tuple(rollout[0][0]), tuple(rollout[0][1])), rollout)
+            rollouts = list(unique.values())
+            results.append(self._create_nbest_record(i, rollouts, parms))
+        sup.print_done_task()
+        return results
+
+    def _create_windows(self, vectorizer, time_dim, repeat=1):
+        """Creates the n-grams of the prefixes, every prefix
+        is repeated in repeat consecutive rows."""
+        keys = ['activities', 'roles', 'times']
+        if vectorizer in ['inter']:
+            keys.append('inter_attr')
+        return [nw.NgramWindow.from_prefixes(
+                    [x for x in self.spl['prefixes'][key]
+                     for _ in range(repeat)], time_dim)
+                for key in keys]
+
+    def _create_nbest_record(self, index, suffixes, parms):
+        """Creates the result record of a prefix from its best suffix,
+        and adds the alternatives when more than one is returned.
+        Args:
+            index (int): prefix index.
+            suffixes (list): pairs of suffix and log-probability sorted
+                from the most probable, the suffix is a list of activities,
+                roles and times.
+            parms (dict): prediction parameters.
+        Returns:
+            dict: result record.
+        """
+        (ac_suf, rl_suf, times), log_prob = suffixes[0]
+        predictions = [ac_suf, rl_suf, [x[0] for x in times]]
+        if not parms['one_timestamp']:
+            predictions.append([x[1] for x in times])
+        pref_size = len(self.spl['prefixes']['activities'][index])
+        record = self.create_result_record(
+            index, self.spl, predictions, parms, pref_size)
+        record['log_prob'] = float(log_prob)
+        if len(suffixes) > 1:
+            record['ac_nbest'] = [x[0][0] for x in suffixes]
+            record['rl_nbest'] = [x[0][1] for x in suffixes]
+            record['nbest_log_prob'] = [float(x[1]) for x in suffixes]
+        return record
+
+    @staticmethod
+    def joint_log_probs(ac_probs, rl_probs):
+        """Scores the activity and role heads jointly.
+        Args:
+            ac_probs (ndarray): activity probabilities (rows, activities).
+            rl_probs (ndarray): role probabilities (rows, roles).
+        Returns:
+            ndarray: log-probability of every pair of shape
+            (rows, activities * roles), the pair index is
+            activity * roles + role.
+        """
+        tiny = np.finfo(np.float32).tiny
+        ac_log = np.log(np.maximum(ac_probs, tiny))
+        rl_log = np.log(np.maximum(rl_probs, tiny))
+        return (ac_log[:, :, None] + rl_log[:, None, :]).reshape(
+            len(ac_log), -1)
+
+    @staticmethod
+    def sample_events(log_probs, imp, parms):
+        """Samples the next event of every row from the truncated
+        distribution.
+        Args:
+            log_probs (ndarray): log-probabilities of shape (rows, events).
+            imp (str): top_k or top_p.
+            parms (dict): prediction parameters.
+        Returns:
+            ndarray: selected index per row.
+        """
+        probs = np.exp(log_probs)
+        if imp == 'top_k':
+            k = min(parms.get('top_k', 5), probs.shape[1])
+            # Exactly k events are kept, also when probabilities tie
+            top = np.argpartition(-probs, k - 1, axis=1)[:, :k]
+            mask = np.zeros(probs.shape, dtype=bool)
+            np.put_along_axis(mask, top, True, axis=1)
+            probs = np.where(mask, probs, 0)
+        elif imp == 'top_p':
+            order = np.argsort(-probs, axis=1)
+            sorted_probs = np.take_along_axis(probs, order, axis=1)
+            cum_probs = np.cumsum(sorted_probs, axis=1)
+            # An event is kept while the mass before it is under top_p
+            keep = ((cum_probs - sorted_probs) <
+                    parms.get('top_p', 0.9) * cum_probs[:, -1:])
+            mask = np.zeros_like(keep)
+            np.put_along_axis(mask, order, keep, axis=1)
+            probs = np.where(mask, probs, 0)
+        else:
+            raise ValueError(imp)
+        return nw.select_events(probs, 'random_choice')
+
     def create_result_record(self, index, spl, preds, parms, pref_size):
         record = dict()
         record['pref_size'] = pref_size
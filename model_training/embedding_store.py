@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 15:42:36 2026
+
+@author: Manuel Camargo
+"""
+import os
+import csv
+import json
+import hashlib
+import zipfile
+
+import numpy as np
+
+
+class EmbeddingStore():
+    """
+    Binary store of the embedded matrices of activities and roles. Every
+    entry is a .npz file named by the log and by the hash of its
+    vocabulary and of the embedding method, so a log that changes its
+    activities or roles never reuses stale matrices. The entries are
+    written in a temporal file and renamed, in that way the readers,
+    e.g. the slurm workers, never see partial files. The CSV .emb files
+    of the former versions can still be imported.
+    """
+
+    def __init__(self, folder=os.path.join('input_files', 'embedded_matix')):
+        """constructor
+        Args:
+            folder (str): store directory.
+        """
+        self.folder = folder
+
+    @staticmethod
+    def key(index_ac, index_rl, method='dot_product'):
+        """Hashes the vocabulary of a log and the embedding method.
+        Args:
+            index_ac (dict): index -> activity.
+            index_rl (dict): index -> role.
+            method (str): embedding method.
+        Returns:
+            str: hexadecimal digest.
+        """
+        content = {'activities': [index_ac[k] for k in sorted(index_ac)],
+                   'roles': [index_rl[k] for k in sorted(index_rl)],
+                   'method': method}
+        return hashlib.sha1(
+            json.dumps(content, default=str).encode()).hexdigest()
+
+    def path(self, log_name, index_ac, index_rl, method='dot_product'):
+        name = os.path.splitext(os.path.basename(log_name))[0]
+        return os.path.join(
+            self.folder,
+            name + '_' + self.key(index_ac, index_rl, method)[:16] + '.npz')
+
+    def load(self, log_name, index_ac, index_rl, method='dot_product'):
+        """Reads the matrices of a log.
+        Args:
+            log_name (str): log file name.
+            index_ac (dict): index -> activity.
+            index_rl (dict): index -> role.
+            method (str): embedding method.
+        Returns:
+            tuple: activities and roles weights, None if the entry
+            does not exist.
+        """
+        path = self.path(log_name, index_ac, index_rl, method)
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                return data['ac_weights'], data['rl_weights']
+        except (OSError, ValueError, KeyError, EOFError,
+                zipfile.BadZipFile):
+            return None
+
+    def save(self, log_name, index_ac, index_rl, ac_weights, rl_weights,
+             method='dot_product'):
+        """Writes the matrices of a log.
+        Args:
+            log_name (str): log file name.
+            index_ac (dict): index -> activity.
+            index_rl (dict): index -> role.
+            ac_weights (ndarray): activities weights.
+            rl_weights (ndarray): roles weights.
+            method (str): embedding method.
+        Returns:
+            str: path of the entry.
+        """
+        if not os.path.exists(self.folder):
+            os.makedirs(self.folder, exist_ok=True)
+        path = self.path(log_name, index_ac, index_rl, method)
+        temp = path + '.' + str(os.getpid()) + '.tmp'
+        try:
+            with open(temp, 'wb') as file:
+                np.savez(file,
+                         ac_weights=np.asarray(ac_weights, dtype=np.float32),
+                         rl_weights=np.asarray(rl_weights, dtype=np.float32),
+                         activities=np.array(
+                             [index_ac[k] for k in sorted(index_ac)]),
+                         roles=np.array(
+                             [index_rl[k] for k in sorted(index_rl)]))
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temp, path)
+        finally:
+            if os.path.exists(temp):
+                os.remove(temp)
+        return path
+
+    def import_csv(self, log_name, index_ac, index_rl, method='dot_product'):
+        """Imports the ac_*.emb and rl_*.emb files of a log into the store.
+        The files are only imported when they have a row for every
+        activity and role of the vocabulary with the same name.
+        Args:
+            log_name (str): log file name.
+            index_ac (dict): index -> activity.
+            index_rl (dict): index -> role.
+            method (str): embedding method of the files.
+        Returns:
+            tuple: activities and roles weights, None if the files do
+            not exist or belong to other vocabulary.
+        """
+        name = os.path.splitext(os.path.basename(log_name))[0]
+        weights = list()
+        for prefix, index in (('ac_', index_ac), ('rl_', index_rl)):
+            matrix = self.read_csv(
+                os.path.join(self.folder, prefix + name + '.emb'), index)
+            if matrix is None:
+                return None
+            weights.append(matrix)
+        self.save(log_name, index_ac, index_rl, *weights, method=method)
+        return tuple(weights)
+
+    @staticmethod
+    def read_csv(path, index):
+        """Reads a CSV embedded matrix.
+        Args:
+            path (str): path of the .emb file.
+            index (dict): index -> category.
+        Returns:
+            ndarray: weights ordered by index, None if the file does not
+            exist or does not match the index.
+        """
+        rows = dict()
+        try:
+            with open(path, 'r') as csvfile:
+                filereader = csv.reader(csvfile, delimiter=',', quotechar='"')
+                for row in filereader:
+                    rows[int(row[0])] = (row[1].strip(),
+                                         [float(x) for x in row[2:]])
+        except (OSError, ValueError, IndexError):
+            return None
+        if any(rows.get(k, (None,))[0] != v for k, v in index.items()):
+            return None
+        return np.array([rows[k][1] for k in sorted(index)])
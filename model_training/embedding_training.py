@@ -5,16 +5,18 @@ Created on Wed Nov 21 21:23:55 2018
 @author: Manuel Camargo
 """
 import os
-import random
 import itertools
 import math
 import numpy as np
+import tensorflow as tf
 
 from keras.models import Model
 from keras.layers import Input, Embedding, Dot, Reshape
 
 import utils.support as sup
 
+from model_training import embedding_store as es
+
 
 def training_model(parameters, log, ac_index, index_ac, rl_index, index_rl):
     """Main method of the embedding training module.
@@ -22,26 +24,44 @@ def training_model(parameters, log, ac_index, index_ac, rl_index, index_rl):
         parameters (dict): parameters for training the embeddeding network.
         timeformat (str): event-log date-time format.
         no_loops (boolean): remove loops fom the event-log (optional).
+    Returns:
+        tuple: activities and roles weights.
     """
     # Define the number of dimensions as the 4th root of the # of categories
     dim_number = math.ceil(
         len(list(itertools.product(*[list(ac_index.items()),
                                      list(rl_index.items())])))**0.25)
 
-    ac_weights, rl_weights = train_embedded(log,
-                                            ac_index, rl_index, dim_number)
+    method = parameters.get('emb_method', 'dot_product')
+    trainer = _get_trainer(method)
+    ac_weights, rl_weights = trainer(log, ac_index, rl_index, dim_number)
+
+    store = es.EmbeddingStore()
+    store.save(parameters['file_name'], index_ac, index_rl,
+               ac_weights, rl_weights, method=method)
+
+    if parameters.get('emb_csv', False):
+        # CSV copy of the matrices, e.g. for external tools
+        sup.create_file_from_list(
+            reformat_matrix(index_ac, ac_weights),
+            os.path.join(store.folder,
+                         'ac_' + parameters['file_name'].split('.')[0]+'.emb'))
+        sup.create_file_from_list(
+            reformat_matrix(index_rl, rl_weights),
+            os.path.join(store.folder,
+                         'rl_' + parameters['file_name'].split('.')[0]+'.emb'))
+    return ac_weights, rl_weights
 
-    if not os.path.exists(os.path.join('input_files', 'embedded_matix')):
-        os.makedirs(os.path.join('input_files', 'embedded_matix'))
 
-    sup.create_file_from_list(
-        reformat_matrix(index_ac, ac_weights),
-        os.path.join(os.path.join('input_files', 'embedded_matix'),
-                     'ac_' + parameters['file_name'].split('.')[0]+'.emb'))
-    sup.create_file_from_list(
-        reformat_matrix(index_rl, rl_weights),
-        os.path.join(os.path.join('input_files', 'embedded_matix'),
-                     'rl_' + parameters['file_name'].split('.')[0]+'.emb'))
+def _get_trainer(method):
+    if method == 'dot_product':
+        return train_embedded
+    elif method == 'svd':
+        return train_svd
+    elif method == 'ppmi':
+        return train_ppmi
+    else:
+        raise ValueError(method)
 
 
 # =============================================================================
@@ -50,23 +70,28 @@ def training_model(parameters, log, ac_index, index_ac, rl_index, index_rl):
 
 def train_embedded(log_df, ac_index, rl_index, dim_number):
     """Carry out the training of the embeddings"""
-    # Iterate through each book
-    pairs = list()
-    for i in range(0, len(log_df)):
-        # Iterate through the links in the book
-        pairs.append((ac_index[log_df.iloc[i]['task']],
-                      rl_index[log_df.iloc[i]['role']]))
+    pairs = extract_pairs(log_df, ac_index, rl_index)
 
     model = ac_rl_embedding_model(ac_index, rl_index, dim_number)
     model.summary()
 
     n_positive = 1024
+    negative_ratio = 2
+    batch_size = n_positive * (1 + negative_ratio)
     gen = generate_batch(pairs, ac_index, rl_index,
-                         n_positive, negative_ratio=2)
+                         n_positive, negative_ratio=negative_ratio)
+    # The batches are produced while the previous one is trained
+    dataset = tf.data.Dataset.from_generator(
+        lambda: gen,
+        output_signature=(
+            {'activity': tf.TensorSpec((batch_size,), tf.float32),
+             'role': tf.TensorSpec((batch_size,), tf.float32)},
+            tf.TensorSpec((batch_size,), tf.float32)))
+    dataset = dataset.prefetch(tf.data.AUTOTUNE)
     # Train
-    model.fit_generator(gen, epochs=100,
-                        steps_per_epoch=len(pairs) // n_positive,
-                        verbose=2)
+    model.fit(dataset, epochs=100,
+              steps_per_epoch=max(1, len(pairs) // n_positive),
+              verbose=2)
 
     # Extract embeddings
     ac_layer = model.get_layer('activity_embedding')
@@ -79,41 +104,110 @@ def train_embedded(log_df, ac_index, rl_index, dim_number):
 
 
 def generate_batch(pairs, ac_index, rl_index, n_positive=50,
-                   negative_ratio=1.0):
-    """Generate batches of samples for training"""
+                   negative_ratio=1):
+    """Generate batches of samples for training. The positive examples
+    are sampled from the pairs and the negative ones are drawn as arrays
+    of random candidates, discarding the observed pairs with a boolean
+    matrix of activities by roles.
+    Args:
+        pairs (ndarray): observed pairs of shape (events, 2).
+        ac_index (dict): index of activities.
+        rl_index (dict): index of roles.
+        n_positive (int): positive examples per batch.
+        negative_ratio (int): negative examples per positive one.
+    """
     batch_size = n_positive * (1 + negative_ratio)
-    batch = np.zeros((batch_size, 3))
-    pairs_set = set(pairs)
-    activities = list(ac_index.keys())
-    roles = list(rl_index.keys())
+    n_negative = batch_size - n_positive
+    positives = np.zeros((len(ac_index), len(rl_index)), dtype=bool)
+    positives[pairs[:, 0], pairs[:, 1]] = True
+    # Pairs never observed, when every pair is observed the batch is
+    # completed with positive examples
+    has_negatives = not positives.all()
+    rng = np.random.default_rng()
     # This creates a generator
     while True:
         # randomly choose positive examples
-        idx = 0
-        for idx, (activity, role) in enumerate(random.sample(pairs,
-                                                             n_positive)):
-            batch[idx, :] = (activity, role, 1)
-        # Increment idx by 1
-        idx += 1
-
-        # Add negative examples until reach batch size
-        while idx < batch_size:
-            # random selection
-            random_ac = random.randrange(len(activities))
-            random_rl = random.randrange(len(roles))
-
-            # Check to make sure this is not a positive example
-            if (random_ac, random_rl) not in pairs_set:
-
-                # Add to batch and increment index,  0 due classification task
-                batch[idx, :] = (random_ac, random_rl, 0)
-                idx += 1
-
+        size = n_positive if has_negatives else batch_size
+        pos = pairs[rng.choice(len(pairs), size,
+                               replace=len(pairs) < size)]
+        batch = [np.concatenate([pos, np.ones((size, 1))], axis=1)]
+        # Draw candidates until reach batch size
+        missing = n_negative if has_negatives else 0
+        while missing > 0:
+            random_ac = rng.integers(len(ac_index), size=2 * missing)
+            random_rl = rng.integers(len(rl_index), size=2 * missing)
+            # Check to make sure these are not positive examples
+            mask = ~positives[random_ac, random_rl]
+            neg = np.stack([random_ac[mask], random_rl[mask],
+                            np.zeros(mask.sum())], axis=1)[:missing]
+            batch.append(neg)
+            missing -= len(neg)
+        batch = np.concatenate(batch).astype(np.float32)
         # Make sure to shuffle order
-        np.random.shuffle(batch)
+        rng.shuffle(batch)
         yield {'activity': batch[:, 0], 'role': batch[:, 1]}, batch[:, 2]
 
 
+def train_svd(log_df, ac_index, rl_index, dim_number):
+    """Embeddings of the truncated SVD of the log scaled co-occurrence
+    matrix of activities and roles."""
+    counts = cooccurrence_matrix(
+        extract_pairs(log_df, ac_index, rl_index), ac_index, rl_index)
+    return factorize(np.log1p(counts), dim_number)
+
+
+def train_ppmi(log_df, ac_index, rl_index, dim_number):
+    """Embeddings of the truncated SVD of the positive pointwise mutual
+    information of activities and roles."""
+    counts = cooccurrence_matrix(
+        extract_pairs(log_df, ac_index, rl_index), ac_index, rl_index)
+    total = counts.sum()
+    expected = np.outer(counts.sum(axis=1), counts.sum(axis=0))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pmi = np.log((counts * total) / expected)
+    ppmi = np.where(np.isfinite(pmi), np.maximum(pmi, 0), 0)
+    return factorize(ppmi, dim_number)
+
+
+def extract_pairs(log_df, ac_index, rl_index):
+    """Pairs of activity and role of every event.
+    Returns:
+        ndarray: pairs of indexes of shape (events, 2).
+    """
+    return np.stack([log_df['task'].map(ac_index).to_numpy(),
+                     log_df['role'].map(rl_index).to_numpy()],
+                    axis=1).astype(np.int64)
+
+
+def cooccurrence_matrix(pairs, ac_index, rl_index):
+    """Counts of every pair of activity and role."""
+    counts = np.zeros((len(ac_index), len(rl_index)))
+    np.add.at(counts, (pairs[:, 0], pairs[:, 1]), 1)
+    return counts
+
+
+def factorize(matrix, dim_number):
+    """Truncated SVD of an activities by roles matrix, the singular values
+    are split between both sides. The sign of every component is fixed
+    to make the result deterministic, and the components missing when
+    the rank is lower than dim_number are zeros.
+    Args:
+        matrix (ndarray): matrix of shape (activities, roles).
+        dim_number (int): embedding dimension.
+    Returns:
+        tuple: activities and roles embeddings.
+    """
+    u, sigma, vt = np.linalg.svd(matrix, full_matrices=False)
+    u, sigma, vt = u[:, :dim_number], sigma[:dim_number], vt[:dim_number]
+    signs = np.sign(u[np.argmax(np.abs(u), axis=0), np.arange(u.shape[1])])
+    signs[signs == 0] = 1
+    ac_weights = np.zeros((matrix.shape[0], dim_number))
+    rl_weights = np.zeros((matrix.shape[1], dim_number))
+    ac_weights[:, :len(sigma)] = u * signs * np.sqrt(sigma)
+    rl_weights[:, :len(sigma)] = vt.T * signs * np.sqrt(sigma)
+    return ac_weights, rl_weights
+
+
 def ac_rl_embedding_model(ac_index, rl_index, embedding_size):
     """Model to embed activities and roles using the functional API"""
 
@@ -7,8 +7,6 @@ Created on Sat Mar 14 19:18:18 2020
 import pandas as pd
 import numpy as np
 
-import itertools
-from operator import itemgetter
 try:
     from support_modules import role_discovery as rl
 except:
@@ -29,11 +27,14 @@ class FeaturesMannager():
         self.one_timestamp = params['one_timestamp']
         # self.resources = pd.DataFrame
         self.norm_method = params['norm_method']
+        # Scaling arguments of a trained model, None to fit them on the log
+        self.scale_args = None
         self._scalers = dict()
         self.scale_dispatcher = {'basic': self._scale_base,
                                  'inter': self._scale_inter}
 
-    def calculate(self, log, add_cols):
+    def calculate(self, log, add_cols, scale_args=None):
+        self.scale_args = scale_args
         log = self.add_calculated_times(log)
         log = self.filter_features(log, add_cols)
         return self.scale_features(log, add_cols)
@@ -69,46 +70,55 @@ class FeaturesMannager():
         Returns:
             Dataframe: The dataframe with the calculated features added.
         """
+        ordk = 'end_timestamp' if self.one_timestamp else 'start_timestamp'
+        log = log.sort_values('caseid', kind='mergesort').reset_index(drop=True)
         log['dur'] = 0
         log['acc_cycle'] = 0
         log['daytime'] = 0
-        log = log.to_dict('records')
-        log = sorted(log, key=lambda x: x['caseid'])
-        for _, group in itertools.groupby(log, key=lambda x: x['caseid']):
-            events = list(group)
-            ordk = 'end_timestamp' if self.one_timestamp else 'start_timestamp'
-            events = sorted(events, key=itemgetter(ordk))
-            for i in range(0, len(events)):
-                # In one-timestamp approach the first activity of the trace
-                # is taken as instantsince there is no previous timestamp
-                # to find a range
-                if self.one_timestamp:
-                    if i == 0:
-                        dur = 0
-                        acc = 0
-                    else:
-                        dur = (events[i]['end_timestamp'] -
-                               events[i-1]['end_timestamp']).total_seconds()
-                        acc = (events[i]['end_timestamp'] -
-                               events[0]['end_timestamp']).total_seconds()
-                else:
-                    dur = (events[i]['end_timestamp'] -
-                           events[i]['start_timestamp']).total_seconds()
-                    acc = (events[i]['end_timestamp'] -
-                           events[0]['start_timestamp']).total_seconds()
-                    if i == 0:
-                        wit = 0
-                    else:
-                        wit = (events[i]['start_timestamp'] -
-                               events[i-1]['end_timestamp']).total_seconds()
-                    events[i]['wait'] = wit if wit >= 0 else 0
-                events[i]['dur'] = dur
-                events[i]['acc_cycle'] = acc
-                time = events[i][ordk].time()
-                time = time.second + time.minute*60 + time.hour*3600
-                events[i]['daytime'] = time
-                events[i]['weekday'] = events[i]['start_timestamp'].weekday()
-        return pd.DataFrame.from_dict(log)
+        # Events of every trace in order, the index keeps the log position
+        events = log.sort_values(['caseid', ordk], kind='mergesort')
+        caseid = events['caseid'].to_numpy()
+        first = np.concatenate([[True], caseid[1:] != caseid[:-1]])
+        # Position of the first event of the trace of every event
+        first_pos = np.maximum.accumulate(
+            np.where(first, np.arange(len(events)), 0))
+        end = events['end_timestamp'].to_numpy()
+        # In one-timestamp approach the first activity of the trace
+        # is taken as instant since there is no previous timestamp
+        # to find a range
+        if self.one_timestamp:
+            dur = self._total_seconds(end[1:] - end[:-1], first)
+            acc = self._total_seconds(end - end[first_pos])
+        else:
+            start = events['start_timestamp'].to_numpy()
+            dur = self._total_seconds(end - start)
+            acc = self._total_seconds(end - start[first_pos])
+            wit = self._total_seconds(start[1:] - end[:-1], first)
+            log['wait'] = pd.Series(np.where(wit >= 0, wit, 0),
+                                    index=events.index)
+        log['dur'] = pd.Series(dur, index=events.index)
+        log['acc_cycle'] = pd.Series(acc, index=events.index)
+        time = events[ordk].dt
+        log['daytime'] = (time.second + time.minute*60 +
+                          time.hour*3600).astype(np.int64)
+        log['weekday'] = events['start_timestamp'].dt.weekday.astype(np.int64)
+        return log
+
+    @staticmethod
+    def _total_seconds(deltas, first=None):
+        """Converts timedeltas to seconds with microseconds precision.
+        parms:
+            deltas: timedelta64 array.
+            first: mask of the trace first events, when given deltas are
+                differences with the previous event and are 0 for them.
+        Returns:
+            ndarray: float seconds.
+        """
+        seconds = deltas.astype('timedelta64[us]').astype(np.int64) / 10**6
+        if first is not None:
+            seconds = np.concatenate([[0], seconds])
+            seconds[first] = 0
+        return seconds
 
     def scale_features(self, log, add_cols):
         scaler = self._get_scaler(self.model_type)
@@ -128,67 +138,91 @@ class FeaturesMannager():
 
     def _scale_base(self, log, add_cols):
         if self.one_timestamp:
-            log, scale_args = self.scale_feature(log, 'dur', self.norm_method)
+            log, scale_args = self.scale_feature(
+                log, 'dur', self.norm_method, scale_args=self.scale_args)
         else:
-            log, dur_scale = self.scale_feature(log, 'dur', self.norm_method)
-            log, wait_scale = self.scale_feature(log, 'wait', self.norm_method)
+            log, dur_scale = self.scale_feature(
+                log, 'dur', self.norm_method,
+                scale_args=self._fitted_args('dur'))
+            log, wait_scale = self.scale_feature(
+                log, 'wait', self.norm_method,
+                scale_args=self._fitted_args('wait'))
             scale_args = {'dur': dur_scale, 'wait': wait_scale}
         return log, scale_args
 
     def _scale_inter(self, log, add_cols):
         # log, scale_args = self.scale_feature(log, 'dur', self.norm_method)
         if self.one_timestamp:
-            log, scale_args = self.scale_feature(log, 'dur', self.norm_method)
+            log, scale_args = self.scale_feature(
+                log, 'dur', self.norm_method, scale_args=self.scale_args)
         else:
-            log, dur_scale = self.scale_feature(log, 'dur', self.norm_method)
-            log, wait_scale = self.scale_feature(log, 'wait', self.norm_method)
+            log, dur_scale = self.scale_feature(
+                log, 'dur', self.norm_method,
+                scale_args=self._fitted_args('dur'))
+            log, wait_scale = self.scale_feature(
+                log, 'wait', self.norm_method,
+                scale_args=self._fitted_args('wait'))
             scale_args = {'dur': dur_scale, 'wait': wait_scale}
         for col in add_cols:
             if col == 'daytime':
                 log, _ = self.scale_feature(log, 'daytime', 'day_secs', True)
             elif col == 'weekday':
                 continue
+            elif self.scale_args is not None:
+                # The scaling of these columns is not exported, refitting
+                # it on other cases would change their meaning
+                raise ValueError(col)
             else:
                 log, _ = self.scale_feature(log, col, self.norm_method, True)
         return log, scale_args
 
+    def _fitted_args(self, feature):
+        if self.scale_args is None:
+            return None
+        return self.scale_args[feature]
+
     # =========================================================================
     # Scale features
     # =========================================================================
     @staticmethod
-    def scale_feature(log, feature, method, replace=False):
+    def scale_feature(log, feature, method, replace=False, scale_args=None):
         """Scales a number given a technique.
         Args:
             log: Event-log to be scaled.
             feature: Feature to be scaled.
             method: Scaling method max, lognorm, normal, per activity.
             replace (optional): replace the original value or keep both.
+            scale_args (optional): scaling arguments of a trained model,
+                when given they are used instead of fitting them on the log.
         Returns:
             Scaleded value between 0 and 1.
         """
+        fitted = scale_args
         scale_args = dict()
         if method == 'lognorm':
             log[feature + '_log'] = np.log1p(log[feature])
-            max_value = np.max(log[feature+'_log'])
-            min_value = np.min(log[feature+'_log'])
+            max_value = (fitted['max_value'] if fitted
+                         else np.max(log[feature+'_log']))
+            min_value = (fitted['min_value'] if fitted
+                         else np.min(log[feature+'_log']))
             log[feature+'_norm'] = np.divide(
                     np.subtract(log[feature+'_log'], min_value), (max_value - min_value))
             log = log.drop((feature + '_log'), axis=1)
             scale_args = {'max_value': max_value, 'min_value': min_value}
         elif method == 'normal':
-            max_value = np.max(log[feature])
-            min_value = np.min(log[feature])
+            max_value = fitted['max_value'] if fitted else np.max(log[feature])
+            min_value = fitted['min_value'] if fitted else np.min(log[feature])
             log[feature+'_norm'] = np.divide(
                     np.subtract(log[feature], min_value), (max_value - min_value))
             scale_args = {'max_value': max_value, 'min_value': min_value}
         elif method == 'standard':
-            mean = np.mean(log[feature])
-            std = np.std(log[feature])
+            mean = fitted['mean'] if fitted else np.mean(log[feature])
+            std = fitted['std'] if fitted else np.std(log[feature])
             log[feature + '_norm'] = np.divide(np.subtract(log[feature], mean),
                                                std)
             scale_args = {'mean': mean, 'std': std}
         elif method == 'max':
-            max_value = np.max(log[feature])
+            max_value = fitted['max_value'] if fitted else np.max(log[feature])
             log[feature + '_norm'] = (np.divide(log[feature], max_value)
                                       if max_value > 0 else 0)
             scale_args = {'max_value': max_value}
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 17:20:14 2026
+
+@author: Manuel Camargo
+"""
+import os
+import json
+import hashlib
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as pf
+
+import readers.log_reader as lr
+
+
+class LogCache():
+    """
+    Columnar cache of the parsed event logs. A log is parsed once and
+    stored as an uncompressed Feather file with datetime64 timestamps,
+    the next reads memory-map that file instead of parsing the log again.
+    The entries are named by the path, size and modification time of the
+    log and by the read options, so a modified log or different read
+    options never reuse a stale entry. When the cache exceeds its size
+    the least recently used entries are removed.
+    """
+
+    def __init__(self, folder=os.path.join('input_files', 'log_cache'),
+                 max_size=10 * 1024**3):
+        """constructor
+        Args:
+            folder (str): cache directory.
+            max_size (int): maximum size of the cache in bytes.
+        """
+        self.folder = folder
+        self.max_size = max_size
+
+    @staticmethod
+    def key(path, read_options):
+        """Hashes the identity of a log file and its read options.
+        Args:
+            path (str): path of the log file.
+            read_options (dict): options of the log reader.
+        Returns:
+            str: hexadecimal digest.
+        """
+        stat = os.stat(path)
+        content = {'path': os.path.abspath(path), 'size': stat.st_size,
+                   'mtime': stat.st_mtime_ns, 'read_options': read_options}
+        return hashlib.sha1(json.dumps(content, sort_keys=True,
+                                       default=str).encode()).hexdigest()
+
+    def read(self, path, read_options):
+        """Returns a log as a DataFrame, parsing it only when it is
+        not in the cache.
+        Args:
+            path (str): path of the log file.
+            read_options (dict): options of the log reader.
+        Returns:
+            DataFrame: parsed log.
+        """
+        entry = os.path.join(self.folder,
+                             self.key(path, read_options) + '.feather')
+        try:
+            table = pf.read_table(entry, memory_map=True)
+            os.utime(entry)
+            return table.to_pandas(split_blocks=True)
+        except (OSError, ValueError):
+            # Missing entry or entry evicted by other process
+            pass
+        log = lr.LogReader(path, read_options)
+        log_df = self.to_columnar(pd.DataFrame(log.data))
+        self.put(entry, log_df)
+        return log_df
+
+    def put(self, entry, log_df):
+        """Writes an entry and evicts the least recently used ones. The
+        entry is written in a temporal file and renamed, in that way other
+        processes never read partial entries.
+        Args:
+            entry (str): path of the entry.
+            log_df (DataFrame): parsed log.
+        """
+        if not os.path.exists(self.folder):
+            os.makedirs(self.folder, exist_ok=True)
+        temp = entry + '.' + str(os.getpid()) + '.tmp'
+        try:
+            pf.write_feather(log_df, temp, compression='uncompressed')
+            os.replace(temp, entry)
+        except (OSError, pa.ArrowException) as e:
+            # Full disk or columns that can not be stored
+            print('The log is not cached:', e)
+        finally:
+            if os.path.exists(temp):
+                os.remove(temp)
+        self.evict(keep=os.path.basename(entry))
+
+    def evict(self, keep=None):
+        """Removes the least recently used entries until the cache
+        fits in its maximum size.
+        Args:
+            keep (str, optional): entry that is never removed.
+        """
+        entries = list()
+        for name in os.listdir(self.folder):
+            if not name.endswith('.feather'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.folder, name))
+            except OSError:
+                # Entry removed by other process
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+        total_size = sum(x[1] for x in entries)
+        for _, size, name in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            if name == keep:
+                continue
+            try:
+                os.remove(os.path.join(self.folder, name))
+            except OSError:
+                continue
+            total_size -= size
+
+    @staticmethod
+    def to_columnar(log_df):
+        """Types the timestamps of a parsed log, the other columns keep
+        the types given by the log reader.
+        Args:
+            log_df (DataFrame): parsed log.
+        Returns:
+            DataFrame: log with datetime64 timestamps.
+        """
+        log_df = log_df.reset_index(drop=True)
+        for column in ['start_timestamp', 'end_timestamp']:
+            if column in log_df.columns:
+                log_df[column] = pd.to_datetime(log_df[column])
+        return log_df
@@ -5,16 +5,22 @@ Created on Tue Jan 26 15:05:36 2021
 @author: Manuel Camargo
 """
 import os
+import sys
 import copy
 import random
 import itertools
 import traceback
 import ast
 
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
 import pandas as pd
 import utils.support as sup
 import utils.slurm_multiprocess as slmp
 
+from model_training import trial_journal as tj
+
 
 class ModelHPCOptimizer():
     """
@@ -34,7 +40,12 @@ class ModelHPCOptimizer():
         if not os.path.exists(self.temp_output):
             os.makedirs(self.temp_output)
             os.makedirs(os.path.join(self.temp_output, 'opt_parms'))
-        self.file_name = sup.file_id(prefix='OP_')
+        # Journal of the trials, used to resume interrupted runs
+        self.journal = tj.TrialJournal(self.temp_output)
+        self.file_name = None
+        if parms.get('resume'):
+            self.file_name = tj.TrialJournal.results_file(self.temp_output)
+        self.file_name = self.file_name or sup.file_id(prefix='OP_')
         # Results file
         if not os.path.exists(os.path.join(self.temp_output, self.file_name)):
             open(os.path.join(self.temp_output, self.file_name), 'w').close()
@@ -46,6 +57,10 @@ class ModelHPCOptimizer():
                     'script': os.path.join('model_training', 
                                             'slurm_trainer.py')}
         self.slurm_workers = 50
+        # Number of trials run concurrently by the local backend
+        self.local_workers = parms.get('local_workers', 4)
+        self._executors = {'slurm': self._execute_slurm,
+                           'local': self._execute_local}
         self.best_output = None
         self.best_parms = dict()
         self.best_loss = 1
@@ -72,13 +87,33 @@ class ModelHPCOptimizer():
                                    model_type=lists[6]))
         def_parms = {
             'imp': parms['imp'], 'file': parms['file_name'],
+            'emb_method': parms.get('emb_method', 'dot_product'),
             'batch_size': parms['batch_size'], 'epochs': parms['epochs'],
-            'one_timestamp': parms['one_timestamp']}
+            'one_timestamp': parms['one_timestamp'],
+            'tensor_store': parms.get('tensor_store', False),
+            'sparse_labels': parms.get('sparse_labels', False),
+            'tf_data': parms.get('tf_data', False),
+            'shuffle_buffer': parms.get('shuffle_buffer', 10000),
+            'halving': parms.get('halving', False),
+            'halving_min_epochs': parms.get('halving_min_epochs', 5),
+            'halving_eta': parms.get('halving_eta', 3),
+            'warm_start': parms.get('warm_start'),
+            'warm_start_trials': parms.get('warm_start_trials', False),
+            'cache_folder': parms.get('cache_folder'),
+            'cache_size': parms.get('cache_size')}
         for config in random.sample(preconfigs, parms['max_eval']):
             space.append({**config, **def_parms})
         return space
 
     def export_params(self):
+        if self.parms.get('resume'):
+            # The configurations sampled by the interrupted run are kept
+            configs_files = sorted(
+                x for x in os.listdir(os.path.join(self.temp_output,
+                                                   'opt_parms'))
+                if x.startswith('CNF_'))
+            if configs_files:
+                return configs_files
         configs_files = list()
         for config in self.space:
             config['ac_index'] = self.ac_index
@@ -94,20 +129,23 @@ class ModelHPCOptimizer():
 
     def execute_trials(self):
         configs_files = self.export_params()
+        # Finished trials are skipped, the interrupted ones are run again
+        trials = self.journal.load()
+        configs_files = [x for x in configs_files
+                         if trials.get(x, {}).get('status', 'running')
+                         == 'running']
         args = [{'p': config, 
                  'f': self.temp_output,
                  'r': self.file_name} for config in configs_files]
-        mprocessor = slmp.HPC_Multiprocess(self.conn,
-                                            args,
-                                            self.temp_output,
-                                            None,
-                                            self.slurm_workers,
-                                            timeout=5)
-        mprocessor.parallelize()
+        executor = self._get_executor(self.parms.get('hpc_backend', 'slurm'))
+        executor(args)
         try:
             self.file_name = os.path.join(self.temp_output, self.file_name)
             results = (pd.read_csv(self.file_name)
-                       .sort_values('loss', ascending=bool))
+                       .sort_values('loss', ascending=True))
+            if 'status' in results.columns:
+                # Pruned trials did not finish their training
+                results = results[results.status != 'pruned']
             result = results.head(1).iloc[0]
             self.best_output = result.output
             self.best_loss = result.loss
@@ -119,3 +157,63 @@ class ModelHPCOptimizer():
             traceback.print_exc()
             pass
 
+    def _get_executor(self, backend):
+        executor = self._executors.get(backend)
+        if not executor:
+            raise ValueError(backend)
+        return executor
+
+    def _execute_slurm(self, args):
+        mprocessor = slmp.HPC_Multiprocess(self.conn,
+                                           args,
+                                           self.temp_output,
+                                           None,
+                                           self.slurm_workers,
+                                           timeout=5)
+        mprocessor.parallelize()
+
+    def _execute_local(self, args):
+        """Runs the trials in a local pool of processes. The cores are
+        split between the concurrent trials capping the TF threads of
+        every process.
+        Args:
+            args (list): arguments of the slurm trainer of every trial.
+        """
+        threads = max(1, (os.cpu_count() or 1) // self.local_workers)
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=self.local_workers,
+                                 mp_context=context,
+                                 initializer=_init_local_worker,
+                                 initargs=(threads,)) as pool:
+            futures = [pool.submit(_run_local_trial, arg) for arg in args]
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    print(e)
+                    traceback.print_exc()
+
+
+def _init_local_worker(threads):
+    # TF threads must be capped before the runtime is initialized
+    os.environ['OMP_NUM_THREADS'] = str(threads)
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(min(2, threads))
+    # The slurm trainer imports its modules relative to model_training
+    sys.path.insert(0, os.path.join(os.getcwd(), 'model_training'))
+
+
+def _run_local_trial(args):
+    """Runs one trial in the same way of a slurm job.
+    Args:
+        args (dict): slurm trainer arguments, parameters file (p),
+            output folder (f) and results file (r).
+    """
+    import tensorflow as tf
+    import slurm_trainer as st
+    argv = list()
+    for key, value in args.items():
+        argv.extend(['-' + key, value])
+    st.SlurmWorker(argv)
+    tf.keras.backend.clear_session()
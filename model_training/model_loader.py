@@ -46,7 +46,8 @@ class ModelLoader():
                                    'cnn_lstm': cnnl._training_model,
                                    'gan': mgan._training_model}
 
-    def train(self, model_type, train_vec, valdn_vec, ac_weights, rl_weights, output_folder):
+    def train(self, model_type, train_vec, valdn_vec, ac_weights, rl_weights, output_folder,
+              warm_start=None):
         loader = self._get_trainer(model_type)
         tf.compat.v1.reset_default_graph()
         return loader(train_vec, 
@@ -54,7 +55,8 @@ class ModelLoader():
                       ac_weights, 
                       rl_weights, 
                       output_folder, 
-                      self.parms)
+                      self.parms,
+                      warm_start=warm_start)
 
     def register_model(self, model_type, trainer):
         try:
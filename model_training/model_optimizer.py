@@ -8,10 +8,16 @@ import os
 import copy
 import ast
 import traceback
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
 import pandas as pd
 import configparser as cp
-from hyperopt import tpe
-from hyperopt import Trials, hp, fmin, STATUS_OK, STATUS_FAIL
+from hyperopt import tpe, base
+from hyperopt import Trials, hp, fmin, space_eval, STATUS_OK, STATUS_FAIL
+from hyperopt.utils import coarse_utcnow
 
 import utils.support as sup
 import readers.log_splitter as ls
@@ -20,6 +26,9 @@ import tensorflow as tf
 from model_training import samples_creator as sc
 from model_training import model_loader as mload
 from model_training import features_manager as feat
+from model_training import tensor_store as ts
+from model_training import preprocessing_cache as pc
+from model_training import trial_journal as tj
 
 
 class ModelOptimizer():
@@ -50,7 +59,11 @@ class ModelOptimizer():
                         response['status'] = STATUS_FAIL
                 return response
             return safety_check
-        
+
+    # Hyperparameters explored by TPE, recorded in the trials journal
+    _choices = ['model_type', 'n_size', 'l_size', 'lstm_act',
+                'dense_act', 'norm_method', 'optim']
+
     def __init__(self, parms, log, ac_index, ac_weights, rl_index, rl_weights):
         """constructor"""
         self.space = self.define_search_space(parms)
@@ -65,16 +78,31 @@ class ModelOptimizer():
         self.temp_output = parms['output']
         if not os.path.exists(self.temp_output):
             os.makedirs(self.temp_output)
-        self.file_name = os.path.join(self.temp_output, 
-                                      sup.file_id(prefix='OP_'))
+        # Journal of the trials, used to resume interrupted runs
+        self.journal = tj.TrialJournal(self.temp_output)
+        results_file = None
+        if parms.get('resume'):
+            results_file = tj.TrialJournal.results_file(self.temp_output)
+        self.file_name = os.path.join(
+            self.temp_output, results_file or sup.file_id(prefix='OP_'))
         # Results file
         if not os.path.exists(self.file_name):
             open(self.file_name, 'w').close()
         # Trials object to track progress
         self.bayes_trials = Trials()
+        if parms.get('resume'):
+            self._resume_trials()
+        # Serializes the results file writing of concurrent trials
+        self._csv_lock = contextlib.nullcontext()
         self.best_output = None
         self.best_parms = dict()
         self.best_loss = 1
+        # Preprocessing cache shared by the trials
+        self.cache = None
+        if parms.get('cache_folder'):
+            self.cache = pc.PreprocessingCache(parms['cache_folder'],
+                                               parms['cache_size'])
+            self.log_hash = self.cache.log_hash(self.log, ac_index, rl_index)
         
     @staticmethod
     def define_search_space(parms):
@@ -87,85 +115,138 @@ class ModelOptimizer():
                  'optim': hp.choice('optim', parms['optim']),
                  'imp': parms['imp'], 'file': parms['file_name'],
                  'batch_size': parms['batch_size'], 'epochs': parms['epochs'],
-                 'one_timestamp': parms['one_timestamp']}
+                 'one_timestamp': parms['one_timestamp'],
+                 'tensor_store': parms.get('tensor_store', False),
+                 'sparse_labels': parms.get('sparse_labels', False),
+                 'tf_data': parms.get('tf_data', False),
+                 'shuffle_buffer': parms.get('shuffle_buffer', 10000),
+                 'halving': parms.get('halving', False),
+                 'halving_min_epochs': parms.get('halving_min_epochs', 5),
+                 'halving_eta': parms.get('halving_eta', 3),
+                 'warm_start': parms.get('warm_start'),
+                 'warm_start_trials': parms.get('warm_start_trials', False)}
         return space
 
-    def execute_trials(self):
-        def exec_pipeline(trial_stg):
-            print(trial_stg)
-            status = STATUS_OK
-            # Path redefinition
-            rsp = self._temp_path_redef(trial_stg, status=status)
-            status = rsp['status']
-            trial_stg = rsp['values'] if status == STATUS_OK else trial_stg
-            # Model definition
-            model_def = self.read_model_definition(trial_stg['model_type'])
+    def _exec_pipeline(self, trial_stg):
+        print(trial_stg)
+        status = STATUS_OK
+        # Path redefinition
+        rsp = self._temp_path_redef(trial_stg, status=status)
+        status = rsp['status']
+        trial_stg = rsp['values'] if status == STATUS_OK else trial_stg
+        self.journal.start(trial_stg['output'],
+                           {k: trial_stg[k] for k in self._choices})
+        # Model definition
+        model_def = self.read_model_definition(trial_stg['model_type'])
+        # Reuse the preprocessing of previous trials when cached
+        cached = None
+        if self.cache is not None:
+            key = self.cache.key(self.log_hash, trial_stg, model_def)
+            cached = self.cache.get(
+                key, mmap_mode='r' if trial_stg['tensor_store'] else None)
+        if cached is None:
             # Scale values
-            log, trial_stg = self._scale_values(self.log, trial_stg, model_def)
+            log, trial_stg = self._scale_values(
+                self.log, trial_stg, model_def)
             # split validation
             log_valdn, log_train = self.split_timeline(
                 0.8, log, trial_stg['one_timestamp'])
-            print('train split size:', len(log_train))
-            print('valdn split size:', len(log_valdn))
+        else:
+            trial_stg['scale_args'] = cached['scale_args']
+            log_train, log_valdn = cached['log_train'], cached['log_valdn']
+        print('train split size:', len(log_train))
+        print('valdn split size:', len(log_valdn))
+        # The splits are vectorized directly in memory-mapped files
+        store = None
+        if trial_stg['tensor_store'] and not trial_stg['tf_data']:
+            store = ts.TensorStore(
+                os.path.join(trial_stg['output'], 'tensors'))
+        if (cached is not None and 'train_vec' in cached and
+                not trial_stg['tf_data']):
+            train_vec, valdn_vec = cached['train_vec'], cached['valdn_vec']
+        else:
             # Vectorize input
             vectorizer = sc.SequencesCreator(
                 self.parms['read_options']['one_timestamp'], 
                 self.ac_index, self.rl_index)
             vectorizer.register_vectorizer(trial_stg['model_type'],
                                            model_def['vectorizer'])
-            train_vec = vectorizer.vectorize(trial_stg['model_type'],
-                                             log_train,
-                                             trial_stg,
-                                             model_def['additional_columns'])
-            valdn_vec = vectorizer.vectorize(trial_stg['model_type'],
-                                             log_valdn,
-                                             trial_stg,
-                                             model_def['additional_columns'])
-            # Train
-            m_loader = mload.ModelLoader(trial_stg)
-            m_loader.register_model(trial_stg['model_type'],
-                                    model_def['trainer'])
-            tf.compat.v1.reset_default_graph()
-            model = m_loader.train(trial_stg['model_type'],
-                                   train_vec, 
-                                   valdn_vec,
-                                   self.ac_weights,
-                                   self.rl_weights,
-                                   trial_stg['output'])
-            # evaluation
-            x_input = {'ac_input': valdn_vec['prefixes']['activities'],
-                       'rl_input': valdn_vec['prefixes']['roles'],
-                       't_input': valdn_vec['prefixes']['times']}
-            if trial_stg['model_type'] in ['shared_cat_cx', 
-                                           'concatenated_cx',
-                                           'shared_cat_gru_cx', 
-                                           'concatenated_gru_cx']:
-                x_input['inter_input']= valdn_vec['prefixes']['inter_attr']
-            acc = model.evaluate(
-                x=x_input,
-                y={'act_output': valdn_vec['next_evt']['activities'],
-                   'role_output': valdn_vec['next_evt']['roles'],
-                   'time_output': valdn_vec['next_evt']['times']},
-                return_dict=True)
-            rsp = self._define_response(trial_stg, status, acc['loss'])
-            print("-- End of trial --")
-            return rsp
+            train_vec = vectorizer.vectorize(
+                trial_stg['model_type'], log_train, trial_stg,
+                model_def['additional_columns'], store, 'train')
+            valdn_vec = vectorizer.vectorize(
+                trial_stg['model_type'], log_valdn, trial_stg,
+                model_def['additional_columns'], store, 'valdn')
+            if self.cache is not None:
+                stream = trial_stg['tf_data']
+                if cached is None:
+                    self.cache.put(key, trial_stg['scale_args'],
+                                   log_train, log_valdn,
+                                   None if stream else train_vec,
+                                   None if stream else valdn_vec)
+                elif not stream:
+                    # Entry of a streamed trial, without tensors
+                    self.cache.put_tensors(key, train_vec, valdn_vec)
+        # Vectorizers without block writing, e.g. gan, are moved afterwards
+        if store is not None and not ts.is_stored(train_vec):
+            train_vec = store.save('train', train_vec)
+            valdn_vec = store.save('valdn', valdn_vec)
+        # Train
+        m_loader = mload.ModelLoader(trial_stg)
+        m_loader.register_model(trial_stg['model_type'],
+                                model_def['trainer'])
+        tf.compat.v1.reset_default_graph()
+        model = m_loader.train(trial_stg['model_type'],
+                               train_vec, 
+                               valdn_vec,
+                               self.ac_weights,
+                               self.rl_weights,
+                               trial_stg['output'],
+                               warm_start=self._warm_start(trial_stg))
+        # evaluation
+        acc = model.evaluate(
+            **ts.evaluation_data(valdn_vec, trial_stg['batch_size']),
+            return_dict=True)
+        if store is not None:
+            del train_vec, valdn_vec
+            store.clear()
+        rsp = self._define_response(
+            trial_stg, status, acc['loss'],
+            pruned=getattr(model, 'pruned_epoch', None) is not None)
+        self.journal.finish(trial_stg['output'], rsp['status'],
+                            rsp.get('loss'), rsp['output'],
+                            pruned=rsp['pruned'])
+        print("-- End of trial --")
+        return rsp
 
+    def execute_trials(self):
         # Optimize
-        best = fmin(fn=exec_pipeline,
-                    space=self.space,
-                    algo=tpe.suggest,
-                    max_evals=self.parms['max_eval'],
-                    trials=self.bayes_trials,
-                    show_progressbar=False)
+        if self.parms.get('opt_workers', 1) > 1:
+            self._parallel_fmin(self.parms['opt_workers'])
+        else:
+            # The interrupted trials of a resumed run are queued as new
+            # docs, fmin evaluates them before proposing new ones
+            fmin(fn=self._exec_pipeline,
+                 space=self.space,
+                 algo=tpe.suggest,
+                 max_evals=self.parms['max_eval'],
+                 trials=self.bayes_trials,
+                 show_progressbar=False)
         # Save results
         try:
             results = (pd.DataFrame(self.bayes_trials.results)
-                       .sort_values('loss', ascending=bool))
-            result = results[results.status=='ok'].head(1).iloc[0]
+                       .sort_values('loss', ascending=True))
+            # Pruned trials are only informative for TPE
+            results = results[(results.status=='ok') & (results.pruned != True)]
+            result = results.head(1).iloc[0]
             self.best_output = result.output
             self.best_loss = result.loss
-            self.best_parms = {k: self.parms[k][v] for k,v in best.items()}
+            # Configuration of the selected trial, the argmin of the
+            # trials can be a pruned one
+            trial = next(x for x in self.bayes_trials.trials
+                         if x['result'].get('output') == result.output)
+            self.best_parms = {k: self.parms[k][v[0]]
+                               for k, v in trial['misc']['vals'].items()}
             opt_res = pd.read_csv(self.file_name)
             opt_res = opt_res[opt_res.output==result.output].iloc[0]
             self.best_parms['scale_args'] = ast.literal_eval(opt_res.scale_args)
@@ -173,6 +254,164 @@ class ModelOptimizer():
             print(e)
             pass
 
+    def _parallel_fmin(self, workers):
+        """Asynchronous TPE, the trials are run concurrently in a pool of
+        processes and a new configuration is proposed every time a
+        worker becomes free. The trials being run are taken as not yet
+        evaluated by TPE.
+        Args:
+            workers (int): number of concurrent trials.
+        Returns:
+            dict: best configuration indexes, as returned by fmin.
+        """
+        domain = base.Domain(self._exec_pipeline, self.space)
+        rstate = np.random.default_rng()
+        # The cores are split between the workers
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        context = multiprocessing.get_context('spawn')
+        # The workers read the log and the embeddings once from the run
+        # folder instead of receiving a copy of the optimizer
+        state_file = os.path.join(self.temp_output, 'worker_state.pkl')
+        pd.to_pickle({'log': self.log,
+                      'ac_index': self.ac_index, 'ac_weights': self.ac_weights,
+                      'rl_index': self.rl_index, 'rl_weights': self.rl_weights,
+                      'log_hash': getattr(self, 'log_hash', None)},
+                     state_file)
+        running = dict()
+        # Resumed trials are counted, the interrupted ones are run first
+        requeued = [x for x in self.bayes_trials._dynamic_trials
+                    if x['state'] == base.JOB_STATE_NEW]
+        submitted = len(self.bayes_trials._dynamic_trials) - len(requeued)
+        with ProcessPoolExecutor(max_workers=workers,
+                                 mp_context=context,
+                                 initializer=_init_worker,
+                                 initargs=(type(self), self.parms,
+                                           self.file_name, state_file,
+                                           context.Lock(), threads)) as pool:
+            while submitted < self.parms['max_eval'] or running:
+                # Propose configurations for the free workers
+                while (len(running) < workers and
+                       submitted < self.parms['max_eval']):
+                    if requeued:
+                        docs = [requeued.pop(0)]
+                        docs[0]['state'] = base.JOB_STATE_RUNNING
+                    else:
+                        new_ids = self.bayes_trials.new_trial_ids(1)
+                        self.bayes_trials.refresh()
+                        docs = tpe.suggest(new_ids, domain, self.bayes_trials,
+                                           rstate.integers(2**31 - 1))
+                        for doc in docs:
+                            doc['state'] = base.JOB_STATE_RUNNING
+                        self.bayes_trials.insert_trial_docs(docs)
+                    self.bayes_trials.refresh()
+                    trial_stg = space_eval(
+                        self.space,
+                        {k: v[0] for k, v in docs[0]['misc']['vals'].items()})
+                    running[pool.submit(_run_trial, trial_stg)] = docs[0]
+                    submitted += 1
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    doc = running.pop(future)
+                    try:
+                        doc['result'] = future.result()
+                        doc['state'] = base.JOB_STATE_DONE
+                    except Exception as e:
+                        print(e)
+                        traceback.print_exc()
+                        doc['result'] = {'status': STATUS_FAIL}
+                        doc['state'] = base.JOB_STATE_ERROR
+                    doc['refresh_time'] = coarse_utcnow()
+                self.bayes_trials.refresh()
+        os.remove(state_file)
+        return self.bayes_trials.argmin
+
+    @classmethod
+    def worker_optimizer(cls, parms, file_name, state_file, lock):
+        """Optimizer of the trials run by a worker process, it only
+        evaluates trials, the run is driven by the parent optimizer.
+        Args:
+            parms (dict): settings of the run.
+            file_name (str): results file of the run.
+            state_file (str): log, indexes and embeddings of the run.
+            lock (Lock): lock of the results file.
+        Returns:
+            ModelOptimizer: optimizer without trials.
+        """
+        state = pd.read_pickle(state_file)
+        optimizer = cls.__new__(cls)
+        optimizer.space = cls.define_search_space(parms)
+        optimizer.log = state['log']
+        optimizer.ac_index = state['ac_index']
+        optimizer.ac_weights = state['ac_weights']
+        optimizer.rl_index = state['rl_index']
+        optimizer.rl_weights = state['rl_weights']
+        optimizer.parms = parms
+        optimizer.temp_output = parms['output']
+        optimizer.journal = tj.TrialJournal(optimizer.temp_output)
+        optimizer.file_name = file_name
+        optimizer._csv_lock = lock
+        optimizer.cache = None
+        if parms.get('cache_folder'):
+            optimizer.cache = pc.PreprocessingCache(parms['cache_folder'],
+                                                    parms['cache_size'])
+            optimizer.log_hash = state['log_hash']
+        return optimizer
+
+    def _resume_trials(self):
+        """Rebuilds the trials of an interrupted run from its journal.
+        The finished trials are loaded with their results, so TPE goes on
+        from them, and the trials that were running are queued again.
+        """
+        # The requeued trials were run again as new trials
+        records = {k: v for k, v in self.journal.load().items()
+                   if v['status'] != 'requeued'}
+        tids = self.bayes_trials.new_trial_ids(len(records))
+        specs, results, miscs = list(), list(), list()
+        for tid, record in zip(tids, records.values()):
+            specs.append(None)
+            if record['status'] == 'running':
+                results.append({'status': 'new'})
+            else:
+                results.append({'loss': record['loss'],
+                                'status': record['status'],
+                                'output': record['output'],
+                                'pruned': record.get('pruned', False)})
+            miscs.append({'tid': tid, 'cmd': None, 'workdir': None,
+                          'idxs': {k: [tid] for k in record['config']},
+                          'vals': {k: [self.parms[k].index(v)]
+                                   for k, v in record['config'].items()}})
+        docs = self.bayes_trials.new_trial_docs(tids, specs, results, miscs)
+        for doc, (trial, record) in zip(docs, records.items()):
+            if record['status'] == 'running':
+                # The trial is run again in a new folder
+                self.journal.finish(trial, 'requeued')
+            else:
+                doc['state'] = base.JOB_STATE_DONE
+        self.bayes_trials.insert_trial_docs(docs)
+        self.bayes_trials.refresh()
+
+    def _warm_start(self, settings):
+        """Defines the checkpoint that initializes the trial, a previous
+        model of the log or the best trial of the run with the same model
+        type and n-gram size.
+        Returns:
+            dict: warm-start arguments of the trainer, None to train from
+            a random initialization.
+        """
+        checkpoint = settings.get('warm_start')
+        if not checkpoint and settings.get('warm_start_trials', False):
+            record = self.journal.best_trial(model_type=settings['model_type'],
+                                             n_size=settings['n_size'])
+            if record is not None:
+                checkpoint = os.path.join(
+                    record['output'],
+                    os.path.splitext(settings['file'])[0] + '.h5')
+        if not checkpoint:
+            return None
+        return {'checkpoint': checkpoint,
+                'ac_index': self.ac_index,
+                'rl_index': self.rl_index}
+
     @Decorators.safe_exec
     def _temp_path_redef(self, settings, **kwargs) -> dict:
         # Paths redefinition
@@ -205,12 +444,16 @@ class ModelOptimizer():
                 'scale_args': parms['scale_args'],
                 'output': parms['output']}
         response['output'] = parms['output']
+        response['pruned'] = kwargs.get('pruned', False)
         if status == STATUS_OK:
             response['loss'] = loss
             response['status'] = status if loss > 0 else STATUS_FAIL
+            # Pruned trials keep their partial loss as result for TPE
+            pruned = response['pruned'] and response['status'] == STATUS_OK
             measurements.append({**{'loss': loss,
                                     'sim_metric': 'val_loss', 
-                                    'status': response['status']},
+                                    'status': ('pruned' if pruned 
+                                               else response['status'])},
                                  **data})
         else:
             response['status'] = status
@@ -218,10 +461,11 @@ class ModelOptimizer():
                                     'sim_metric': 'val_loss',
                                     'status': response['status']},
                                  **data})
-        if os.path.getsize(self.file_name) > 0:
-            sup.create_csv_file(measurements, self.file_name, mode='a')
-        else:
-            sup.create_csv_file_header(measurements, self.file_name)
+        with self._csv_lock:
+            if os.path.getsize(self.file_name) > 0:
+                sup.create_csv_file(measurements, self.file_name, mode='a')
+            else:
+                sup.create_csv_file_header(measurements, self.file_name)
         return response
 
     @staticmethod
@@ -270,3 +514,24 @@ class ModelOptimizer():
         model_def['trainer'] = Config.get(
             model_type, 'trainer')
         return model_def
+
+
+# Optimizer of the trials run by a worker process
+_optimizer = None
+
+
+def _init_worker(optimizer_class, parms, file_name, state_file, lock,
+                 threads):
+    global _optimizer
+    # TF threads must be capped before the runtime is initialized
+    os.environ['OMP_NUM_THREADS'] = str(threads)
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(min(2, threads))
+    _optimizer = optimizer_class.worker_optimizer(parms, file_name,
+                                                  state_file, lock)
+
+
+def _run_trial(trial_stg):
+    rsp = _optimizer._exec_pipeline(trial_stg)
+    tf.keras.backend.clear_session()
+    return rsp
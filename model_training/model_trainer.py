@@ -5,18 +5,17 @@ Created on Thu Mar 12 15:07:19 2020
 @author: Manuel Camargo
 """
 import os
-import csv
 
 import pandas as pd
-import numpy as np
 import shutil
 
-import readers.log_reader as lr
 import utils.support as sup
 import readers.log_splitter as ls
 
 from model_training.features_manager import FeaturesMannager as feat
 from model_training import embedding_training as em
+from model_training import embedding_store as es
+from model_training import log_cache as lc
 from model_training import model_optimizer as op
 from model_training import model_hpc_optimizer as hpc_op
 
@@ -46,7 +45,9 @@ class ModelTrainer():
         # Preprocess the event-log
         self.preprocess(params)
         # Train model
-        params['output'] = os.path.join('output_files', sup.folder_id())
+        # An interrupted run goes on in its own folder
+        params['output'] = (params.get('resume') or
+                            os.path.join('output_files', sup.folder_id()))
         if params['opt_method'] == 'rand_hpc':
             optimizer = hpc_op.ModelHPCOptimizer(params, 
                                                  self.log, 
@@ -76,27 +77,27 @@ class ModelTrainer():
         # split validation
         self.split_timeline(0.8, params['one_timestamp'])
         # Load embedded matrix
-        ac_emb_name = 'ac_' + params['file_name'].split('.')[0]+'.emb'
-        rl_emb_name = 'rl_' + params['file_name'].split('.')[0]+'.emb'
-        if os.path.exists(os.path.join('input_files',
-                                       'embedded_matix',
-                                       ac_emb_name)):
-            self.ac_weights = self.load_embedded(self.index_ac, ac_emb_name)
-            self.rl_weights = self.load_embedded(self.index_rl, rl_emb_name)
-        else:
-            em.training_model(params,
-                              self.log,
-                              self.ac_index, self.index_ac,
-                              self.rl_index, self.index_rl)
-            self.ac_weights = self.load_embedded(self.index_ac, ac_emb_name)
-            self.rl_weights = self.load_embedded(self.index_rl, rl_emb_name)
+        store = es.EmbeddingStore()
+        method = params.get('emb_method', 'dot_product')
+        weights = store.load(params['file_name'],
+                             self.index_ac, self.index_rl, method)
+        if weights is None and method == 'dot_product':
+            # CSV matrices of the former versions
+            weights = store.import_csv(params['file_name'],
+                                       self.index_ac, self.index_rl, method)
+        if weights is None:
+            weights = em.training_model(params,
+                                        self.log,
+                                        self.ac_index, self.index_ac,
+                                        self.rl_index, self.index_rl)
+        self.ac_weights, self.rl_weights = weights
 
     @staticmethod
     def load_log(params):
         params['read_options']['filter_d_attrib'] = False
-        log = lr.LogReader(os.path.join('input_files', params['file_name']),
-                           params['read_options'])
-        log_df = pd.DataFrame(log.data)
+        log_df = lc.LogCache().read(
+            os.path.join('input_files', params['file_name']),
+            params['read_options'])
         if set(['Unnamed: 0', 'role']).issubset(set(log_df.columns)):
             log_df.drop(columns=['Unnamed: 0', 'role'], inplace=True)
         log_df = log_df[~log_df.task.isin(['Start', 'End'])]
@@ -168,26 +169,6 @@ class ModelTrainer():
 
 
 
-    @staticmethod
-    def load_embedded(index, filename):
-        """Loading of the embedded matrices.
-        parms:
-            index (dict): index of activities or roles.
-            filename (str): filename of the matrix file.
-        Returns:
-            numpy array: array of weights.
-        """
-        weights = list()
-        input_folder = os.path.join('input_files', 'embedded_matix')
-        with open(os.path.join(input_folder, filename), 'r') as csvfile:
-            filereader = csv.reader(csvfile, delimiter=',', quotechar='"')
-            for row in filereader:
-                cat_ix = int(row[0])
-                if index[cat_ix] == row[1].strip():
-                    weights.append([float(x) for x in row[2:]])
-            csvfile.close()
-        return np.array(weights)
-
     def export_parms(self, output_folder, parms):
         if not os.path.exists(os.path.join(output_folder, 'parameters')):
             os.makedirs(os.path.join(output_folder, 'parameters'))
@@ -206,4 +187,8 @@ class ModelTrainer():
                                           'test_log.csv'),
                              index=False,
                              encoding='utf-8')
+        # Roles of the resources, used to update the model with new cases
+        (self.log[['user', 'role']].drop_duplicates()
+         .to_csv(os.path.join(output_folder, 'parameters', 'resources.csv'),
+                 index=False, encoding='utf-8'))
         
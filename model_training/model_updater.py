@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 16:21:05 2026
+
+@author: Manuel Camargo
+"""
+import os
+import json
+import shutil
+import configparser as cp
+from datetime import datetime
+
+import pandas as pd
+
+import utils.support as sup
+
+from tensorflow.keras.models import load_model
+
+from model_training import samples_creator as sc
+from model_training import tensor_store as ts
+from model_training import log_cache as lc
+from model_training.features_manager import FeaturesMannager as feat
+
+
+def model_folder(output_route):
+    """Folder of the current model and its parameters. Every update
+    writes the pair in its own folder of output_route/updates and then
+    switches the pointer file, so the readers never mix a model with the
+    parameters of another one.
+    Args:
+        output_route (str): output folder of the trained model.
+    Returns:
+        str: output_route or the folder of the last update.
+    """
+    pointer = os.path.join(output_route, 'updates', 'current')
+    if not os.path.exists(pointer):
+        return output_route
+    with open(pointer) as file:
+        return os.path.join(output_route, 'updates', file.read().strip())
+
+
+class ModelUpdater():
+    """
+    Fine-tunes a trained model with a batch of new completed cases. The
+    cases are scaled and vectorized with the indexes and scaling arguments
+    of the model, and the model and its parameters are replaced only when
+    the update finishes.
+    """
+
+    def __init__(self, params):
+        """constructor"""
+        self.output_route = os.path.join('output_files', params['folder'])
+        self.model_folder = model_folder(self.output_route)
+        self.model_name = os.path.join(self.model_folder, params['model_file'])
+        self.parms = params
+        self.load_parameters()
+        self.model = load_model(self.model_name)
+        # The targets are vectorized as the model was trained
+        self.parms['sparse_labels'] = 'sparse' in str(self.model.loss)
+        self.model_def = self.read_model_definition(self.parms['model_type'])
+        self.log = self.load_log(params)
+        self.log = self.add_indexes(self.log)
+        if self.log.empty:
+            print('No cases to update the model')
+            return
+        vec = self.vectorize(self.log)
+        self.update(vec)
+        self.export(self.model)
+
+    def load_parameters(self):
+        # Loading of parameters from training
+        path = os.path.join(self.model_folder,
+                            'parameters',
+                            'model_parameters.json')
+        with open(path) as file:
+            data = json.load(file)
+        self.data = data
+        self.parms = {**self.parms, **data}
+        # The timestamps are the ones the model was trained with, the
+        # scaling arguments of the two timestamps logs are nested
+        self.parms['one_timestamp'] = data.get(
+            'one_timestamp', 'dur' not in data['scale_args'])
+        self.parms['read_options']['one_timestamp'] = self.parms['one_timestamp']
+        if self.parms['one_timestamp']:
+            self.parms['scale_args'] = {
+                k: float(v) for k, v in data['scale_args'].items()}
+        else:
+            self.parms['scale_args'] = {
+                key: {k: float(v) for k, v in value.items()}
+                for key, value in data['scale_args'].items()}
+        self.ac_index = {v: int(k) for k, v in data['index_ac'].items()}
+        self.rl_index = {v: int(k) for k, v in data['index_rl'].items()}
+
+    @staticmethod
+    def load_log(params):
+        params['read_options']['filter_d_attrib'] = False
+        log_df = lc.LogCache().read(
+            os.path.join('input_files', params['file_name']),
+            params['read_options'])
+        if set(['Unnamed: 0', 'role']).issubset(set(log_df.columns)):
+            log_df.drop(columns=['Unnamed: 0', 'role'], inplace=True)
+        log_df = log_df[~log_df.task.isin(['Start', 'End'])]
+        return log_df
+
+    def add_indexes(self, log):
+        """Adds the roles of the resources and the indexes of the model to
+        the new cases. The cases with activities or resources unknown by
+        the model are discarded, since the model can not represent them.
+        Args:
+            log (DataFrame): new cases.
+        Returns:
+            DataFrame: new cases with the role, ac_index and rl_index columns.
+        """
+        log = log.merge(self.load_resources(), on='user', how='left')
+        log['ac_index'] = log.task.map(self.ac_index)
+        log['rl_index'] = log.role.map(self.rl_index)
+        unknown = log[log.ac_index.isna() | log.rl_index.isna()].caseid.unique()
+        if len(unknown) > 0:
+            print('Cases discarded by unknown activities or resources:',
+                  len(unknown))
+        log = log[~log.caseid.isin(unknown)].reset_index(drop=True)
+        log['ac_index'] = log.ac_index.astype(int)
+        log['rl_index'] = log.rl_index.astype(int)
+        return log
+
+    def load_resources(self):
+        path = os.path.join(self.output_route, 'parameters', 'resources.csv')
+        if not os.path.exists(path):
+            # Models exported without the resources table
+            path = os.path.join(self.output_route, 'parameters', 'test_log.csv')
+        resources = pd.read_csv(path, usecols=['user', 'role'])
+        return resources.drop_duplicates(subset='user')
+
+    def vectorize(self, log):
+        inp = feat(self.parms)
+        inp.register_scaler(self.parms['model_type'], self.model_def['scaler'])
+        log, _ = inp.calculate(log, self.model_def['additional_columns'],
+                               scale_args=self.parms['scale_args'])
+        vectorizer = sc.SequencesCreator(self.parms['one_timestamp'],
+                                         self.ac_index, self.rl_index)
+        vectorizer.register_vectorizer(self.parms['model_type'],
+                                       self.model_def['vectorizer'])
+        return vectorizer.vectorize(self.parms['model_type'], log, self.parms,
+                                    self.model_def['additional_columns'])
+
+    def update(self, vec):
+        """Fine-tunes the model with the new cases for a bounded number of
+        steps, keeping the state of its optimizer.
+        Args:
+            vec (dict): vectorized new cases.
+        """
+        model = self.model
+        batch_size = self.parms['batch_size']
+        sequence = ts.VecSequence(vec, batch_size, shuffle=True)
+        steps = min(len(sequence), self.parms['update_steps'])
+        epochs = max(1, self.parms['update_steps'] // len(sequence))
+        before = model.evaluate(**ts.evaluation_data(vec, batch_size),
+                                return_dict=True, verbose=0)
+        model.fit(sequence, steps_per_epoch=steps, epochs=epochs, verbose=2)
+        after = model.evaluate(**ts.evaluation_data(vec, batch_size),
+                               return_dict=True, verbose=0)
+        print('Loss on the new cases:', before['loss'], '->', after['loss'])
+
+    def export(self, model):
+        """Writes the model and its parameters in a new folder of
+        output_route/updates and points the readers to it by renaming the
+        pointer file, in that way a failed update never leaves a partial
+        model or a model with the parameters of another one. The previous
+        folder is kept for the readers that are still using it.
+        Args:
+            model (Model): updated model.
+        """
+        data = self.data
+        data['max_trace_size'] = int(max(
+            data.get('max_trace_size', 0),
+            self.log.groupby('caseid')['task'].count().max()))
+        data.setdefault('updates', list()).append(
+            {'file_name': self.parms['file_name'],
+             'cases': int(self.log.caseid.nunique()),
+             'date': datetime.now().strftime('%Y-%m-%dT%H:%M:%S')})
+        data['one_timestamp'] = self.parms['one_timestamp']
+        updates = os.path.join(self.output_route, 'updates')
+        version = (datetime.now().strftime('%Y%m%d_%H%M%S_') +
+                   str(os.getpid()))
+        folder = os.path.join(updates, version)
+        os.makedirs(os.path.join(folder, 'parameters'))
+        model.save(os.path.join(folder, self.parms['model_file']))
+        with open(os.path.join(folder, 'parameters', 'model_parameters.json'),
+                  'w') as file:
+            json.dump(data, file, default=float)
+            file.flush()
+            os.fsync(file.fileno())
+        pointer = os.path.join(updates, 'current')
+        temp_pointer = pointer + '.' + str(os.getpid()) + '.tmp'
+        with open(temp_pointer, 'w') as file:
+            file.write(version)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_pointer, pointer)
+        previous = os.path.basename(self.model_folder)
+        for name in os.listdir(updates):
+            path = os.path.join(updates, name)
+            if os.path.isdir(path) and name not in [version, previous]:
+                shutil.rmtree(path, ignore_errors=True)
+
+    @staticmethod
+    def read_model_definition(model_type):
+        model_def = dict()
+        Config = cp.ConfigParser(interpolation=None)
+        Config.read('models_spec.ini')
+        #File name with extension
+        model_def['additional_columns'] = sup.reduce_list(
+            Config.get(model_type,'additional_columns'), dtype='str')
+        model_def['scaler'] = Config.get(
+            model_type, 'scaler')
+        model_def['vectorizer'] = Config.get(
+            model_type, 'vectorizer')
+        return model_def
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 16:40:27 2026
+
+@author: Manuel Camargo
+"""
+import os
+from importlib import util
+
+
+# Modules shared by the model trainers, loaded from their files when the
+# trainers are run outside of the package
+def _load(name, *path):
+    spec = util.spec_from_file_location(
+        name, os.path.join(os.getcwd(), *path))
+    module = util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+try:
+    from support_modules.callbacks import halving_callback as hc
+except:
+    hc = _load('halving_callback',
+               'support_modules', 'callbacks', 'halving_callback.py')
+
+try:
+    from model_training import tensor_store as ts
+except:
+    ts = _load('tensor_store', 'model_training', 'tensor_store.py')
+
+try:
+    from model_training import warm_start as ws
+except:
+    ws = _load('warm_start', 'model_training', 'warm_start.py')
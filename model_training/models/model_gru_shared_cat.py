@@ -22,9 +22,21 @@ except:
     tc = util.module_from_spec(spec)
     spec.loader.exec_module(tc)
 
+try:
+    from model_training.models._compat import hc, ts, ws
+except:
+    from importlib import util
+    spec = util.spec_from_file_location(
+        '_compat', 
+        os.path.join(os.getcwd(), 'model_training', 'models', '_compat.py'))
+    _compat = util.module_from_spec(spec)
+    spec.loader.exec_module(_compat)
+    hc, ts, ws = _compat.hc, _compat.ts, _compat.ws
+
 
 def _training_model(train_vec, valdn_vec, ac_weights, rl_weights, 
-                    output_folder, args, log_path=None):
+                    output_folder, args, log_path=None,
+                    warm_start=None):
     """Example function with types documented in the docstring.
     Args:
         param1 (int): The first parameter.
@@ -141,10 +153,18 @@ def _training_model(train_vec, valdn_vec, ac_weights, rl_weights,
     elif args['optim'] == 'Adagrad':
         opt = Adagrad(learning_rate=0.01)
 
-    model.compile(loss={'act_output': 'categorical_crossentropy',
-                        'role_output': 'categorical_crossentropy',
+    # Sparse labels are class indexes instead of one-hot vectors
+    cat_loss = ('sparse_categorical_crossentropy'
+                if args.get('sparse_labels', False)
+                else 'categorical_crossentropy')
+    model.compile(loss={'act_output': cat_loss,
+                        'role_output': cat_loss,
                         'time_output': 'mae'}, optimizer=opt)
 
+    if warm_start:
+        # Initialization from the checkpoint of a previous model
+        ws.transfer_weights(model, **warm_start)
+
     model.summary()
 
     early_stopping = EarlyStopping(monitor='val_loss', patience=40)
@@ -174,21 +194,14 @@ def _training_model(train_vec, valdn_vec, ac_weights, rl_weights,
                                    min_lr=0)
 
     batch_size = args['batch_size']
-    model.fit({'ac_input': train_vec['prefixes']['activities'],
-                'rl_input': train_vec['prefixes']['roles'],
-                't_input': train_vec['prefixes']['times']},
-              {'act_output': train_vec['next_evt']['activities'],
-                'role_output': train_vec['next_evt']['roles'],
-                'time_output': train_vec['next_evt']['times']},
-              validation_data=(
-                  {'ac_input': valdn_vec['prefixes']['activities'],
-                   'rl_input': valdn_vec['prefixes']['roles'],
-                   't_input': valdn_vec['prefixes']['times']},
-                  {'act_output': valdn_vec['next_evt']['activities'],
-                   'role_output': valdn_vec['next_evt']['roles'],
-                   'time_output': valdn_vec['next_evt']['times']}),
+    callbacks = [early_stopping, model_checkpoint, lr_reducer, cb]
+    if args.get('halving', False):
+        # Successive halving pruning of the optimization trials
+        callbacks.append(hc.SuccessiveHalvingCallback(
+            output_folder, args['halving_min_epochs'], args['halving_eta'],
+            '{}_{}'.format(args['model_type'], args['n_size'])))
+    model.fit(**ts.fit_data(train_vec, valdn_vec, batch_size),
               verbose=2,
-              callbacks=[early_stopping, model_checkpoint, lr_reducer, cb],
-              batch_size=batch_size,
+              callbacks=callbacks,
               epochs=args['epochs'])
     return model
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Wed Oct 14 16:05:47 2026
+
+@author: Manuel Camargo
+"""
+import numpy as np
+import tensorflow as tf
+
+
+class NgramDataset():
+    """
+    Lazy vectorized split. The traces are kept as flat series, one per
+    column, and the n-grams are gathered batch by batch in a tf.data
+    pipeline, so the memory used is bounded by the series and the
+    shuffle and prefetch buffers instead of the number of samples.
+    The 'prefixes' and 'next_evt' keys return the shapes of the tensors,
+    that is what the model builders read from a vectorized split.
+    """
+
+    def __init__(self, series, window_pos, n_size, parms, num_classes):
+        """constructor
+        Args:
+            series (dict): key -> flat series of the traces, of shape
+                (size, features) for the keys with several features.
+            window_pos (ndarray): first position of every n-gram.
+            n_size (int): n-gram size.
+            parms (dict): parms for training the network.
+            num_classes (dict): key -> number of classes of the
+                categorical targets and the one-hot encoded features.
+        """
+        self.window_pos = window_pos
+        self.n_size = n_size
+        self.sparse_labels = parms.get('sparse_labels', False)
+        self.buffer_size = parms.get('shuffle_buffer', 10000)
+        self.num_classes = num_classes
+        self.series = {k: tf.constant(v) for k, v in series.items()}
+        self.specs = {'prefixes': dict(), 'next_evt': dict()}
+        size = len(window_pos)
+        x, y = self._gather(tf.constant(window_pos[:1]))
+        for group, tensors in (('prefixes', x), ('next_evt', y)):
+            for key, value in tensors.items():
+                self.specs[group][key] = tf.TensorSpec(
+                    (size, *value.shape[1:]), value.dtype)
+
+    def __getitem__(self, key):
+        return self.specs[key]
+
+    def __len__(self):
+        return len(self.window_pos)
+
+    def dataset(self, batch_size, shuffle=False):
+        """Creates the pipeline that feeds the model.
+        Args:
+            batch_size (int): batch size.
+            shuffle (bool): shuffle the samples every epoch.
+        Returns:
+            tf.data.Dataset: batches of (prefixes, next events) dicts
+            named as the model inputs and outputs.
+        """
+        ds = tf.data.Dataset.from_tensor_slices(self.window_pos)
+        if shuffle:
+            ds = ds.shuffle(self.buffer_size, reshuffle_each_iteration=True)
+        ds = ds.batch(batch_size)
+        ds = ds.map(self._model_batch, num_parallel_calls=tf.data.AUTOTUNE)
+        return ds.prefetch(tf.data.AUTOTUNE)
+
+    def _model_batch(self, pos):
+        x, y = self._gather(pos)
+        inputs = {'ac_input': x['activities'],
+                  'rl_input': x['roles'],
+                  't_input': x['times']}
+        if 'inter_attr' in x:
+            inputs['inter_input'] = x['inter_attr']
+        outputs = {'act_output': y['activities'],
+                   'role_output': y['roles'],
+                   'time_output': y['times']}
+        return inputs, outputs
+
+    def _gather(self, pos):
+        # Use this to get the n-grams starting at pos and their next events
+        x_idx = tf.expand_dims(pos, 1) + tf.range(self.n_size, dtype=pos.dtype)
+        y_idx = pos + self.n_size
+        x, y = dict(), dict()
+        for key in ['activities', 'roles']:
+            x[key] = tf.gather(self.series[key], x_idx)
+            y[key] = tf.gather(self.series[key], y_idx)
+            if self.sparse_labels:
+                y[key] = tf.cast(y[key], tf.int32)
+            else:
+                y[key] = tf.one_hot(y[key], self.num_classes[key])
+        for key in ['times', 'inter_attr']:
+            if key in self.series:
+                x[key] = tf.gather(self.series[key], x_idx)
+                y[key] = tf.gather(self.series[key], y_idx)
+        if 'weekday' in self.series:
+            x_weekday = tf.one_hot(tf.gather(self.series['weekday'], x_idx),
+                                   self.num_classes['weekday'])
+            y_weekday = tf.one_hot(tf.gather(self.series['weekday'], y_idx),
+                                   self.num_classes['weekday'])
+            x['inter_attr'] = tf.concat([x['inter_attr'], x_weekday], axis=2)
+            y['inter_attr'] = tf.concat([y['inter_attr'], y_weekday], axis=1)
+        return x, y
+
+    @staticmethod
+    def stack_features(series):
+        """Stacks several flat series as the features of one series.
+        Args:
+            series (list): flat series of the same size.
+        Returns:
+            ndarray: float32 array of shape (size, number of series).
+        """
+        return np.stack(series, axis=1).astype(np.float32)
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Thu Oct 15 11:27:09 2026
+
+@author: Manuel Camargo
+"""
+import os
+import json
+import shutil
+import hashlib
+
+import pandas as pd
+
+try:
+    from model_training import tensor_store as ts
+except:
+    from importlib import util
+    spec = util.spec_from_file_location(
+        'tensor_store',
+        os.path.join(os.getcwd(), 'model_training', 'tensor_store.py'))
+    ts = util.module_from_spec(spec)
+    spec.loader.exec_module(ts)
+
+
+class PreprocessingCache():
+    """
+    Content addressed cache of the scaled and split logs and of the
+    vectorized tensors of the trials. The entries are folders named by
+    the hash of everything the preprocessing depends on, so they can be
+    shared by the trials of a run, by different runs and by the slurm
+    workers through a common directory. When the cache exceeds its size
+    the least recently used entries are removed.
+    """
+
+    def __init__(self, folder, max_size):
+        """constructor
+        Args:
+            folder (str): cache directory.
+            max_size (int): maximum size of the cache in bytes.
+        """
+        self.folder = folder
+        self.max_size = max_size
+        if not os.path.exists(self.folder):
+            os.makedirs(self.folder)
+
+    @staticmethod
+    def log_hash(log, ac_index, rl_index):
+        """Hashes the content of the log and of its indexes.
+        Args:
+            log (DataFrame): event log.
+            ac_index (dict): activities index.
+            rl_index (dict): roles index.
+        Returns:
+            str: hexadecimal digest.
+        """
+        digest = hashlib.sha1()
+        digest.update(json.dumps(list(map(str, log.columns))).encode())
+        digest.update(pd.util.hash_pandas_object(log, index=True)
+                      .to_numpy().tobytes())
+        for index in (ac_index, rl_index):
+            digest.update(json.dumps(index, sort_keys=True,
+                                     default=str).encode())
+        return digest.hexdigest()
+
+    @staticmethod
+    def key(log_hash, parms, model_def):
+        """Creates the key of the preprocessing of a trial.
+        Args:
+            log_hash (str): hash of the log.
+            parms (dict): trial settings.
+            model_def (dict): model definition.
+        Returns:
+            str: hexadecimal digest.
+        """
+        content = {'log': log_hash,
+                   'norm_method': parms['norm_method'],
+                   'scaler': model_def['scaler'],
+                   'vectorizer': model_def['vectorizer'],
+                   'additional_columns': model_def['additional_columns'],
+                   'n_size': parms['n_size'],
+                   'one_timestamp': parms['one_timestamp'],
+                   'sparse_labels': parms.get('sparse_labels', False)}
+        return hashlib.sha1(
+            json.dumps(content, sort_keys=True).encode()).hexdigest()
+
+    def get(self, key, mmap_mode=None):
+        """Reads an entry and marks it as recently used.
+        Args:
+            key (str): entry key.
+            mmap_mode (str, optional): 'r' to memory-map the tensors.
+        Returns:
+            dict: scale_args, log_train, log_valdn and, when cached,
+            train_vec and valdn_vec. None if the entry does not exist.
+        """
+        entry = os.path.join(self.folder, key)
+        try:
+            with open(os.path.join(entry, 'scale_args.json')) as file:
+                data = {'scale_args': json.load(file)}
+            data['log_train'] = pd.read_pickle(
+                os.path.join(entry, 'log_train.pkl'))
+            data['log_valdn'] = pd.read_pickle(
+                os.path.join(entry, 'log_valdn.pkl'))
+            store = ts.TensorStore(os.path.join(entry, 'tensors'))
+            if os.path.exists(store.folder):
+                data['train_vec'] = store.load('train', mmap_mode=mmap_mode)
+                data['valdn_vec'] = store.load('valdn', mmap_mode=mmap_mode)
+            os.utime(entry)
+        except (OSError, ValueError, EOFError):
+            # Missing entry or entry evicted by other process while reading
+            return None
+        return data
+
+    def put(self, key, scale_args, log_train, log_valdn,
+            train_vec=None, valdn_vec=None):
+        """Writes an entry and evicts the least recently used ones.
+        The entry is written in a temporal folder and renamed, in that
+        way other processes never read partial entries.
+        Args:
+            key (str): entry key.
+            scale_args (dict): scaling arguments of the trial.
+            log_train (DataFrame): scaled training split.
+            log_valdn (DataFrame): scaled validation split.
+            train_vec (dict, optional): vectorized training split.
+            valdn_vec (dict, optional): vectorized validation split.
+        """
+        entry = os.path.join(self.folder, key)
+        temp = entry + '.' + str(os.getpid()) + '.tmp'
+        os.makedirs(temp, exist_ok=True)
+        with open(os.path.join(temp, 'scale_args.json'), 'w') as file:
+            json.dump(scale_args, file, default=float)
+        log_train.to_pickle(os.path.join(temp, 'log_train.pkl'))
+        log_valdn.to_pickle(os.path.join(temp, 'log_valdn.pkl'))
+        if train_vec is not None:
+            store = ts.TensorStore(os.path.join(temp, 'tensors'))
+            store.save('train', train_vec)
+            store.save('valdn', valdn_vec)
+        if os.path.exists(entry):
+            # Created meanwhile by other process
+            shutil.rmtree(temp, ignore_errors=True)
+        else:
+            try:
+                os.rename(temp, entry)
+            except OSError:
+                shutil.rmtree(temp, ignore_errors=True)
+        self.evict(keep=key)
+
+    def put_tensors(self, key, train_vec, valdn_vec):
+        """Adds the vectorized splits to an entry created without them,
+        e.g. by a trial that streamed its n-grams.
+        Args:
+            key (str): entry key.
+            train_vec (dict): vectorized training split.
+            valdn_vec (dict): vectorized validation split.
+        """
+        entry = os.path.join(self.folder, key)
+        if not os.path.exists(entry):
+            # Entry evicted meanwhile
+            return
+        folder = os.path.join(entry, 'tensors')
+        temp = folder + '.' + str(os.getpid()) + '.tmp'
+        store = ts.TensorStore(temp)
+        store.save('train', train_vec)
+        store.save('valdn', valdn_vec)
+        try:
+            os.rename(temp, folder)
+        except OSError:
+            # Added meanwhile by other process
+            shutil.rmtree(temp, ignore_errors=True)
+        self.evict(keep=key)
+
+    def evict(self, keep=None):
+        """Removes the least recently used entries until the cache
+        fits in its maximum size.
+        Args:
+            keep (str, optional): entry that is never removed.
+        """
+        entries = list()
+        for name in os.listdir(self.folder):
+            path = os.path.join(self.folder, name)
+            if name.endswith('.tmp') or not os.path.isdir(path):
+                continue
+            try:
+                entries.append(
+                    (os.path.getmtime(path), self._size(path), name))
+            except OSError:
+                # Entry removed by other process
+                continue
+        total_size = sum(x[1] for x in entries)
+        for _, size, name in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            if name == keep:
+                continue
+            shutil.rmtree(os.path.join(self.folder, name), ignore_errors=True)
+            total_size -= size
+
+    @staticmethod
+    def _size(path):
+        size = 0
+        for root, _, files in os.walk(path):
+            size += sum(os.path.getsize(os.path.join(root, x)) for x in files)
+        return size
@@ -4,13 +4,22 @@ Created on Sat Mar 14 19:13:15 2020
 
 @author: Manuel Camargo
 """
-import itertools
+import os
 import numpy as np
 import random
 
-from nltk.util import ngrams
 import keras.utils as ku
 
+try:
+    from model_training import ngram_dataset as nd
+except:
+    from importlib import util
+    spec = util.spec_from_file_location(
+        'ngram_dataset', 
+        os.path.join(os.getcwd(), 'model_training', 'ngram_dataset.py'))
+    nd = util.module_from_spec(spec)
+    spec.loader.exec_module(nd)
+
 
 class SequencesCreator():
 
@@ -24,10 +33,19 @@ class SequencesCreator():
                                 'inter': self._vectorize_seq_inter,
                                 'gan': self.gan_simple}
 
-    def vectorize(self, model_type, log, params, add_cols):
+    def vectorize(self, model_type, log, params, add_cols,
+                  store=None, split=None):
         self.log = log
         columns = self.define_columns(add_cols, self.one_timestamp)
         loader = self._get_vectorizer(model_type)
+        if params.get('tf_data', False) and loader != self.gan_simple:
+            return self._stream_seq(
+                params, columns, loader == self._vectorize_seq_inter)
+        if store is not None and loader != self.gan_simple:
+            stacker = (self._stack_seq_inter
+                       if loader == self._vectorize_seq_inter
+                       else self._stack_seq)
+            return self._store_seq(params, columns, stacker, store, split)
         return loader(params, columns)
 
     def register_vectorizer(self, model_type, vectorizer):
@@ -60,53 +78,9 @@ class SequencesCreator():
         Returns:
             dict: Dictionary that contains all the LSTM inputs.
         """
-        # TODO: reorganizar este metoo para poder vectorizar los tiempos
-        # con uno o dos features de tiempo, posiblemente la idea es
-        # hacer equi como si fueran intercases.
-        times = ['dur_norm'] if parms['one_timestamp'] else ['dur_norm', 'wait_norm']
-        equi = {'ac_index': 'activities', 'rl_index': 'roles'}
-        vec = {'prefixes': dict(),
-               'next_evt': dict()}
-        x_times_dict = dict()
-        y_times_dict = dict()
-        self.log = self.reformat_events(columns, parms['one_timestamp'])
         # n-gram definition
-        for i, _ in enumerate(self.log):
-            for x in columns:
-                serie = list(ngrams(self.log[i][x], parms['n_size'],
-                                    pad_left=True, left_pad_symbol=0))
-                y_serie = [x[-1] for x in serie]
-                serie = serie[:-1]
-                y_serie = y_serie[1:]
-                if x in list(equi.keys()):
-                    vec['prefixes'][equi[x]] = (vec['prefixes'][equi[x]] + serie
-                                                if i > 0 else serie)
-                    vec['next_evt'][equi[x]] = (vec['next_evt'][equi[x]] + y_serie
-                                                if i > 0 else y_serie)
-                elif x in times:
-                    x_times_dict[x] = (
-                        x_times_dict[x] + serie if i > 0 else serie)
-                    y_times_dict[x] = (
-                        y_times_dict[x] + y_serie if i > 0 else y_serie)
-
-        # Transform task, dur and role prefixes in vectors
-        for value in equi.values():
-            vec['prefixes'][value] = np.array(vec['prefixes'][value])
-            vec['next_evt'][value] = np.array(vec['next_evt'][value])
-        # one-hot encode target values
-        vec['next_evt']['activities'] = ku.to_categorical(
-            vec['next_evt']['activities'], num_classes=len(self.ac_index))
-        vec['next_evt']['roles'] = ku.to_categorical(
-            vec['next_evt']['roles'], num_classes=len(self.rl_index))
-        # reshape times
-        for key, value in x_times_dict.items():
-            x_times_dict[key] = np.array(value)
-            x_times_dict[key] = x_times_dict[key].reshape(
-                (x_times_dict[key].shape[0], x_times_dict[key].shape[1], 1))
-        vec['prefixes']['times'] = np.dstack(list(x_times_dict.values()))
-        # Reshape y times attributes (suffixes, number of attributes)
-        vec['next_evt']['times'] = np.dstack(list(y_times_dict.values()))[0]
-        return vec
+        ngrams = self.build_ngrams(columns, parms['n_size'])
+        return self._stack_seq(parms, columns, ngrams)
 
     def _vectorize_seq_inter(self, parms, columns):
         """
@@ -117,83 +91,213 @@ class SequencesCreator():
         Returns:
             dict: Dictionary that contains all the LSTM inputs.
         """
+        # n-gram definition
+        ngrams = self.build_ngrams(columns, parms['n_size'])
+        return self._stack_seq_inter(parms, columns, ngrams)
+
+    def _stack_seq_inter(self, parms, columns, ngrams):
+        """
+        Stacks the n-grams as LSTM inputs with the intercase attributes.
+        parms:
+            parms (dict): parms for training the network
+            columns: list of features to vectorize.
+            ngrams (dict): n-grams created by build_ngrams.
+        Returns:
+            dict: Dictionary that contains the LSTM inputs.
+        """
         times = ['dur_norm'] if parms['one_timestamp'] else ['dur_norm', 'wait_norm']
         equi = {'ac_index': 'activities', 'rl_index': 'roles'}
-        vec = {'prefixes': dict(),
-               'next_evt': dict()}
-        x_weekday = list()
-        y_weekday = list()
-        # times
-        x_times_dict = dict()
-        y_times_dict = dict()
-        # intercases
-        x_inter_dict = dict()
-        y_inter_dict = dict()
-        # self.log = self.log[self.log.caseid.isin(['1', '1770'])].head(3)
-        self.log = self.reformat_events(columns, parms['one_timestamp'])
-        for i, _ in enumerate(self.log):
-            for x in columns:
-                serie = list(ngrams(self.log[i][x], parms['n_size'],
-                                    pad_left=True, left_pad_symbol=0))
-                y_serie = [x[-1] for x in serie]
-                serie = serie[:-1]
-                y_serie = y_serie[1:]
-                if x in list(equi.keys()):
-                    vec['prefixes'][equi[x]] = (
-                        vec['prefixes'][equi[x]] + serie if i > 0 else serie)
-                    vec['next_evt'][equi[x]] = (
-                        vec['next_evt'][equi[x]] + y_serie
-                        if i > 0 else y_serie)
-                elif x in times:
-                    x_times_dict[x] = (
-                        x_times_dict[x] + serie if i > 0 else serie)
-                    y_times_dict[x] = (
-                        y_times_dict[x] + y_serie if i > 0 else y_serie)
-                elif x == 'weekday':
-                    x_weekday = (
-                        x_weekday + serie if i > 0 else serie)
-                    y_weekday = (
-                        y_weekday + y_serie if i > 0 else y_serie)
-                else:
-                    x_inter_dict[x] = (
-                        x_inter_dict[x] + serie if i > 0 else serie)
-                    y_inter_dict[x] = (
-                        y_inter_dict[x] + y_serie if i > 0 else y_serie)
-        # Transform task, dur and role prefixes in vectors
-        for value in equi.values():
-            vec['prefixes'][value] = np.array(vec['prefixes'][value])
-            vec['next_evt'][value] = np.array(vec['next_evt'][value])
-        # one-hot encode target values
-        vec['next_evt']['activities'] = ku.to_categorical(
-            vec['next_evt']['activities'], num_classes=len(self.ac_index))
-        vec['next_evt']['roles'] = ku.to_categorical(
-            vec['next_evt']['roles'], num_classes=len(self.rl_index))
-        # reshape times
-        for key, value in x_times_dict.items():
-            x_times_dict[key] = np.array(value)
-            x_times_dict[key] = x_times_dict[key].reshape(
-                (x_times_dict[key].shape[0], x_times_dict[key].shape[1], 1))
-        vec['prefixes']['times'] = np.dstack(list(x_times_dict.values()))
-        # Reshape y times attributes (suffixes, number of attributes)
-        vec['next_evt']['times'] = np.dstack(list(y_times_dict.values()))[0]
-        # Reshape intercase attributes (prefixes, n-gram size, number of attributes)
-        for key, value in x_inter_dict.items():
-            x_inter_dict[key] = np.array(value)
-            x_inter_dict[key] = x_inter_dict[key].reshape(
-                (x_inter_dict[key].shape[0], x_inter_dict[key].shape[1], 1))
-        vec['prefixes']['inter_attr'] = np.dstack(list(x_inter_dict.values()))
-        # Reshape y intercase attributes (suffixes, number of attributes)
-        vec['next_evt']['inter_attr'] = np.dstack(list(y_inter_dict.values()))[0]
+        vec = self._stack_seq(parms, columns, ngrams)
+        inter = [x for x in columns
+                 if x not in equi and x not in times and x != 'weekday']
+        # Stack intercase attributes (prefixes, n-gram size, number of attributes)
+        vec['prefixes']['inter_attr'] = np.dstack(
+            [ngrams[x][0] for x in inter])
+        # Stack y intercase attributes (prefixes, number of attributes)
+        vec['next_evt']['inter_attr'] = np.stack(
+            [ngrams[x][1] for x in inter], axis=1)
         if 'weekday' in columns:
             # Onehot encode weekday
-            x_weekday = ku.to_categorical(x_weekday, num_classes=7)
-            y_weekday = ku.to_categorical(y_weekday, num_classes=7)
+            x_weekday = ku.to_categorical(ngrams['weekday'][0], num_classes=7)
+            y_weekday = ku.to_categorical(ngrams['weekday'][1], num_classes=7)
             vec['prefixes']['inter_attr'] = np.concatenate(
                 [vec['prefixes']['inter_attr'], x_weekday], axis=2)
             vec['next_evt']['inter_attr'] = np.concatenate(
                 [vec['next_evt']['inter_attr'], y_weekday], axis=1)
         return vec
 
+    def _stack_seq(self, parms, columns, ngrams):
+        """
+        Stacks the activities, roles and times n-grams as LSTM inputs.
+        parms:
+            parms (dict): parms for training the network
+            columns: list of features to vectorize.
+            ngrams (dict): n-grams created by build_ngrams.
+        Returns:
+            dict: Dictionary that contains the LSTM inputs.
+        """
+        times = ['dur_norm'] if parms['one_timestamp'] else ['dur_norm', 'wait_norm']
+        equi = {'ac_index': 'activities', 'rl_index': 'roles'}
+        vec = {'prefixes': dict(),
+               'next_evt': dict()}
+        # Transform task, dur and role prefixes in vectors
+        for key, value in equi.items():
+            vec['prefixes'][value], vec['next_evt'][value] = ngrams[key]
+        if parms.get('sparse_labels', False):
+            # keep target values as class indexes
+            vec['next_evt']['activities'] = (
+                vec['next_evt']['activities'].astype(np.int32))
+            vec['next_evt']['roles'] = vec['next_evt']['roles'].astype(np.int32)
+        else:
+            # one-hot encode target values
+            vec['next_evt']['activities'] = ku.to_categorical(
+                vec['next_evt']['activities'], num_classes=len(self.ac_index))
+            vec['next_evt']['roles'] = ku.to_categorical(
+                vec['next_evt']['roles'], num_classes=len(self.rl_index))
+        # Stack times (prefixes, n-gram size, number of attributes)
+        times = [x for x in columns if x in times]
+        vec['prefixes']['times'] = np.dstack([ngrams[x][0] for x in times])
+        # Stack y times attributes (prefixes, number of attributes)
+        vec['next_evt']['times'] = np.stack([ngrams[x][1] for x in times],
+                                            axis=1)
+        return vec
+
+    def _store_seq(self, parms, columns, stacker, store, split,
+                   block_size=65536):
+        """
+        Dataframe vectorizer that writes the n-grams in memory-mapped
+        files by blocks of samples, the vectorized split is never in
+        memory as a whole.
+        parms:
+            parms (dict): parms for training the network
+            columns: list of features to vectorize.
+            stacker: _stack_seq or _stack_seq_inter.
+            store (TensorStore): store of the split.
+            split (str): split name, train or valdn.
+            block_size (int): samples vectorized at once.
+        Returns:
+            dict: Dictionary that contains the LSTM inputs memory-mapped.
+        """
+        series, window_pos = self.build_series(columns, parms['n_size'])
+        num_samples = len(window_pos)
+        tensors = dict()
+        for start in range(0, num_samples, block_size):
+            block = window_pos[start:start + block_size]
+            vec = stacker(parms, columns,
+                          self.take_ngrams(series, block, parms['n_size']))
+            for group, values in vec.items():
+                for key, value in values.items():
+                    if (group, key) not in tensors:
+                        # The tensors are sized by the first block
+                        tensors[(group, key)] = store.allocate(
+                            split, group, key,
+                            (num_samples, *value.shape[1:]), value.dtype)
+                    tensors[(group, key)][start:start + len(block)] = value
+        for tensor in tensors.values():
+            tensor.flush()
+        del tensors
+        return store.load(split)
+
+    def _stream_seq(self, parms, columns, intercase):
+        """
+        Lazy dataframe vectorizer, the n-grams are created by batches
+        in a tf.data pipeline during the training.
+        parms:
+            parms (dict): parms for training the network
+            columns: list of features to vectorize.
+            intercase (bool): include the intercase or data attributes.
+        Returns:
+            NgramDataset: lazy vectorized split.
+        """
+        times = ['dur_norm'] if parms['one_timestamp'] else ['dur_norm', 'wait_norm']
+        equi = {'ac_index': 'activities', 'rl_index': 'roles'}
+        series, window_pos = self.build_series(columns, parms['n_size'])
+        stream = {value: series[key] for key, value in equi.items()}
+        stream['times'] = nd.NgramDataset.stack_features(
+            [series[x] for x in columns if x in times])
+        num_classes = {'activities': len(self.ac_index),
+                       'roles': len(self.rl_index)}
+        if intercase:
+            inter = [x for x in columns
+                     if x not in equi and x not in times and x != 'weekday']
+            stream['inter_attr'] = nd.NgramDataset.stack_features(
+                [series[x] for x in inter])
+            if 'weekday' in columns:
+                stream['weekday'] = series['weekday']
+                num_classes['weekday'] = 7
+        return nd.NgramDataset(stream, window_pos, parms['n_size'],
+                               parms, num_classes)
+
+    def build_ngrams(self, columns, n_size):
+        """Creates the n-gram prefixes and next events of every column.
+        The prefixes are the sliding window views of the flat series
+        gathered in a single indexing operation, so the cost is linear
+        in the log size.
+        parms:
+            columns: list of features to vectorize.
+            n_size (int): n-gram size.
+        Returns:
+            dict: column -> (prefixes (samples, n_size), next events (samples)).
+        """
+        series, window_pos = self.build_series(columns, n_size)
+        return self.take_ngrams(series, window_pos, n_size)
+
+    @staticmethod
+    def take_ngrams(series, window_pos, n_size):
+        """Gathers the n-grams starting at the given positions.
+        parms:
+            series (dict): column -> flat series created by build_series.
+            window_pos (ndarray): first position of every n-gram.
+            n_size (int): n-gram size.
+        Returns:
+            dict: column -> (prefixes (samples, n_size), next events (samples)).
+        """
+        ngrams = dict()
+        for x, serie in series.items():
+            windows = np.lib.stride_tricks.sliding_window_view(serie, n_size)
+            ngrams[x] = (windows[window_pos], serie[window_pos + n_size])
+        return ngrams
+
+    def build_series(self, columns, n_size):
+        """Lays out the traces, with their start and end events and left
+        padded with n_size-1 zeros, in one flat array per column.
+        parms:
+            columns: list of features to vectorize.
+            n_size (int): n-gram size.
+        Returns:
+            tuple: column -> flat series, first position of every n-gram.
+        """
+        log = self.log.sort_values('caseid', kind='mergesort')
+        caseids = log['caseid'].to_numpy()
+        case_start = np.flatnonzero(
+            np.concatenate([[True], caseids[1:] != caseids[:-1]]))
+        lengths = np.diff(np.append(case_start, len(caseids)))
+        # Every trace takes n_size-1 zeros, start, events and end
+        seg_start = np.cumsum(lengths + n_size + 1) - (lengths + n_size + 1)
+        total_size = int(np.sum(lengths + n_size + 1))
+        start_pos = seg_start + n_size - 1
+        end_pos = start_pos + lengths + 1
+        event_pos = (np.repeat(start_pos + 1 - case_start, lengths) +
+                     np.arange(len(caseids)))
+        # One sample per event plus the one of the start event
+        num_samples = lengths + 1
+        first_sample = np.cumsum(num_samples) - num_samples
+        window_pos = (np.repeat(seg_start - first_sample, num_samples) +
+                      np.arange(np.sum(num_samples)))
+        series = dict()
+        for x in columns:
+            values = log[x].to_numpy()
+            dtype = np.int64 if values.dtype.kind in 'iub' else np.float64
+            serie = np.zeros(total_size, dtype=dtype)
+            serie[event_pos] = values
+            if x == 'ac_index':
+                serie[start_pos] = self.ac_index['start']
+                serie[end_pos] = self.ac_index['end']
+            elif x == 'rl_index':
+                serie[start_pos] = self.rl_index['start']
+                serie[end_pos] = self.rl_index['end']
+            series[x] = serie
+        return series, window_pos
 
     def gan_simple(self, parms, columns):
         print(columns)
@@ -247,38 +351,3 @@ class SequencesCreator():
                 batch[:, 1], num_classes=len(self.rl_index))
             vec['pretraining']['class'] = batch[:, 2]
         return vec
-
-    # =============================================================================
-    # Reformat events
-    # =============================================================================
-    def reformat_events(self, columns, one_timestamp):
-        """Creates series of activities, roles and relative times per trace.
-        parms:
-            self.log: dataframe.
-            ac_index (dict): index of activities.
-            rl_index (dict): index of roles.
-        Returns:
-            list: lists of activities, roles and relative times.
-        """
-        temp_data = list()
-        log_df = self.log.to_dict('records')
-        key = 'end_timestamp' if one_timestamp else 'start_timestamp'
-        log_df = sorted(log_df, key=lambda x: (x['caseid'], key))
-        for key, group in itertools.groupby(log_df, key=lambda x: x['caseid']):
-            trace = list(group)
-            temp_dict = dict()
-            for x in columns:
-                serie = [y[x] for y in trace]
-                if x == 'ac_index':
-                    serie.insert(0, self.ac_index[('start')])
-                    serie.append(self.ac_index[('end')])
-                elif x == 'rl_index':
-                    serie.insert(0, self.rl_index[('start')])
-                    serie.append(self.rl_index[('end')])
-                else:
-                    serie.insert(0, 0)
-                    serie.append(0)
-                temp_dict = {**{x: serie}, **temp_dict}
-            temp_dict = {**{'caseid': key}, **temp_dict}
-            temp_data.append(temp_dict)
-        return temp_data
\ No newline at end of file
@@ -6,21 +6,23 @@ Created on Tue Jan 26 12:01:20 2021
 """
 import os
 import sys
-import csv
 import json
 import getopt
 
-import numpy as np
 import pandas as pd
 import configparser as cp
 
 import utils.support as sup
 import readers.log_splitter as ls
-import readers.log_reader as lr
 
 import tensorflow as tf
 import samples_creator as sc
 import features_manager as feat
+import tensor_store as ts
+import preprocessing_cache as pc
+import trial_journal as tj
+import embedding_store as es
+import log_cache as lc
 
 from models import model_specialized as mspec
 from models import model_concatenated as mcat
@@ -74,8 +76,25 @@ class SlurmWorker():
         self.log = self.load_log_test(
             os.path.join(self.temp_output, 'opt_parms'), self.parms)
         self.read_embeddings(self.parms)
+        # Preprocessing cache shared by the workers
+        self.cache = None
+        if self.parms.get('cache_folder'):
+            self.cache = pc.PreprocessingCache(self.parms['cache_folder'],
+                                               self.parms['cache_size'])
+            self.log_hash = self.cache.log_hash(
+                self.log, self.ac_index, self.rl_index)
+        # Journal of the trials, used to resume interrupted runs
+        journal = tj.TrialJournal(self.temp_output)
+        journal.start(self.parms['parms_file'],
+                      {k: self.parms[k] for k in ['model_type', 'n_size',
+                                                  'l_size', 'lstm_act',
+                                                  'dense_act', 'norm_method',
+                                                  'optim']})
         loss = self.exec_pipeline()
         self._define_response(self.parms, loss)
+        journal.finish(self.parms['parms_file'],
+                       'pruned' if self.pruned else 'ok', loss,
+                       self.parms['output'])
         print('COMPLETED')
 
 
@@ -88,10 +107,10 @@ class SlurmWorker():
 
     @staticmethod
     def load_log_test(output_route, parms):
-        df_train = lr.LogReader(
-            os.path.join(output_route, 'train.csv'),
-            parms['read_options'])
-        df_train = pd.DataFrame(df_train.data)
+        df_train = lc.LogCache(
+            os.path.join(os.getcwd(), 'input_files', 'log_cache')).read(
+                os.path.join(output_route, 'train.csv'),
+                parms['read_options'])
         df_train = df_train[~df_train.task.isin(['Start', 'End'])]
         return df_train
 
@@ -112,14 +131,12 @@ class SlurmWorker():
     
     def read_embeddings(self, params):
         # Load embedded matrix
-        ac_emb_name = 'ac_' + params['file'].split('.')[0]+'.emb'
-        rl_emb_name = 'rl_' + params['file'].split('.')[0]+'.emb'
-        if os.path.exists(os.path.join(os.getcwd(),
-                                       'input_files',
-                                       'embedded_matix',
-                                        ac_emb_name)):
-            self.ac_weights = self.load_embedded(self.index_ac, ac_emb_name)
-            self.rl_weights = self.load_embedded(self.index_rl, rl_emb_name)
+        store = es.EmbeddingStore(
+            os.path.join(os.getcwd(), 'input_files', 'embedded_matix'))
+        weights = store.load(params['file'], self.index_ac, self.index_rl,
+                             params.get('emb_method', 'dot_product'))
+        if weights is not None:
+            self.ac_weights, self.rl_weights = weights
 
     def exec_pipeline(self):
         print(self.parms)
@@ -128,27 +145,62 @@ class SlurmWorker():
         self.parms = self._temp_path_redef(self.parms)
         # Model definition
         model_def = self.read_model_definition(self.parms['model_type'])
-        # Scale values
-        log, self.parms = self._scale_values(self.log, self.parms, model_def)
-        # split validation
-        log_valdn, log_train = self.split_timeline(
-            0.8, log, self.parms['one_timestamp'])
+        # Reuse the preprocessing of previous trials when cached
+        cached = None
+        if self.cache is not None:
+            key = self.cache.key(self.log_hash, self.parms, model_def)
+            cached = self.cache.get(
+                key, mmap_mode='r' if self.parms['tensor_store'] else None)
+        if cached is None:
+            # Scale values
+            log, self.parms = self._scale_values(self.log, self.parms, model_def)
+            # split validation
+            log_valdn, log_train = self.split_timeline(
+                0.8, log, self.parms['one_timestamp'])
+        else:
+            self.parms['scale_args'] = cached['scale_args']
+            log_train, log_valdn = cached['log_train'], cached['log_valdn']
         print('train split size:', len(log_train))
         print('valdn split size:', len(log_valdn))
-        # Vectorize input
-        vectorizer = sc.SequencesCreator(
-            self.parms['read_options']['one_timestamp'], 
-            self.ac_index, self.rl_index)
-        vectorizer.register_vectorizer(self.parms['model_type'],
-                                       model_def['vectorizer'])
-        train_vec = vectorizer.vectorize(self.parms['model_type'],
-                                         log_train,
-                                         self.parms,
-                                         model_def['additional_columns'])
-        valdn_vec = vectorizer.vectorize(self.parms['model_type'],
-                                         log_valdn,
-                                         self.parms,
-                                         model_def['additional_columns'])
+        # The splits are vectorized directly in memory-mapped files
+        store = None
+        if self.parms['tensor_store'] and not self.parms['tf_data']:
+            store = ts.TensorStore(
+                os.path.join(self.parms['output'], 'tensors'))
+        if (cached is not None and 'train_vec' in cached and
+                not self.parms['tf_data']):
+            train_vec, valdn_vec = cached['train_vec'], cached['valdn_vec']
+        else:
+            # Vectorize input
+            vectorizer = sc.SequencesCreator(
+                self.parms['read_options']['one_timestamp'], 
+                self.ac_index, self.rl_index)
+            vectorizer.register_vectorizer(self.parms['model_type'],
+                                           model_def['vectorizer'])
+            train_vec = vectorizer.vectorize(self.parms['model_type'],
+                                             log_train,
+                                             self.parms,
+                                             model_def['additional_columns'],
+                                             store, 'train')
+            valdn_vec = vectorizer.vectorize(self.parms['model_type'],
+                                             log_valdn,
+                                             self.parms,
+                                             model_def['additional_columns'],
+                                             store, 'valdn')
+            if self.cache is not None:
+                stream = self.parms['tf_data']
+                if cached is None:
+                    self.cache.put(key, self.parms['scale_args'],
+                                   log_train, log_valdn,
+                                   None if stream else train_vec,
+                                   None if stream else valdn_vec)
+                elif not stream:
+                    # Entry of a streamed trial, without tensors
+                    self.cache.put_tensors(key, train_vec, valdn_vec)
+        # Vectorizers without block writing, e.g. gan, are moved afterwards
+        if store is not None and not ts.is_stored(train_vec):
+            train_vec = store.save('train', train_vec)
+            valdn_vec = store.save('valdn', valdn_vec)
         # Train
         m_loader = ModelLoader(self.parms)
         m_loader.register_model(self.parms['model_type'],
@@ -162,26 +214,43 @@ class SlurmWorker():
                                self.parms['output'],
                                os.path.join(os.getcwd(), 
                                             'output_files', 
-                                            'training_times.csv'))
+                                            'training_times.csv'),
+                               warm_start=self._warm_start(self.parms))
         # evaluation
-        x_input = {'ac_input': valdn_vec['prefixes']['activities'],
-                   'rl_input': valdn_vec['prefixes']['roles'],
-                   't_input': valdn_vec['prefixes']['times']}
-        if self.parms['model_type'] in ['shared_cat_cx', 
-                                       'concatenated_cx',
-                                       'shared_cat_gru_cx', 
-                                       'concatenated_gru_cx']:
-            x_input['inter_input']= valdn_vec['prefixes']['inter_attr']
         acc = model.evaluate(
-            x=x_input,
-            y={'act_output': valdn_vec['next_evt']['activities'],
-               'role_output': valdn_vec['next_evt']['roles'],
-               'time_output': valdn_vec['next_evt']['times']},
+            **ts.evaluation_data(valdn_vec, self.parms['batch_size']),
             return_dict=True)
+        if store is not None:
+            del train_vec, valdn_vec
+            store.clear()
         # rsp = self._define_response(self.parms, status, acc['loss'])
+        self.pruned = getattr(model, 'pruned_epoch', None) is not None
         print("-- End of trial --")
         return acc['loss']
 
+    def _warm_start(self, settings):
+        """Defines the checkpoint that initializes the trial, a previous
+        model of the log or the best trial of the run with the same model
+        type and n-gram size.
+        Returns:
+            dict: warm-start arguments of the trainer, None to train from
+            a random initialization.
+        """
+        checkpoint = settings.get('warm_start')
+        if not checkpoint and settings.get('warm_start_trials', False):
+            journal = tj.TrialJournal(self.temp_output)
+            record = journal.best_trial(model_type=settings['model_type'],
+                                        n_size=settings['n_size'])
+            if record is not None:
+                checkpoint = os.path.join(
+                    record['output'],
+                    os.path.splitext(settings['file'])[0] + '.h5')
+        if not checkpoint:
+            return None
+        return {'checkpoint': checkpoint,
+                'ac_index': self.ac_index,
+                'rl_index': self.rl_index}
+
     def _temp_path_redef(self, settings, **kwargs) -> dict:
         # Paths redefinition
         settings['output'] = os.path.join(self.temp_output, sup.folder_id())
@@ -205,6 +274,7 @@ class SlurmWorker():
         measurements = list()
         measurements.append({'loss': loss,
                              'sim_metric': 'val_loss',
+                             'status': 'pruned' if self.pruned else 'ok',
                              'n_size': parms['n_size'],
                              'l_size': parms['l_size'],
                              'lstm_act': parms['lstm_act'],
@@ -266,26 +336,6 @@ class SlurmWorker():
             model_type, 'trainer')
         return model_def
 
-    @staticmethod
-    def load_embedded(index, filename):
-        """Loading of the embedded matrices.
-        parms:
-            index (dict): index of activities or roles.
-            filename (str): filename of the matrix file.
-        Returns:
-            numpy array: array of weights.
-        """
-        weights = list()
-        input_folder = os.path.join(os.getcwd(), 'input_files', 'embedded_matix')
-        with open(os.path.join(input_folder, filename), 'r') as csvfile:
-            filereader = csv.reader(csvfile, delimiter=',', quotechar='"')
-            for row in filereader:
-                cat_ix = int(row[0])
-                if index[cat_ix] == row[1].strip():
-                    weights.append([float(x) for x in row[2:]])
-            csvfile.close()
-        return np.array(weights)
-
 
 class ModelLoader():
 
@@ -303,7 +353,8 @@ class ModelLoader():
                                    'shared_cat_gru': mshcatg._training_model,
                                    'shared_cat_gru_cx': mshcatgi._training_model}
 
-    def train(self, model_type, train_vec, valdn_vec, ac_weights, rl_weights, output_folder, log_path):
+    def train(self, model_type, train_vec, valdn_vec, ac_weights, rl_weights, output_folder, log_path,
+              warm_start=None):
         loader = self._get_trainer(model_type)
         return loader(train_vec, 
                       valdn_vec, 
@@ -311,7 +362,8 @@ class ModelLoader():
                       rl_weights, 
                       output_folder, 
                       self.parms,
-                      log_path=log_path)
+                      log_path=log_path,
+                      warm_start=warm_start)
 
     def register_model(self, model_type, trainer):
         try:
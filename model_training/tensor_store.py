@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Oct 13 10:12:36 2026
+
+@author: Manuel Camargo
+"""
+import os
+import shutil
+
+import numpy as np
+from tensorflow.keras.utils import Sequence
+
+
+class TensorStore():
+    """
+    On disk store of the vectorized splits of a trial. Every tensor is
+    written as a .npy file and read back memory-mapped, so the training
+    only brings to memory the batches being used.
+    """
+
+    def __init__(self, folder):
+        """constructor"""
+        self.folder = folder
+
+    def save(self, split, vec):
+        """Writes a vectorized split and returns it memory-mapped.
+        Args:
+            split (str): split name, train or valdn.
+            vec (dict): vectorized split as created by SequencesCreator.
+        Returns:
+            dict: same structure of vec with read-only memmaps.
+        """
+        for group, tensors in vec.items():
+            for key, value in tensors.items():
+                np.save(self._path(split, group, key), value)
+        return self.load(split)
+
+    def allocate(self, split, group, key, shape, dtype):
+        """Creates an empty tensor of a split to be filled in place.
+        Args:
+            split (str): split name, train or valdn.
+            group (str): prefixes or next_evt.
+            key (str): tensor name, e.g. activities.
+            shape (tuple): tensor shape.
+            dtype: tensor data type.
+        Returns:
+            memmap: writable memory-mapped tensor.
+        """
+        return np.lib.format.open_memmap(self._path(split, group, key),
+                                         mode='w+', dtype=dtype, shape=shape)
+
+    def _path(self, split, group, key):
+        split_folder = os.path.join(self.folder, split)
+        if not os.path.exists(split_folder):
+            os.makedirs(split_folder)
+        return os.path.join(split_folder, group + '.' + key + '.npy')
+
+    def load(self, split, mmap_mode='r'):
+        """Reads a stored split memory-mapped.
+        Args:
+            split (str): split name, train or valdn.
+            mmap_mode (str, optional): None to read the split to memory.
+        Returns:
+            dict: vectorized split with read-only memmaps.
+        """
+        vec = dict()
+        split_folder = os.path.join(self.folder, split)
+        for file in sorted(os.listdir(split_folder)):
+            group, key, _ = file.split('.')
+            vec.setdefault(group, dict())[key] = np.load(
+                os.path.join(split_folder, file), mmap_mode=mmap_mode)
+        return vec
+
+    def clear(self):
+        """Removes the stored tensors"""
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+
+class VecSequence(Sequence):
+    """
+    Keras sequence that feeds a vectorized split by batches, in that way
+    memory-mapped tensors are not copied to memory as a whole.
+    """
+
+    def __init__(self, vec, batch_size, shuffle=False):
+        """constructor"""
+        super().__init__()
+        self.inputs, self.outputs = model_inputs(vec)
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.size = len(vec['prefixes']['activities'])
+        self.index = np.arange(self.size)
+        self.on_epoch_end()
+
+    def __len__(self):
+        return int(np.ceil(self.size / self.batch_size))
+
+    def __getitem__(self, idx):
+        batch = self.index[idx * self.batch_size:(idx + 1) * self.batch_size]
+        if self.shuffle:
+            # Sorted rows make the reading from disk sequential
+            batch = np.sort(batch)
+        x = {k: np.asarray(v[batch]) for k, v in self.inputs.items()}
+        y = {k: np.asarray(v[batch]) for k, v in self.outputs.items()}
+        return x, y
+
+    def on_epoch_end(self):
+        if self.shuffle:
+            np.random.shuffle(self.index)
+
+
+def model_inputs(vec):
+    """Maps a vectorized split to the inputs and outputs of the models.
+    Args:
+        vec (dict): vectorized split.
+    Returns:
+        tuple: inputs and outputs dictionaries.
+    """
+    x = {'ac_input': vec['prefixes']['activities'],
+         'rl_input': vec['prefixes']['roles'],
+         't_input': vec['prefixes']['times']}
+    if 'inter_attr' in vec['prefixes']:
+        x['inter_input'] = vec['prefixes']['inter_attr']
+    y = {'act_output': vec['next_evt']['activities'],
+         'role_output': vec['next_evt']['roles'],
+         'time_output': vec['next_evt']['times']}
+    return x, y
+
+
+def is_stored(vec):
+    return isinstance(vec['prefixes']['activities'], np.memmap)
+
+
+def is_streamed(vec):
+    # Lazy splits (NgramDataset) create their own tf.data pipeline
+    return hasattr(vec, 'dataset')
+
+
+def fit_data(train_vec, valdn_vec, batch_size):
+    """Creates the data arguments of model.fit. Lazy and stored splits
+    are fed by batches, in memory splits are passed as they are.
+    Args:
+        train_vec (dict): vectorized training split.
+        valdn_vec (dict): vectorized validation split.
+        batch_size (int): batch size.
+    Returns:
+        dict: model.fit keyword arguments.
+    """
+    if is_streamed(train_vec):
+        return {'x': train_vec.dataset(batch_size, shuffle=True),
+                'validation_data': valdn_vec.dataset(batch_size)}
+    if is_stored(train_vec):
+        return {'x': VecSequence(train_vec, batch_size, shuffle=True),
+                'validation_data': VecSequence(valdn_vec, batch_size)}
+    x, y = model_inputs(train_vec)
+    return {'x': x, 'y': y,
+            'validation_data': model_inputs(valdn_vec),
+            'batch_size': batch_size}
+
+
+def evaluation_data(vec, batch_size):
+    """Creates the data arguments of model.evaluate.
+    Args:
+        vec (dict): vectorized split.
+        batch_size (int): batch size.
+    Returns:
+        dict: model.evaluate keyword arguments.
+    """
+    if is_streamed(vec):
+        return {'x': vec.dataset(batch_size)}
+    if is_stored(vec):
+        return {'x': VecSequence(vec, batch_size)}
+    x, y = model_inputs(vec)
+    return {'x': x, 'y': y, 'batch_size': batch_size}
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Fri Oct 16 15:36:52 2026
+
+@author: Manuel Camargo
+"""
+import os
+import json
+import time
+
+
+class TrialJournal():
+    """
+    Append-only journal of the trials of an optimization run. Every trial
+    writes a record when it starts and another one when it finishes, in
+    that way the trials without the second record were in flight when the
+    run died. The lines are small and written in append mode, so trials
+    run by different processes can share the journal.
+    """
+
+    def __init__(self, folder, file_name='trials_journal.jsonl'):
+        """constructor"""
+        self.file_name = os.path.join(folder, file_name)
+
+    def start(self, trial, config):
+        """Records the start of a trial.
+        Args:
+            trial (str): trial identifier.
+            config (dict): trial configuration.
+        """
+        self._append({'trial': trial, 'status': 'running', 'config': config})
+
+    def finish(self, trial, status, loss=None, output=None, **kwargs):
+        """Records the end of a trial.
+        Args:
+            trial (str): trial identifier.
+            status (str): final status, ok, fail or pruned.
+            loss (float, optional): trial loss.
+            output (str, optional): folder of the trial artifacts.
+        """
+        self._append({**{'trial': trial, 'status': status,
+                         'loss': loss, 'output': output}, **kwargs})
+
+    def load(self):
+        """Reads the last state of every trial.
+        Returns:
+            dict: trial -> record, with the configuration of its start and
+            the status of its last record, in the order they were started.
+        """
+        trials = dict()
+        if not os.path.exists(self.file_name):
+            return trials
+        with open(self.file_name) as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Line cut when the run died
+                    continue
+                trials[record['trial']] = {
+                    **trials.get(record['trial'], dict()), **record}
+        return trials
+
+    def best_trial(self, **config):
+        """Finds the finished trial with the lowest loss among the ones
+        with the given configuration values.
+        Returns:
+            dict: trial record, None if there is no such trial.
+        """
+        best = None
+        for record in self.load().values():
+            if (record['status'] != 'ok' or record.get('pruned', False) or
+                    record.get('loss') is None):
+                continue
+            if any(record['config'].get(k) != v for k, v in config.items()):
+                continue
+            if best is None or record['loss'] < best['loss']:
+                best = record
+        return best
+
+    def _append(self, record):
+        record['time'] = time.time()
+        line = json.dumps(record, default=str) + '\n'
+        with open(self.file_name, 'a') as file:
+            file.write(line)
+            file.flush()
+            os.fsync(file.fileno())
+
+    @staticmethod
+    def results_file(folder):
+        """Finds the OP_ results file of a run folder.
+        Args:
+            folder (str): run folder.
+        Returns:
+            str: file name, None if the run has no results file.
+        """
+        files = sorted(x for x in os.listdir(folder)
+                       if x.startswith('OP_') and x.endswith('.csv'))
+        return files[0] if files else None
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 17 10:12:44 2026
+
+@author: Manuel Camargo
+"""
+import os
+import json
+
+import numpy as np
+from tensorflow.keras.models import load_model
+
+
+# Layers whose vocabulary axis can grow between the checkpoint and the model
+VOCABULARY_LAYERS = {'ac_embedding': 'ac', 'act_output': 'ac',
+                     'rl_embedding': 'rl', 'role_output': 'rl'}
+
+
+def transfer_weights(model, checkpoint, ac_index=None, rl_index=None):
+    """Initializes a model with the weights of a previous checkpoint.
+    The layers with the same shapes are copied. The embedding and output
+    layers of activities and roles are copied row by row when the
+    vocabulary changed, using the indexes exported with the checkpoint.
+    Args:
+        model (Model): model to initialize.
+        checkpoint (str): .h5 file of the previous model.
+        ac_index (dict, optional): activities index of the model.
+        rl_index (dict, optional): roles index of the model.
+    Returns:
+        list: names of the initialized layers.
+    """
+    if not os.path.exists(checkpoint):
+        print('Warm-start checkpoint not found:', checkpoint)
+        return list()
+    previous = load_model(checkpoint, compile=False)
+    pairs = {'ac': _vocabulary_pairs(checkpoint, 'index_ac', ac_index),
+             'rl': _vocabulary_pairs(checkpoint, 'index_rl', rl_index)}
+    transferred = list()
+    for layer, prev_layer in _match_layers(model, previous):
+        weights = layer.get_weights()
+        prev_weights = prev_layer.get_weights()
+        if not weights or len(weights) != len(prev_weights):
+            continue
+        if all(x.shape == y.shape for x, y in zip(weights, prev_weights)):
+            layer.set_weights(prev_weights)
+            transferred.append(layer.name)
+        elif pairs.get(VOCABULARY_LAYERS.get(layer.name)) is not None:
+            weights = _partial_transfer(
+                weights, prev_weights, pairs[VOCABULARY_LAYERS[layer.name]])
+            if weights is not None:
+                layer.set_weights(weights)
+                transferred.append(layer.name)
+    print('Warm-start from', checkpoint, '-', len(transferred), 'layers')
+    return transferred
+
+
+def _match_layers(model, previous):
+    # Same architecture, the layers are paired by position
+    if ([x.__class__.__name__ for x in model.layers] ==
+            [x.__class__.__name__ for x in previous.layers]):
+        return list(zip(model.layers, previous.layers))
+    # Otherwise only the layers with the same name are paired
+    prev_layers = {x.name: x for x in previous.layers}
+    return [(x, prev_layers[x.name]) for x in model.layers
+            if x.name in prev_layers]
+
+
+def _vocabulary_pairs(checkpoint, key, index):
+    """Pairs the positions of the categories shared by the vocabulary of
+    the checkpoint and the one of the model.
+    Returns:
+        tuple: previous and new positions, None if the vocabulary of the
+        checkpoint is unknown.
+    """
+    parms_file = os.path.join(os.path.dirname(checkpoint),
+                              'parameters', 'model_parameters.json')
+    if index is None or not os.path.exists(parms_file):
+        return None
+    with open(parms_file) as file:
+        prev_index = json.load(file).get(key)
+    if prev_index is None:
+        return None
+    shared = [(int(k), index[v]) for k, v in prev_index.items() if v in index]
+    return (np.array([x[0] for x in shared], dtype=int),
+            np.array([x[1] for x in shared], dtype=int))
+
+
+def _partial_transfer(weights, prev_weights, pairs):
+    """Copies the shared categories along the vocabulary axis, the only
+    axis where the shapes of the weights can differ.
+    Returns:
+        list: new weights, None if the shapes are not compatible.
+    """
+    prev_pos, new_pos = pairs
+    new_weights = list()
+    for w, prev_w in zip(weights, prev_weights):
+        if w.ndim != prev_w.ndim:
+            return None
+        axes = [i for i, (x, y) in enumerate(zip(w.shape, prev_w.shape))
+                if x != y]
+        if not axes:
+            new_weights.append(prev_w)
+            continue
+        axis = axes[0]
+        if len(axes) > 1 or (prev_pos.size and (
+                prev_pos.max() >= prev_w.shape[axis] or
+                new_pos.max() >= w.shape[axis])):
+            return None
+        w = w.copy()
+        index = [slice(None)] * w.ndim
+        prev_index = [slice(None)] * w.ndim
+        index[axis], prev_index[axis] = new_pos, prev_pos
+        w[tuple(index)] = prev_w[tuple(prev_index)]
+        new_weights.append(w)
+    return new_weights
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Fri Oct 16 09:48:21 2026
+
+@author: Manuel Camargo
+"""
+import os
+import numpy as np
+
+from keras.callbacks import Callback
+
+
+class SuccessiveHalvingCallback(Callback):
+    """
+    Asynchronous successive halving of the trials of an optimization run.
+    The validation loss of the trial is recorded at the rungs
+    min_epochs * eta**k, and the training only goes on when the loss is in
+    the top 1/eta of the losses recorded at that rung by the trials of the
+    run so far with the same architecture. The rungs are append-only files
+    in the run folder, in that way they are shared by trials run in
+    different processes or nodes.
+    """
+    def __init__(self, output_folder, min_epochs=5, eta=3, group=''):
+        """constructor
+        Args:
+            output_folder (str): folder of the trial.
+            min_epochs (int): epochs of the first rung.
+            eta (int): reduction factor, greater than one.
+            group (str): architecture of the trial, only the trials of the
+                same group are compared.
+        """
+        super().__init__()
+        if min_epochs <= 0:
+            raise ValueError(min_epochs)
+        if eta <= 1:
+            raise ValueError(eta)
+        self.min_epochs = min_epochs
+        self.eta = eta
+        self.group = group
+        # The trial folders are created inside the run folder
+        self.rungs_folder = os.path.join(
+            os.path.dirname(os.path.normpath(output_folder)), 'halving')
+        if not os.path.exists(self.rungs_folder):
+            os.makedirs(self.rungs_folder, exist_ok=True)
+
+    def on_epoch_end(self, epoch, logs=None):
+        epochs = epoch + 1
+        loss = (logs or dict()).get('val_loss')
+        if loss is None or not self.is_rung(epochs):
+            return
+        rung_file = os.path.join(self.rungs_folder,
+                                 'rung_' + self.group + '_' + str(epochs)
+                                 + '.txt')
+        with open(rung_file, 'a') as file:
+            file.write(repr(float(loss)) + '\n')
+        with open(rung_file) as file:
+            losses = [float(x) for x in file if x.strip()]
+        # Only the top 1/eta of the trials is promoted to the next rung
+        promoted = int(np.ceil(len(losses) / self.eta))
+        if sum(x < loss for x in losses) >= promoted:
+            self.model.stop_training = True
+            self.model.pruned_epoch = epochs
+            print('Trial pruned at epoch', epochs)
+
+    def is_rung(self, epochs):
+        rung = self.min_epochs
+        while rung < epochs:
+            rung *= self.eta
+        return rung == epochs
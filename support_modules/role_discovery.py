@@ -1,6 +1,5 @@
 ﻿# -*- coding: utf-8 -*-
-import scipy
-from scipy.stats import pearsonr
+import numpy as np
 import networkx as nx
 import utils.support as sup
 from operator import itemgetter
@@ -25,7 +24,9 @@ class ResourcePoolAnalyser():
 
     def read_resource_pool(self, log):
         if isinstance(log, pd.DataFrame):
-            filtered_list = log[['task', 'user']]
+            # Aggregated logs have the executions of every pair in freq
+            columns = [x for x in ['task', 'user', 'freq'] if x in log.columns]
+            filtered_list = log[columns]
         else:
             filtered_list = pd.DataFrame(log.data)[['task', 'user']]
         filtered_list = filtered_list[~filtered_list.task.isin(['Start', 'End'])]
@@ -34,16 +35,7 @@ class ResourcePoolAnalyser():
 
 
     def discover_roles(self):
-        associations = lambda x: (self.tasks[x['task']], self.users[x['user']])
-        self.data['ac_rl'] = self.data.apply(associations, axis=1)
-    
-        freq_matrix = (self.data.groupby(by='ac_rl')['task']
-                       .count()
-                       .reset_index()
-                       .rename(columns={'task': 'freq'}))
-        freq_matrix = {x['ac_rl']: x['freq'] for x in freq_matrix.to_dict('records')}
-        
-        profiles = self.build_profile(freq_matrix)
+        profiles = self.build_profile()
     
         sup.print_progress(((20 / 100)* 100),'Analysing resource pool ')
         # building of a correl matrix between resouces profiles
@@ -53,13 +45,12 @@ class ResourcePoolAnalyser():
         g = nx.Graph()
         for user in self.users.values():
             g.add_node(user)
-        for rel in correl_matrix:
-            # creation of edges between nodes excluding the same elements
-            # and those below the similarity threshold 
-            if rel['distance'] > self.sim_threshold and rel['x'] != rel['y']:
-                g.add_edge(rel['x'],
-                           rel['y'],
-                           weight=rel['distance'])
+        # creation of edges between nodes excluding the same elements
+        # and those below the similarity threshold 
+        edges = correl_matrix > self.sim_threshold
+        np.fill_diagonal(edges, False)
+        for x, y in zip(*np.nonzero(edges)):
+            g.add_edge(int(x), int(y), weight=correl_matrix[x, y])
         sup.print_progress(((60 / 100) * 100),'Analysing resource pool ')
         # extraction of fully conected subgraphs as roles
         sub_graphs = list(nx.connected_components(g))
@@ -73,27 +64,28 @@ class ResourcePoolAnalyser():
         sup.print_done_task()
         return roles
     
-    def build_profile(self, freq_matrix):
-        profiles=list()
-        for user, idx in self.users.items():
-            profile = [0,] * len(self.tasks)
-            for ac_rl, freq in freq_matrix.items():
-                if idx == ac_rl[1]:
-                    profile[ac_rl[0]] = freq
-            profiles.append({'user': idx, 'profile': profile})
+    def build_profile(self):
+        """Counts the executions of every task by every user.
+        Returns:
+            ndarray: users x tasks frequencies matrix.
+        """
+        profiles = np.zeros((len(self.users), len(self.tasks)))
+        freq = (self.data.freq.to_numpy() if 'freq' in self.data.columns
+                else 1)
+        np.add.at(profiles,
+                  (self.data.user.map(self.users).to_numpy(),
+                   self.data.task.map(self.tasks).to_numpy()), freq)
         return profiles
 
-    def det_correl_matrix(self, profiles):
-        correl_matrix = list()
-        for profile_x in profiles:
-            for profile_y in profiles:
-                x = scipy.array(profile_x['profile'])
-                y = scipy.array(profile_y['profile'])
-                r_row, p_value = pearsonr(x, y)
-                correl_matrix.append(({'x': profile_x['user'],
-                                            'y': profile_y['user'],
-                                            'distance': r_row}))
-        return correl_matrix
+    @staticmethod
+    def det_correl_matrix(profiles):
+        """Pearson correlation between the profiles of every pair of users.
+        Returns:
+            ndarray: users x users correlation matrix, nan for the
+            users with a constant profile.
+        """
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.corrcoef(profiles)
 
     def role_definition(self, sub_graphs):
         user_index = {v: k for k, v in self.users.items()}
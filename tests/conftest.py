@@ -0,0 +1,12 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 17:05:12 2026
+
+@author: Manuel Camargo
+"""
+import os
+import sys
+
+# The modules are imported from the root of the repository, as the
+# dg_* scripts do
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
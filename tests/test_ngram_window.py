@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 17:31:26 2026
+
+@author: Manuel Camargo
+"""
+import numpy as np
+import pytest
+
+from model_prediction import ngram_window as nw
+
+
+def last_events(events, n_size):
+    """Window of the former predictors, the last n_size events of a
+    list left padded with zeros."""
+    return ([0] * n_size + list(events))[-n_size:]
+
+
+def test_push_longer_than_n_size():
+    n_size = 3
+    window = nw.NgramWindow(2, n_size, dtype=int)
+    events = [list(), list()]
+    # Several turns of the buffer
+    for step in range(1, 3 * n_size + 2):
+        values = np.array([step, 10 * step])
+        window.push(values)
+        for row, value in enumerate(values):
+            events[row].append(value)
+            np.testing.assert_array_equal(window.window()[row],
+                                          last_events(events[row], n_size))
+
+
+def test_push_selected_rows_fills_the_others():
+    window = nw.NgramWindow(3, 2, dtype=int)
+    window.push(np.array([1, 2, 3]))
+    window.push(np.array([7, 9]), rows=np.array([0, 2]), fill=-1)
+    np.testing.assert_array_equal(window.window(), [[1, 7], [2, -1], [3, 9]])
+    np.testing.assert_array_equal(window.window(np.array([2, 0])),
+                                  [[3, 9], [1, 7]])
+
+
+def test_reset_in_the_middle_of_a_batch():
+    n_size = 3
+    window = nw.NgramWindow(3, n_size, num_feat=2)
+    events = [list(), list(), list()]
+    for step in range(1, 12):
+        if step in [4, 8]:
+            # The trace of the row 1 ends, the next one starts empty
+            window.reset(1)
+            events[1] = list()
+        if step == 6:
+            window.reset(np.array([0, 2]))
+            events[0], events[2] = list(), list()
+        values = np.array([[step, -step], [2 * step, 0], [3 * step, 1]])
+        window.push(values)
+        for row in range(3):
+            events[row].append(values[row])
+            expected = ([np.zeros(2)] * n_size + events[row])[-n_size:]
+            np.testing.assert_array_equal(window.window()[row], expected)
+
+
+def test_take_repeats_and_reorders_rows():
+    window = nw.NgramWindow(2, 2, dtype=int)
+    window.push(np.array([1, 2]))
+    window.push(np.array([3, 4]))
+    window.take(np.array([1, 1, 0]))
+    assert window.rows == 3
+    np.testing.assert_array_equal(window.window(), [[2, 4], [2, 4], [1, 3]])
+    # The taken rows slide independently
+    window.push(np.array([5, 6, 7]))
+    np.testing.assert_array_equal(window.window(), [[4, 5], [4, 6], [3, 7]])
+
+
+def test_from_prefixes_wraparound():
+    n_size = 3
+    prefixes = [[1, 2, 3, 4, 5], [6], list()]
+    window = nw.NgramWindow.from_prefixes(prefixes, n_size, dtype=int)
+    np.testing.assert_array_equal(
+        window.window(), [last_events(x, n_size) for x in prefixes])
+    for step in range(1, 2 * n_size + 1):
+        window.push(np.full(3, 10 + step))
+        prefixes = [x + [10 + step] for x in prefixes]
+        np.testing.assert_array_equal(
+            window.window(), [last_events(x, n_size) for x in prefixes])
+
+
+def test_from_prefixes_with_features():
+    prefixes = [np.array([[1., 2.], [3., 4.], [5., 6.]]),
+                np.array([[7., 8.]])]
+    window = nw.NgramWindow.from_prefixes(prefixes, 2)
+    np.testing.assert_array_equal(window.window(),
+                                  [[[3, 4], [5, 6]], [[0, 0], [7, 8]]])
+    window.push(np.array([[9., 9.], [1., 1.]]))
+    np.testing.assert_array_equal(window.window(),
+                                  [[[5, 6], [9, 9]], [[7, 8], [1, 1]]])
+
+
+def test_select_events():
+    preds = np.array([[0.1, 0.7, 0.2], [0.0, 0.0, 1.0]])
+    np.testing.assert_array_equal(nw.select_events(preds, 'arg_max'), [1, 2])
+    np.testing.assert_array_equal(nw.select_events(preds, 'Arg Max'), [1, 2])
+    # A class without probability is never drawn
+    draws = nw.select_events(np.tile(preds[1:], (100, 1)), 'random_choice')
+    assert (draws == 2).all()
+    with pytest.raises(ValueError):
+        nw.select_events(preds, 'beam_search')
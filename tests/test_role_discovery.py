@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 17:52:03 2026
+
+@author: Manuel Camargo
+"""
+import warnings
+
+import networkx as nx
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.stats import pearsonr
+
+pytest.importorskip('utils.support')
+from support_modules import role_discovery as rl
+
+
+@pytest.fixture
+def log():
+    # Three groups of users sharing tasks, a user with a constant profile,
+    # automatic events and the artificial start and end
+    rng = np.random.default_rng(7)
+    groups = {'u%d' % i: i % 3 for i in range(12)}
+    rows = list()
+    for user, group in groups.items():
+        for _ in range(40):
+            task = 't%d' % (group * 2 + rng.integers(0, 3))
+            rows.append({'task': task, 'user': user})
+    rows.extend({'task': 't%d' % i, 'user': 'flat'} for i in range(7))
+    rows.extend([{'task': 't1', 'user': 'AUTO'},
+                 {'task': 'Start', 'user': 'u0'},
+                 {'task': 'End', 'user': 'u1'}])
+    return pd.DataFrame(rows)
+
+
+def reference_roles(log, sim_threshold):
+    """Resource table of the former implementation, profiles built
+    user by user and Pearson correlation pair by pair."""
+    log = log[~log.task.isin(['Start', 'End']) & (log.user != 'AUTO')]
+    tasks = {x: i for i, x in enumerate(log.task.unique())}
+    users = {x: i for i, x in enumerate(log.user.unique())}
+    freq = log.groupby(['task', 'user']).size().to_dict()
+    profiles = dict()
+    for user, idx in users.items():
+        profile = [0] * len(tasks)
+        for (task, other), count in freq.items():
+            if other == user:
+                profile[tasks[task]] = count
+        profiles[idx] = profile
+    g = nx.Graph()
+    g.add_nodes_from(users.values())
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        for x in profiles:
+            for y in profiles:
+                r_row = pearsonr(profiles[x], profiles[y])[0]
+                if r_row > sim_threshold and x != y:
+                    g.add_edge(x, y)
+    user_index = {v: k for k, v in users.items()}
+    groups = sorted([[user_index[x] for x in c]
+                     for c in nx.connected_components(g)],
+                    key=len, reverse=True)
+    return [{'role': 'Role ' + str(i + 1), 'resource': user}
+            for i, group in enumerate(groups) for user in group]
+
+
+@pytest.mark.parametrize('sim_threshold', [0.5, 0.7, 0.9])
+def test_same_roles_as_former_implementation(log, sim_threshold):
+    analyser = rl.ResourcePoolAnalyser(log, sim_threshold=sim_threshold)
+    assert analyser.resource_table == reference_roles(log, sim_threshold)
+
+
+def test_aggregated_pool(log):
+    # The executions of every pair given by the freq column
+    pool = (log.groupby(['task', 'user'], sort=False).size()
+            .reset_index(name='freq'))
+    expected = rl.ResourcePoolAnalyser(log, sim_threshold=0.7)
+    analyser = rl.ResourcePoolAnalyser(pool, sim_threshold=0.7)
+    roles = lambda x: sorted(sorted(r['members']) for r in x.roles)
+    assert roles(analyser) == roles(expected)
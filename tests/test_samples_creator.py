@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 17:08:40 2026
+
+@author: Manuel Camargo
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from model_training import samples_creator as sc
+from model_training import tensor_store as ts
+
+AC_INDEX = {'start': 0, 'A': 1, 'B': 2, 'C': 3, 'end': 4}
+RL_INDEX = {'start': 0, 'R1': 1, 'R2': 2, 'end': 3}
+
+
+@pytest.fixture
+def log():
+    # Interleaved cases of 3, 1 and 2 events
+    return pd.DataFrame(
+        {'caseid': ['1', '2', '1', '3', '1', '3'],
+         'ac_index': [1, 3, 2, 1, 3, 2],
+         'rl_index': [1, 2, 2, 1, 1, 2],
+         'dur_norm': [0.1, 0.2, 0.3, 0.4, 0.5, 0.6],
+         'wait_norm': [0.0, 0.7, 0.8, 0.0, 0.9, 1.0],
+         'daytime_norm': [0.11, 0.22, 0.33, 0.44, 0.55, 0.66],
+         'weekday': [0, 6, 1, 2, 3, 4]})
+
+
+def reference_ngrams(log, column, n_size):
+    """n-grams of the former vectorizer, trace by trace. Every trace is
+    framed by the start and end events (zeros for the other columns) and
+    left padded with zeros."""
+    prefixes, next_events = list(), list()
+    for _, trace in log.groupby('caseid', sort=True):
+        if column == 'ac_index':
+            frame = [AC_INDEX['start'], AC_INDEX['end']]
+        elif column == 'rl_index':
+            frame = [RL_INDEX['start'], RL_INDEX['end']]
+        else:
+            frame = [0, 0]
+        serie = ([0] * (n_size - 1) + [frame[0]] +
+                 trace[column].tolist() + [frame[1]])
+        for i in range(len(trace) + 1):
+            prefixes.append(serie[i:i + n_size])
+            next_events.append(serie[i + n_size])
+    return np.array(prefixes), np.array(next_events)
+
+
+def vectorize(log, vectorizer, one_timestamp, add_cols, parms, **kwargs):
+    creator = sc.SequencesCreator(one_timestamp, AC_INDEX, RL_INDEX)
+    creator.register_vectorizer('model', vectorizer)
+    parms = {**{'n_size': 3, 'one_timestamp': one_timestamp}, **parms}
+    return creator.vectorize('model', log, parms, add_cols, **kwargs)
+
+
+def test_fixed_log_ngrams(log):
+    vec = vectorize(log, 'basic', True, [], {'sparse_labels': True})
+    np.testing.assert_array_equal(
+        vec['prefixes']['activities'],
+        [[0, 0, 0], [0, 0, 1], [0, 1, 2], [1, 2, 3],
+         [0, 0, 0], [0, 0, 3],
+         [0, 0, 0], [0, 0, 1], [0, 1, 2]])
+    np.testing.assert_array_equal(vec['next_evt']['activities'],
+                                  [1, 2, 3, 4, 3, 4, 1, 2, 4])
+    np.testing.assert_array_equal(vec['next_evt']['roles'],
+                                  [1, 2, 1, 3, 2, 3, 1, 2, 3])
+    np.testing.assert_allclose(vec['next_evt']['times'][:, 0],
+                               [0.1, 0.3, 0.5, 0, 0.2, 0, 0.4, 0.6, 0])
+
+
+@pytest.mark.parametrize('one_timestamp', [True, False])
+@pytest.mark.parametrize('vectorizer, add_cols',
+                         [('basic', []), ('inter', ['daytime', 'weekday'])])
+def test_vectorize_matches_reference(log, vectorizer, add_cols,
+                                     one_timestamp):
+    vec = vectorize(log, vectorizer, one_timestamp, add_cols, dict())
+    for column, key in [('ac_index', 'activities'), ('rl_index', 'roles')]:
+        prefixes, next_events = reference_ngrams(log, column, 3)
+        np.testing.assert_array_equal(vec['prefixes'][key], prefixes)
+        num_classes = len(AC_INDEX if key == 'activities' else RL_INDEX)
+        np.testing.assert_array_equal(vec['next_evt'][key],
+                                      np.eye(num_classes)[next_events])
+    times = ['dur_norm'] if one_timestamp else ['dur_norm', 'wait_norm']
+    for i, column in enumerate(times):
+        prefixes, next_events = reference_ngrams(log, column, 3)
+        np.testing.assert_array_equal(vec['prefixes']['times'][:, :, i],
+                                      prefixes)
+        np.testing.assert_array_equal(vec['next_evt']['times'][:, i],
+                                      next_events)
+    if vectorizer == 'inter':
+        prefixes, next_events = reference_ngrams(log, 'daytime_norm', 3)
+        np.testing.assert_array_equal(vec['prefixes']['inter_attr'][:, :, 0],
+                                      prefixes)
+        np.testing.assert_array_equal(vec['next_evt']['inter_attr'][:, 0],
+                                      next_events)
+        prefixes, next_events = reference_ngrams(log, 'weekday', 3)
+        np.testing.assert_array_equal(vec['prefixes']['inter_attr'][:, :, 1:],
+                                      np.eye(7)[prefixes])
+        np.testing.assert_array_equal(vec['next_evt']['inter_attr'][:, 1:],
+                                      np.eye(7)[next_events])
+
+
+@pytest.mark.parametrize('vectorizer, add_cols',
+                         [('basic', []), ('inter', ['daytime', 'weekday'])])
+def test_store_matches_memory(log, tmp_path, vectorizer, add_cols):
+    vec = vectorize(log, vectorizer, False, add_cols, dict())
+    store = ts.TensorStore(str(tmp_path))
+    stored = vectorize(log, vectorizer, False, add_cols, dict(),
+                       store=store, split='train')
+    assert ts.is_stored(stored)
+    for group in vec:
+        assert vec[group].keys() == stored[group].keys()
+        for key in vec[group]:
+            assert vec[group][key].dtype == stored[group][key].dtype
+            np.testing.assert_array_equal(vec[group][key], stored[group][key])
+
+
+@pytest.mark.parametrize('sparse_labels', [True, False])
+def test_tf_data_matches_memory(log, sparse_labels):
+    add_cols = ['daytime', 'weekday']
+    parms = {'sparse_labels': sparse_labels}
+    vec = vectorize(log, 'inter', False, add_cols, parms)
+    dataset = vectorize(log, 'inter', False, add_cols,
+                        {**parms, 'tf_data': True})
+    assert ts.is_streamed(dataset)
+    assert len(dataset) == len(vec['prefixes']['activities'])
+    names = {'ac_input': 'activities', 'rl_input': 'roles',
+             't_input': 'times', 'inter_input': 'inter_attr',
+             'act_output': 'activities', 'role_output': 'roles',
+             'time_output': 'times'}
+    batches = list(dataset.dataset(4).as_numpy_iterator())
+    for position, group in enumerate(['prefixes', 'next_evt']):
+        for name in batches[0][position]:
+            values = np.concatenate([x[position][name]
+                                     for x in batches])
+            np.testing.assert_allclose(values, vec[group][names[name]],
+                                       rtol=1e-6)